@@ -0,0 +1,437 @@
+"""Load test of the FastAPI runtimes against a fake Bedrock and stub MCP servers.
+
+Starts generic-agent-core-runtime (/invocations) and/or mcp-api (/streaming)
+with a fake Bedrock ConverseStream endpoint and stub stdio MCP servers, drives
+concurrent streams and reports TTFB, time to first token, tokens/sec, memory per
+stream and cold-start time. Results saved with --output can be passed to a later
+run with --baseline to check a change for regressions.
+
+    python bench.py --target runtime --concurrency 16 --requests 200 --output before.json
+    python bench.py --target runtime --concurrency 16 --requests 200 --baseline before.json
+"""
+
+import argparse
+import http.client
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Dict, Optional, Any
+from fake_bedrock import FakeBedrockConfig, parse_region_ttft, start_fake_bedrock
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+CDK_DIR = os.path.dirname(BENCHMARKS_DIR)
+STUB_MCP_SERVER = os.path.join(BENCHMARKS_DIR, "stub_mcp_server.py")
+
+DEFAULT_MODEL_ID = "us.anthropic.claude-sonnet-4-20250514-v1:0"
+REGION = "us-east-1"
+
+
+def runtime_request(prompt: str, model_id: str) -> Dict[str, Any]:
+    return {
+        "messages": [],
+        "system_prompt": "You are a benchmark.",
+        "prompt": [{"text": prompt}],
+        "model": {"modelId": model_id, "region": REGION},
+    }
+
+
+def runtime_tokens(line: bytes) -> int:
+    """Count the tokens in an NDJSON line of /invocations"""
+    delta = json.loads(line).get("event", {}).get("contentBlockDelta", {}).get("delta", {})
+    return len(delta.get("text", "").split())
+
+
+def mcp_api_request(prompt: str, model_id: str) -> Dict[str, Any]:
+    return {
+        "systemPrompt": "You are a benchmark.",
+        "userPrompt": prompt,
+        "messages": [],
+        "model": {"modelId": model_id, "region": REGION},
+    }
+
+
+def mcp_api_tokens(line: bytes) -> int:
+    """Count the tokens in a chunk of /streaming"""
+    return len((json.loads(line).get("text") or "").split())
+
+
+class Target:
+    """A FastAPI app under test"""
+
+    def __init__(
+        self,
+        name: str,
+        app_dir: str,
+        health_path: str,
+        stream_path: str,
+        build_request: Callable[[str, str], Dict[str, Any]],
+        count_tokens: Callable[[bytes], int],
+    ):
+        self.name = name
+        self.app_dir = app_dir
+        self.health_path = health_path
+        self.stream_path = stream_path
+        self.build_request = build_request
+        self.count_tokens = count_tokens
+
+
+TARGETS = {
+    "runtime": Target(
+        "runtime",
+        os.path.join(CDK_DIR, "lambda-python", "generic-agent-core-runtime"),
+        "/ping",
+        "/invocations",
+        runtime_request,
+        runtime_tokens,
+    ),
+    "mcp-api": Target(
+        "mcp-api",
+        os.path.join(CDK_DIR, "mcp-api"),
+        "/",
+        "/streaming",
+        mcp_api_request,
+        mcp_api_tokens,
+    ),
+}
+
+
+class RequestResult:
+    """Timings of one stream, in seconds since the request was sent"""
+
+    def __init__(self):
+        self.ttfb: Optional[float] = None
+        self.ttft: Optional[float] = None
+        self.duration = 0.0
+        self.tokens = 0
+        self.error: Optional[str] = None
+
+    @property
+    def tokens_per_second(self) -> Optional[float]:
+        if self.ttft is None or self.duration <= self.ttft:
+            return None
+        return self.tokens / (self.duration - self.ttft)
+
+
+def run_request(port: int, target: Target, body: bytes, timeout: float) -> RequestResult:
+    """Send a request and read its stream to the end"""
+    result = RequestResult()
+    started_at = time.perf_counter()
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=timeout)
+    try:
+        conn.request("POST", target.stream_path, body, {"Content-Type": "application/json"})
+        response = conn.getresponse()
+        if response.status != 200:
+            result.error = f"HTTP {response.status}: {response.read()[:200]!r}"
+            return result
+
+        pending = b""
+        while True:
+            data = response.read1(65536)
+            if not data:
+                break
+            now = time.perf_counter() - started_at
+            if result.ttfb is None:
+                result.ttfb = now
+            *lines, pending = (pending + data).split(b"\n")
+            for line in lines:
+                if not line.strip():
+                    continue
+                tokens = target.count_tokens(line)
+                if tokens and result.ttft is None:
+                    result.ttft = now
+                result.tokens += tokens
+    except Exception as e:
+        result.error = repr(e)
+    finally:
+        result.duration = time.perf_counter() - started_at
+        conn.close()
+    return result
+
+
+def get_free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def read_rss_bytes(pid: int) -> Optional[int]:
+    """Get the resident memory of a process (Linux only)"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+class RssSampler:
+    """Samples the peak resident memory of a process on a background thread"""
+
+    def __init__(self, pid: int, interval: float = 0.05):
+        self.pid = pid
+        self.interval = interval
+        self.peak: Optional[int] = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            rss = read_rss_bytes(self.pid)
+            if rss is not None:
+                self.peak = max(self.peak or 0, rss)
+            self._stop.wait(self.interval)
+
+    def __enter__(self) -> "RssSampler":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc: Any):
+        self._stop.set()
+        self._thread.join()
+
+
+def percentile(values: List[float], p: float) -> Optional[float]:
+    """Nearest-rank percentile"""
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, int(round(p / 100 * len(values))) - 1))]
+
+
+def write_mcp_json(directory: str, python: str, servers: int, startup_ms: float, latency_ms: float):
+    mcp_servers = {
+        f"stub{i}": {
+            "command": python,
+            "args": [STUB_MCP_SERVER, f"stub{i}", "--startup-ms", str(startup_ms), "--latency-ms", str(latency_ms)],
+        }
+        for i in range(servers)
+    }
+    with open(os.path.join(directory, "mcp.json"), "w") as f:
+        json.dump({"mcpServers": mcp_servers}, f, indent=2)
+
+
+def start_app(target: Target, python: str, port: int, cwd: str, env: Dict[str, str]) -> subprocess.Popen:
+    """Start the app with uvicorn, reading mcp.json from cwd"""
+    log = open(os.path.join(cwd, f"{target.name}.log"), "wb")
+    return subprocess.Popen(
+        [
+            python, "-m", "uvicorn", "app:app",
+            "--app-dir", target.app_dir,
+            "--host", "127.0.0.1",
+            "--port", str(port),
+            "--log-level", "warning",
+            "--no-access-log",
+        ],
+        cwd=cwd,
+        env=env,
+        stdout=log,
+        stderr=subprocess.STDOUT,
+    )
+
+
+def wait_until_healthy(process: subprocess.Popen, port: int, path: str, timeout: float) -> float:
+    """Wait for the health check to answer 200, and return the seconds it took"""
+    started_at = time.perf_counter()
+    while time.perf_counter() - started_at < timeout:
+        if process.poll() is not None:
+            raise RuntimeError(f"The app exited with code {process.returncode}")
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            conn.request("GET", path)
+            if conn.getresponse().status == 200:
+                return time.perf_counter() - started_at
+        except OSError:
+            pass
+        time.sleep(0.05)
+    raise TimeoutError(f"The app was not healthy within {timeout}s")
+
+
+def benchmark(target: Target, args: argparse.Namespace, bedrock_url: str, bedrock: FakeBedrockConfig) -> Dict[str, Any]:
+    python = args.python.get(target.name, sys.executable)
+    calls_before, throttled_before = bedrock.calls.copy(), bedrock.throttled.copy()
+    with tempfile.TemporaryDirectory(prefix=f"bench-{target.name}-") as cwd:
+        write_mcp_json(cwd, python, args.mcp_servers, args.mcp_startup_ms, args.mcp_latency_ms)
+        env = {
+            **os.environ,
+            "AWS_ENDPOINT_URL_BEDROCK_RUNTIME": bedrock_url,
+            "AWS_REGION": REGION,
+            "AWS_DEFAULT_REGION": REGION,
+            "AWS_ACCESS_KEY_ID": "benchmark",
+            "AWS_SECRET_ACCESS_KEY": "benchmark",
+            "AWS_SESSION_TOKEN": "benchmark",
+            "AWS_EC2_METADATA_DISABLED": "true",
+            **dict(item.split("=", 1) for item in args.env),
+        }
+        port = get_free_port()
+        process = start_app(target, python, port, cwd, env)
+        try:
+            startup_seconds = wait_until_healthy(process, port, target.health_path, args.timeout)
+            body = json.dumps(target.build_request(args.prompt, args.model_id)).encode()
+
+            # The first request pays for lazy loading of MCP servers and clients
+            cold = run_request(port, target, body, args.timeout)
+            if cold.error:
+                raise RuntimeError(f"Cold request failed: {cold.error}")
+            idle_rss = read_rss_bytes(process.pid)
+
+            started_at = time.perf_counter()
+            with RssSampler(process.pid) as sampler, ThreadPoolExecutor(args.concurrency) as executor:
+                results = list(executor.map(lambda _: run_request(port, target, body, args.timeout), range(args.requests)))
+            wall_seconds = time.perf_counter() - started_at
+        except Exception:
+            process.terminate()
+            process.wait(10)
+            with open(os.path.join(cwd, f"{target.name}.log"), "rb") as f:
+                sys.stderr.write(f.read()[-4000:].decode(errors="replace"))
+            raise
+        process.terminate()
+        process.wait(10)
+
+    ok = [r for r in results if r.error is None]
+    errors = [r.error for r in results if r.error is not None]
+    for error in sorted(set(errors))[:5]:
+        print(f"{target.name}: {error}", file=sys.stderr)
+
+    def rounded(value: Optional[float], digits: int = 4) -> Optional[float]:
+        return round(value, digits) if value is not None else None
+
+    ttfb = [r.ttfb for r in ok if r.ttfb is not None]
+    ttft = [r.ttft for r in ok if r.ttft is not None]
+    tokens_per_second = [r.tokens_per_second for r in ok if r.tokens_per_second is not None]
+    memory_per_stream = (
+        (sampler.peak - idle_rss) / min(args.concurrency, args.requests) / 1024 ** 2
+        if sampler.peak is not None and idle_rss is not None
+        else None
+    )
+    return {
+        "target": target.name,
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "errors": len(errors),
+        "startup_seconds": rounded(startup_seconds),
+        "cold_ttfb_seconds": rounded(cold.ttfb),
+        "cold_ttft_seconds": rounded(cold.ttft),
+        "ttfb_p50_seconds": rounded(percentile(ttfb, 50)),
+        "ttfb_p99_seconds": rounded(percentile(ttfb, 99)),
+        "ttft_p50_seconds": rounded(percentile(ttft, 50)),
+        "ttft_p99_seconds": rounded(percentile(ttft, 99)),
+        "duration_p50_seconds": rounded(percentile([r.duration for r in ok], 50)),
+        "duration_p99_seconds": rounded(percentile([r.duration for r in ok], 99)),
+        "stream_tokens_per_second_p50": rounded(percentile(tokens_per_second, 50), 1),
+        "throughput_tokens_per_second": rounded(sum(r.tokens for r in ok) / wall_seconds, 1),
+        "requests_per_second": rounded(len(ok) / wall_seconds, 2),
+        "idle_rss_mb": rounded(idle_rss / 1024 ** 2 if idle_rss else None, 1),
+        "peak_rss_mb": rounded(sampler.peak / 1024 ** 2 if sampler.peak else None, 1),
+        "memory_per_stream_mb": rounded(memory_per_stream, 2),
+        # Fake Bedrock calls per region, including retries and hedged calls
+        "bedrock_calls": dict(bedrock.calls - calls_before),
+        "bedrock_throttled": dict(bedrock.throttled - throttled_before),
+    }
+
+
+# Metrics compared with a baseline, and whether higher values are better
+COMPARED_METRICS = {
+    "startup_seconds": False,
+    "cold_ttfb_seconds": False,
+    "ttfb_p50_seconds": False,
+    "ttfb_p99_seconds": False,
+    "ttft_p50_seconds": False,
+    "ttft_p99_seconds": False,
+    "duration_p99_seconds": False,
+    "stream_tokens_per_second_p50": True,
+    "throughput_tokens_per_second": True,
+    "memory_per_stream_mb": False,
+}
+
+
+def find_regressions(result: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Compare a result with the baseline of the same target"""
+    regressions = []
+    for metric, higher_is_better in COMPARED_METRICS.items():
+        value, base = result.get(metric), baseline.get(metric)
+        if value is None or not base:
+            continue
+        change = (value - base) / base
+        if (change < -tolerance) if higher_is_better else (change > tolerance):
+            regressions.append(f"{result['target']}: {metric} {base} -> {value} ({change:+.1%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--target", choices=["runtime", "mcp-api", "both"], default="both")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--prompt", default="Run the benchmark.")
+    parser.add_argument("--model-id", default=DEFAULT_MODEL_ID)
+    parser.add_argument("--timeout", type=float, default=120, help="Seconds to wait for startup or a stream")
+    parser.add_argument("--ttft-ms", type=float, default=200, help="Fake Bedrock time to first token")
+    parser.add_argument("--tokens", type=int, default=100, help="Fake Bedrock output tokens per answer")
+    parser.add_argument("--token-interval-ms", type=float, default=10, help="Fake Bedrock delay between tokens")
+    parser.add_argument("--tool-use", action="store_true", help="Call a stub MCP tool in every request")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Fraction of fake Bedrock calls throttled")
+    parser.add_argument("--throttled-region", action="append", default=[], help="Region whose calls are all throttled")
+    parser.add_argument(
+        "--region-ttft-ms", action="append", default=[], metavar="REGION=MS",
+        help="Fake Bedrock time to first token of a region",
+    )
+    parser.add_argument("--mcp-servers", type=int, default=2, help="Number of stub MCP servers")
+    parser.add_argument("--mcp-startup-ms", type=float, default=500, help="Startup delay of each stub MCP server")
+    parser.add_argument("--mcp-latency-ms", type=float, default=50, help="Delay of each stub MCP tool call")
+    parser.add_argument(
+        "--python", action="append", default=[], metavar="TARGET=PATH",
+        help="Python of a target's environment (e.g. runtime=../lambda-python/generic-agent-core-runtime/.venv/bin/python)",
+    )
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="Environment variable of the apps")
+    parser.add_argument("--output", help="Write the results to a JSON file")
+    parser.add_argument("--baseline", help="Compare with the results of an earlier run")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Relative change reported as a regression")
+    args = parser.parse_args()
+    args.python = dict(item.split("=", 1) for item in args.python)
+
+    bedrock_config = FakeBedrockConfig(
+        args.ttft_ms,
+        args.tokens,
+        args.token_interval_ms,
+        args.tool_use,
+        args.throttle_rate,
+        args.throttled_region,
+        parse_region_ttft(args.region_ttft_ms),
+    )
+    bedrock = start_fake_bedrock(bedrock_config)
+    bedrock_url = f"http://127.0.0.1:{bedrock.server_port}"
+
+    targets = ["runtime", "mcp-api"] if args.target == "both" else [args.target]
+    results = [benchmark(TARGETS[name], args, bedrock_url, bedrock_config) for name in targets]
+    bedrock.shutdown()
+
+    for result in results:
+        print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baselines = {b["target"]: b for b in json.load(f)}
+        regressions = [
+            regression
+            for result in results
+            if result["target"] in baselines
+            for regression in find_regressions(result, baselines[result["target"]], args.tolerance)
+        ]
+        for regression in regressions:
+            print(f"Regression: {regression}", file=sys.stderr)
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
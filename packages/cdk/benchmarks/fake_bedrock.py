@@ -0,0 +1,224 @@
+"""Local stand-in for the Bedrock Runtime ConverseStream API.
+
+Answers POST /model/{modelId}/converse-stream with an AWS event stream, after a
+configurable time to first token and with a configurable delay between tokens.
+Point boto3 at it with AWS_ENDPOINT_URL_BEDROCK_RUNTIME=http://127.0.0.1:<port>.
+
+When tool use is enabled, the first model call of a turn asks for one of the
+stub MCP tools (named *_echo), and the call after its result answers in text.
+
+Calls can be throttled, at random or for whole regions, and regions can have
+their own time to first token. The region of a call is read from the
+credential scope of its signature, so failover across regions can be tested
+with a single endpoint.
+"""
+
+import argparse
+import json
+import logging
+import random
+import re
+import struct
+import threading
+import time
+import zlib
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Dict, Optional, Any
+
+logger = logging.getLogger(__name__)
+
+_CONVERSE_STREAM_PATH = re.compile(r"^/model/(?P<model_id>[^/]+)/converse-stream$")
+
+# Credential=<key>/<date>/<region>/<service>/aws4_request
+_CREDENTIAL_REGION = re.compile(r"Credential=[^/]+/[^/]+/(?P<region>[^/]+)/")
+
+
+def encode_event(event_type: str, payload: Dict[str, Any]) -> bytes:
+    """Encode an event as an AWS event stream message"""
+    headers = b""
+    for name, value in ((":event-type", event_type), (":content-type", "application/json"), (":message-type", "event")):
+        name_bytes, value_bytes = name.encode(), value.encode()
+        # Header value type 7 is a string
+        headers += struct.pack(">B", len(name_bytes)) + name_bytes + struct.pack(">BH", 7, len(value_bytes)) + value_bytes
+
+    body = json.dumps(payload).encode()
+    total_length = 12 + len(headers) + len(body) + 4
+    prelude = struct.pack(">II", total_length, len(headers))
+    message = prelude + struct.pack(">I", zlib.crc32(prelude)) + headers + body
+    return message + struct.pack(">I", zlib.crc32(message))
+
+
+class FakeBedrockConfig:
+    """Latency, size and throttling of the fake model responses"""
+
+    def __init__(
+        self,
+        ttft_ms: float = 200,
+        tokens: int = 100,
+        token_interval_ms: float = 10,
+        tool_use: bool = False,
+        throttle_rate: float = 0.0,
+        throttled_regions: Optional[List[str]] = None,
+        region_ttft_ms: Optional[Dict[str, float]] = None,
+    ):
+        self.ttft_ms = ttft_ms
+        self.tokens = tokens
+        self.token_interval_ms = token_interval_ms
+        self.tool_use = tool_use
+        self.throttle_rate = throttle_rate
+        self.throttled_regions = set(throttled_regions or [])
+        self.region_ttft_ms = dict(region_ttft_ms or {})
+        # Calls received and throttled per region
+        self.calls: Counter = Counter()
+        self.throttled: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def is_throttled(self, region: str) -> bool:
+        """Count a call of a region, and whether it is throttled"""
+        throttled = region in self.throttled_regions or random.random() < self.throttle_rate
+        with self._lock:
+            self.calls[region] += 1
+            if throttled:
+                self.throttled[region] += 1
+        return throttled
+
+
+def _find_tool(request: Dict[str, Any]) -> Optional[str]:
+    """Get the name of a stub MCP tool offered in the request, if any"""
+    for tool in request.get("toolConfig", {}).get("tools", []):
+        name = tool.get("toolSpec", {}).get("name", "")
+        if name.endswith("_echo"):
+            return name
+    return None
+
+
+def _is_tool_result_turn(request: Dict[str, Any]) -> bool:
+    messages = request.get("messages", [])
+    return bool(messages) and any("toolResult" in block for block in messages[-1].get("content", []))
+
+
+def response_events(request: Dict[str, Any], config: FakeBedrockConfig, region: str = "") -> List[Any]:
+    """Get the events of a response, with the delay in seconds before each one"""
+    interval = config.token_interval_ms / 1000
+    ttft_ms = config.region_ttft_ms.get(region, config.ttft_ms)
+    input_tokens = len(json.dumps(request.get("messages", []))) // 4
+    events: List[Any] = [(ttft_ms / 1000, "messageStart", {"role": "assistant"})]
+
+    tool_name = _find_tool(request) if config.tool_use else None
+    if tool_name is not None and not _is_tool_result_turn(request):
+        events += [
+            (0, "contentBlockStart", {"contentBlockIndex": 0, "start": {"toolUse": {"toolUseId": f"tooluse_{time.monotonic_ns()}", "name": tool_name}}}),
+            (interval, "contentBlockDelta", {"contentBlockIndex": 0, "delta": {"toolUse": {"input": json.dumps({"text": "benchmark"})}}}),
+            (0, "contentBlockStop", {"contentBlockIndex": 0}),
+            (0, "messageStop", {"stopReason": "tool_use"}),
+        ]
+        output_tokens = 10
+    else:
+        events += [
+            (0 if i == 0 else interval, "contentBlockDelta", {"contentBlockIndex": 0, "delta": {"text": f"w{i} "}})
+            for i in range(config.tokens)
+        ]
+        events += [
+            (0, "contentBlockStop", {"contentBlockIndex": 0}),
+            (0, "messageStop", {"stopReason": "end_turn"}),
+        ]
+        output_tokens = config.tokens
+
+    events.append((0, "metadata", {
+        "usage": {"inputTokens": input_tokens, "outputTokens": output_tokens, "totalTokens": input_tokens + output_tokens},
+        "metrics": {"latencyMs": int(ttft_ms + output_tokens * config.token_interval_ms)},
+    }))
+    return events
+
+
+class FakeBedrockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config = FakeBedrockConfig()
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length)
+        if not _CONVERSE_STREAM_PATH.match(self.path):
+            self._send_json(404, {"message": f"{self.path} is not supported by the fake Bedrock"})
+            return
+
+        match = _CREDENTIAL_REGION.search(self.headers.get("Authorization", ""))
+        region = match.group("region") if match else ""
+        if self.config.is_throttled(region):
+            self._send_json(429, {"message": "Too many requests, please wait before trying again."}, "ThrottlingException")
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/vnd.amazon.eventstream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            for delay, event_type, payload in response_events(json.loads(body or b"{}"), self.config, region):
+                if delay:
+                    time.sleep(delay)
+                message = encode_event(event_type, payload)
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(message), message))
+                self.wfile.flush()
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # The runtime closed the stream (the client of the runtime disconnected)
+            self.close_connection = True
+
+    def _send_json(self, status: int, payload: Dict[str, Any], error_type: Optional[str] = None):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        if error_type:
+            self.send_header("x-amzn-ErrorType", error_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format: str, *args: Any):
+        logger.debug(format, *args)
+
+
+def parse_region_ttft(items: List[str]) -> Dict[str, float]:
+    """Parse REGION=MS options"""
+    return {region: float(ms) for region, ms in (item.split("=", 1) for item in items)}
+
+
+def start_fake_bedrock(config: FakeBedrockConfig, port: int = 0) -> ThreadingHTTPServer:
+    """Start the fake Bedrock on a background thread, and return the server (its port is server_port)"""
+    handler = type("ConfiguredFakeBedrockHandler", (FakeBedrockHandler,), {"config": config})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-bedrock", daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--ttft-ms", type=float, default=200, help="Time to the first token")
+    parser.add_argument("--tokens", type=int, default=100, help="Output tokens of a text answer")
+    parser.add_argument("--token-interval-ms", type=float, default=10, help="Delay between tokens")
+    parser.add_argument("--tool-use", action="store_true", help="Call a stub MCP tool before answering")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Fraction of calls throttled at random")
+    parser.add_argument("--throttled-region", action="append", default=[], help="Region whose calls are all throttled")
+    parser.add_argument(
+        "--region-ttft-ms", action="append", default=[], metavar="REGION=MS", help="Time to the first token of a region"
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    server = start_fake_bedrock(
+        FakeBedrockConfig(
+            args.ttft_ms,
+            args.tokens,
+            args.token_interval_ms,
+            args.tool_use,
+            args.throttle_rate,
+            args.throttled_region,
+            parse_region_ttft(args.region_ttft_ms),
+        ),
+        args.port,
+    )
+    logger.info(f"Fake Bedrock listening on http://127.0.0.1:{server.server_port}")
+    threading.Event().wait()
@@ -0,0 +1,36 @@
+"""Stub stdio MCP server for benchmarks.
+
+Serves one tool, <name>_echo, which answers with its input after a delay. The
+server can also be slowed down at startup, like a server installed by uvx or npx.
+
+    python stub_mcp_server.py <name> [--startup-ms 500] [--latency-ms 50]
+"""
+
+import argparse
+import asyncio
+import time
+from mcp.server.fastmcp import FastMCP
+
+parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+parser.add_argument("name")
+parser.add_argument("--startup-ms", type=float, default=0, help="Delay before the server starts")
+parser.add_argument("--latency-ms", type=float, default=50, help="Delay of each tool call")
+args = parser.parse_args()
+
+time.sleep(args.startup_ms / 1000)
+mcp = FastMCP(args.name)
+
+
+@mcp.tool(name=f"{args.name}_echo")
+async def echo(text: str) -> str:
+    """Echo the text back
+
+    Args:
+        text: The text to echo
+    """
+    await asyncio.sleep(args.latency_ms / 1000)
+    return text
+
+
+if __name__ == "__main__":
+    mcp.run()
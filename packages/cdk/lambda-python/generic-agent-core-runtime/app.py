@@ -1,12 +1,24 @@
 """Main FastAPI application for Generic AgentCore Runtime."""
 
-import json
+import asyncio
 import logging
+import time
 import traceback
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
-from fastapi.responses import StreamingResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.background import BackgroundTask
+from src.admission import AdmissionRejectedError, admission_controller
 from src.agent import AgentManager
-from src.utils import create_ws_directory, clean_ws_directory, create_error_response
+from src.context import RequestContext, set_request_context
+from src.parser import RequestTooLargeError, parse_request_body, parse_stats
+from src.session_store import HistoryVersionMismatchError
+from src.config import MCP_EAGER_WARMUP
+from src.metrics import metrics
+from src.storage import s3_uploader
+from src.streaming import stream_stats, stream_with_backpressure
+from src.utils import create_error_response, decoded_media_cache
+from src.workspace import WorkspaceQuotaExceededError, workspace_reaper
 from src.types import AgentCoreRequest
 
 # Configure root logger
@@ -16,29 +28,126 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Used to report startup phase timings
+PROCESS_STARTED_AT = time.perf_counter()
+startup_timings = {}
+
+# Initialize agent manager
+agent_manager = AgentManager()
+
+
+async def warm_up():
+    """Load MCP tools in the background and record when the runtime became ready"""
+    try:
+        await asyncio.to_thread(agent_manager.warm_up)
+    except Exception as e:
+        logger.error(f"Error warming up MCP tools: {e}")
+    startup_timings["ready"] = round(time.perf_counter() - PROCESS_STARTED_AT, 3)
+    logger.info(f"Warm-up finished: {get_startup_timings()}")
+
+
+def get_startup_timings() -> dict:
+    """Get startup phase timings in seconds since process start"""
+    return {**startup_timings, **agent_manager.get_startup_timings()}
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    startup_timings["app_started"] = round(time.perf_counter() - PROCESS_STARTED_AT, 3)
+    # Sync tools run on the bounded thread pool, apart from the threads of Bedrock streams
+    agent_manager.tool_manager.executor.install(asyncio.get_running_loop())
+    workspace_reaper.start()
+    warm_up_task = asyncio.create_task(warm_up()) if MCP_EAGER_WARMUP else None
+    yield
+    if warm_up_task is not None:
+        warm_up_task.cancel()
+    await asyncio.to_thread(workspace_reaper.stop)
+    agent_manager.shutdown()
+
 
 # Initialize FastAPI app
 app = FastAPI(
     title="Generic AgentCore Runtime",
     description="AWS Bedrock AgentCore Runtime with Strands Agent and MCP support",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
-# Initialize agent manager
-agent_manager = AgentManager()
-
 
 @app.get("/ping")
 async def ping():
-    """Health check endpoint required by AgentCore"""
-    return {"status": "healthy", "service": "generic-agent-core-runtime"}
+    """Health check endpoint required by AgentCore
+
+    When MCP_EAGER_WARMUP is enabled, responds with 503 until MCP tools are loaded
+    so that traffic is only routed to a warm runtime.
+    """
+    if MCP_EAGER_WARMUP and not agent_manager.is_ready():
+        return JSONResponse(
+            status_code=503,
+            content={
+                "status": "unavailable",
+                "state": "warming",
+                "service": "generic-agent-core-runtime",
+                "startup_timings": get_startup_timings(),
+            },
+        )
+
+    return {
+        "status": "healthy",
+        "state": "ready" if agent_manager.is_ready() else "lazy",
+        "service": "generic-agent-core-runtime",
+        "startup_timings": get_startup_timings(),
+        "workspaces": workspace_reaper.stats(),
+        "executor": agent_manager.tool_manager.executor.stats(),
+        "prompt_cache": agent_manager.prompt_cache_stats.stats(),
+        "history": agent_manager.history_manager.stats(),
+        "tool_result_cache": agent_manager.tool_manager.tool_result_cache.stats(),
+        "streams": stream_stats.stats(),
+        "admission": admission_controller.stats(),
+        "session_store": agent_manager.session_store.stats(),
+    }
+
+
+def get_runtime_stats() -> dict:
+    """Get the counters of every component shared across requests"""
+    tool_manager = agent_manager.tool_manager
+    return {
+        "request_parse": parse_stats.stats(),
+        "decoded_media_cache": decoded_media_cache.stats(),
+        "model_pool": agent_manager.model_pool.stats(),
+        "model_routing": agent_manager.model_router.stats(),
+        "mcp_pool": tool_manager.mcp_pool.stats() if tool_manager.mcp_pool else {},
+        "mcp_schema_cache": tool_manager.schema_cache.stats() if tool_manager.schema_cache else {},
+        "code_interpreters": tool_manager.code_interpreters.stats(),
+        "s3_uploads": s3_uploader.stats(),
+        "workspaces": workspace_reaper.stats(),
+        "executor": tool_manager.executor.stats(),
+        "prompt_cache": agent_manager.prompt_cache_stats.stats(),
+        "history": agent_manager.history_manager.stats(),
+        "tool_result_cache": tool_manager.tool_result_cache.stats(),
+        "tool_selection": agent_manager.tool_selector.stats(),
+        "streams": stream_stats.stats(),
+        "admission": admission_controller.stats(),
+        "session_store": agent_manager.session_store.stats(),
+    }
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """Latency and payload histograms, and runtime counters, in Prometheus text format"""
+    return PlainTextResponse(
+        metrics.render(get_runtime_stats()),
+        media_type="text/plain; version=0.0.4",
+    )
 
 
 @app.post("/invocations")
 async def invocations(request: Request):
     """Main invocation endpoint required by AgentCore
 
-    Expects request with messages, system_prompt, prompt, and model
+    Expects request with messages, system_prompt, prompt, and model. A request
+    with the historyVersion of the previous response of its session sends only
+    the new turn, and is rejected with 409 when that history is not stored.
     """
     # Get session info from headers
     headers = dict(request.headers)
@@ -46,17 +155,41 @@ async def invocations(request: Request):
     trace_id = headers.get("x-amzn-trace-id")
     logger.info(f"New invocation: {session_id} {trace_id}")
 
-    # Set session info in agent manager
-    agent_manager.set_session_info(session_id, trace_id)
+    # Session info and workspace are scoped to this request, so concurrent
+    # invocations on the same worker do not interfere with each other
+    context = RequestContext(session_id, trace_id)
 
-    # Ensure workspace directory exists
-    create_ws_directory()
+    # Wait for a running agent slot, or fail fast when the runtime is overloaded
+    try:
+        ticket = await admission_controller.acquire(session_id)
+    except AdmissionRejectedError as e:
+        logger.warning(f"Rejected request: {e}")
+        return JSONResponse(
+            status_code=429,
+            content=create_error_response(str(e)),
+            headers={"Retry-After": str(e.retry_after)},
+        )
+
+    # Ensure workspace directory exists without blocking the event loop
+    try:
+        workspace = await workspace_reaper.acquire(context.workspace_dir)
+    except WorkspaceQuotaExceededError as e:
+        logger.warning(f"Rejected request: {e}")
+        ticket.release()
+        return JSONResponse(status_code=507, content=create_error_response(str(e)))
+    except Exception:
+        ticket.release()
+        raise
+
+    # Async, so the background task runs it on the event loop the admission controller belongs to
+    async def release():
+        workspace.release()
+        ticket.release()
 
     try:
         # Read and parse request body
-        body = await request.body()
-        body_str = body.decode()
-        request_data = json.loads(body_str)
+        with metrics.phase("request_parse"):
+            request_data = await parse_request_body(request)
 
         # Handle input field if present (AWS Lambda integration format)
         if "input" in request_data and isinstance(request_data["input"], dict):
@@ -67,27 +200,50 @@ async def invocations(request: Request):
         system_prompt = request_data.get("system_prompt")
         prompt = request_data.get("prompt", [])
         model_info = request_data.get("model", {})
+        history_version = request_data.get("historyVersion")
 
-        # Return streaming response
+        # Continue the stored history of the session, without the client resending it
+        if history_version is not None:
+            messages = await asyncio.to_thread(
+                agent_manager.session_store.resolve, session_id, history_version, messages
+            )
+
+        # Return streaming response. The agent stops when the client disconnects.
         async def generate():
+            set_request_context(context)
             try:
-                async for chunk in agent_manager.process_request_streaming(
+                frames = agent_manager.process_request_streaming(
                     messages=messages,
                     system_prompt=system_prompt,
                     prompt=prompt,
                     model_info=model_info
-                ):
+                )
+                async for chunk in stream_with_backpressure(frames, request.is_disconnected, context):
                     yield chunk
             finally:
-                clean_ws_directory()
-
-        return StreamingResponse(generate(), media_type="text/event-stream")
+                await release()
+
+        # The workspace is deleted by the reaper and the agent slot freed once the
+        # stream has finished. The background task also releases them when the
+        # stream never started.
+        return StreamingResponse(
+            generate(),
+            media_type="text/event-stream",
+            background=BackgroundTask(release),
+        )
+    except RequestTooLargeError as e:
+        logger.warning(f"Rejected request: {e}")
+        await release()
+        return JSONResponse(status_code=413, content=create_error_response(str(e)))
+    except HistoryVersionMismatchError as e:
+        logger.info(f"Rejected request: {e}")
+        await release()
+        return JSONResponse(status_code=409, content=create_error_response(str(e)))
     except Exception as e:
         logger.error(f"Error processing request: {e}")
         logger.error(traceback.format_exc())
+        await release()
         return create_error_response(str(e))
-    finally:
-        clean_ws_directory()
 
 
 if __name__ == "__main__":
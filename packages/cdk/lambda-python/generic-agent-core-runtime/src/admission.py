@@ -0,0 +1,199 @@
+"""Admission control of invocations for the agent core runtime."""
+
+import asyncio
+import math
+import time
+from collections import deque
+from typing import Deque, Dict, Optional, Any
+from .config import ADMISSION_MAX_CONCURRENT, ADMISSION_QUEUE_SIZE, ADMISSION_QUEUE_TIMEOUT
+from .metrics import metrics
+from .utils import create_id
+
+
+class AdmissionRejectedError(Exception):
+    """Raised when an invocation is not admitted because the runtime is overloaded"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AdmissionTicket:
+    """A running agent slot held by an invocation, released once its stream has finished"""
+
+    def __init__(self, controller: "AdmissionController", session_key: str):
+        self.controller = controller
+        self.session_key = session_key
+        self.admitted_at = time.perf_counter()
+        self._released = False
+
+    def release(self):
+        """Hand the slot to the next waiting invocation (only the first call has an effect)"""
+        if not self._released:
+            self._released = True
+            self.controller.release(self.session_key, time.perf_counter() - self.admitted_at)
+
+
+class _Waiter:
+    def __init__(self, session_key: str, future: asyncio.Future):
+        self.session_key = session_key
+        self.future = future
+        self.queued_at = time.perf_counter()
+
+
+class AdmissionController:
+    """Limits the number of agents running at once
+
+    Invocations over max_concurrent wait in a queue of at most queue_size. When a
+    slot frees up, it goes to the waiting session with the fewest running agents
+    (the longest waiting among equals), so a session sending a burst of requests
+    does not starve the others. Rejections are fast: right away when the queue is
+    full, or once the wait reaches timeout, with a Retry-After estimated from how
+    long agents run. Used from the event loop only.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int = ADMISSION_MAX_CONCURRENT,
+        queue_size: int = ADMISSION_QUEUE_SIZE,
+        timeout: float = ADMISSION_QUEUE_TIMEOUT,
+    ):
+        self.max_concurrent = max_concurrent
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self._running: Dict[str, int] = {}
+        self._running_total = 0
+        self._waiting: Dict[str, Deque[_Waiter]] = {}
+        self._waiting_total = 0
+        self.admitted = 0
+        self.queued = 0
+        self.rejected_queue_full = 0
+        self.rejected_timeout = 0
+        self.queue_seconds = 0.0
+        self.max_queue_seconds = 0.0
+        self.completed = 0
+        self.run_seconds = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_concurrent > 0
+
+    async def acquire(self, session_id: Optional[str]) -> AdmissionTicket:
+        """Wait for a running agent slot
+
+        Raises AdmissionRejectedError when the queue is full or the wait times out.
+        """
+        # Invocations without a session are each scheduled as their own session
+        session_key = session_id or f"anonymous-{create_id()}"
+        if not self.enabled or (self._running_total < self.max_concurrent and not self._waiting_total):
+            self._start(session_key)
+            self._record_admitted(0.0)
+            return AdmissionTicket(self, session_key)
+
+        if self._waiting_total >= self.queue_size:
+            self.rejected_queue_full += 1
+            metrics.observe_seconds("admission_queue", 0.0, outcome="queue_full")
+            raise AdmissionRejectedError(
+                f"The runtime is overloaded: {self._running_total} agents are running "
+                f"and {self._waiting_total} invocations are waiting",
+                self._retry_after(),
+            )
+
+        waiter = _Waiter(session_key, asyncio.get_running_loop().create_future())
+        self._waiting.setdefault(session_key, deque()).append(waiter)
+        self._waiting_total += 1
+        self.queued += 1
+        try:
+            await asyncio.wait((waiter.future,), timeout=self.timeout)
+        except asyncio.CancelledError:
+            if waiter.future.done():
+                self.release(session_key, 0.0)
+            else:
+                self._remove(waiter)
+            raise
+
+        waited = time.perf_counter() - waiter.queued_at
+        if not waiter.future.done():
+            self._remove(waiter)
+            self.rejected_timeout += 1
+            metrics.observe_seconds("admission_queue", waited, outcome="timeout")
+            raise AdmissionRejectedError(
+                f"The runtime is overloaded: no agent slot became free within {self.timeout:g}s",
+                self._retry_after(),
+            )
+        self._record_admitted(waited)
+        return AdmissionTicket(self, session_key)
+
+    def release(self, session_key: str, run_seconds: float):
+        """Free the slot of a finished agent, and admit the next waiting invocation"""
+        count = self._running.get(session_key, 0) - 1
+        if count > 0:
+            self._running[session_key] = count
+        else:
+            self._running.pop(session_key, None)
+        self._running_total -= 1
+        self.completed += 1
+        self.run_seconds += run_seconds
+        self._dispatch()
+
+    def _start(self, session_key: str):
+        self._running[session_key] = self._running.get(session_key, 0) + 1
+        self._running_total += 1
+
+    def _dispatch(self):
+        while self._waiting_total and self._running_total < self.max_concurrent:
+            session_key = min(
+                self._waiting,
+                key=lambda key: (self._running.get(key, 0), self._waiting[key][0].queued_at),
+            )
+            waiter = self._pop(session_key)
+            self._start(session_key)
+            waiter.future.set_result(None)
+
+    def _pop(self, session_key: str) -> _Waiter:
+        waiters = self._waiting[session_key]
+        waiter = waiters.popleft()
+        if not waiters:
+            del self._waiting[session_key]
+        self._waiting_total -= 1
+        return waiter
+
+    def _remove(self, waiter: _Waiter):
+        waiters = self._waiting.get(waiter.session_key)
+        if waiters is None or waiter not in waiters:
+            return
+        waiters.remove(waiter)
+        if not waiters:
+            del self._waiting[waiter.session_key]
+        self._waiting_total -= 1
+
+    def _record_admitted(self, waited: float):
+        self.admitted += 1
+        self.queue_seconds += waited
+        self.max_queue_seconds = max(self.max_queue_seconds, waited)
+        metrics.observe_seconds("admission_queue", waited, outcome="admitted")
+
+    def _retry_after(self) -> int:
+        """Estimate in seconds when the waiting invocations will have been admitted"""
+        if not self.completed:
+            return 1
+        average_run_seconds = self.run_seconds / self.completed
+        return max(1, math.ceil(average_run_seconds * (self._waiting_total + 1) / self.max_concurrent))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_concurrent": self.max_concurrent or None,
+            "running": self._running_total,
+            "waiting": self._waiting_total,
+            "sessions_running": len(self._running),
+            "sessions_waiting": len(self._waiting),
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected_queue_full": self.rejected_queue_full,
+            "rejected_timeout": self.rejected_timeout,
+            "queue_seconds": round(self.queue_seconds, 3),
+            "max_queue_seconds": round(self.max_queue_seconds, 3),
+        }
+
+
+admission_controller = AdmissionController()
@@ -1,13 +1,24 @@
 """Agent management for the agent core runtime."""
 
-import boto3
-import json
+import asyncio
+import copy
+import functools
 import logging
-from strands.models import BedrockModel
+import time
+from contextlib import contextmanager
 from strands import Agent as StrandsAgent
-from typing import List, Dict, Union, Any, Optional, AsyncGenerator
-from .config import get_system_prompt, extract_model_info
+from typing import Iterator, List, Dict, Tuple, Union, Any, Optional, AsyncGenerator
+from .config import get_system_prompt, extract_model_info, HISTORY_SUMMARIZE, STREAM_EARLY_METADATA
 from .tools import ToolManager
+from .clients import BedrockModelPool
+from .routing import BedrockRouter
+from .prompt_cache import PromptCacheStats, TokenUsage
+from .history import HistoryManager, summarize_with_model
+from .tool_selection import ToolSelection, ToolSelector
+from .session_store import SessionHistoryStore
+from .context import get_request_context
+from .streaming import DeltaCoalescer, ModelCallProgress, serialize_event, stream_stats
+from .metrics import metrics, set_span_attribute
 from .utils import (
     create_empty_response, 
     create_error_response,
@@ -24,54 +35,204 @@ class AgentManager:
 
     def __init__(self):
         self.tool_manager = ToolManager()
+        # Models of routed calls make a single attempt each, the router retries them
+        self.model_router = BedrockRouter()
+        self.model_pool = BedrockModelPool(client_config=self.model_router.client_config)
+        self.prompt_cache_stats = PromptCacheStats()
+        self.history_manager = HistoryManager()
+        self.tool_selector = ToolSelector()
+        self.session_store = SessionHistoryStore()
 
-    def set_session_info(self, session_id: str, trace_id: str):
-        """Set session and trace IDs"""
-        self.tool_manager.set_session_info(session_id, trace_id)
+    def warm_up(self):
+        """Load MCP tools ahead of the first request"""
+        self.tool_manager.prewarm_code_interpreter()
+        self.tool_manager.load_mcp_tools()
 
-    async def process_request_streaming(
+    def shutdown(self):
+        """Release resources held across requests"""
+        self.tool_manager.shutdown()
+
+    def is_ready(self) -> bool:
+        """Whether the agent can be built without loading MCP tools"""
+        return self.tool_manager.is_ready()
+
+    def get_startup_timings(self) -> Dict[str, Any]:
+        """Get MCP startup timings in seconds, and the versions of pinned MCP servers"""
+        return {
+            "mcp_tools_total": self.tool_manager.mcp_load_seconds,
+            "mcp_servers": dict(self.tool_manager.mcp_startup_timings),
+            "mcp_server_versions": dict(self.tool_manager.mcp_server_versions),
+        }
+
+    async def create_agent(
         self,
         messages: Union[List[Message], List[Dict[str, Any]]],
         system_prompt: Optional[str],
         prompt: Union[str, List[Dict[str, Any]]],
-        model_info: ModelInfo,
-    ) -> AsyncGenerator[str, None]:
-        """Process a request and yield streaming responses as raw events"""
-        try:
-            # Get model info
-            model_id, region = extract_model_info(model_info)
-            
-            # Combine system prompts
-            combined_system_prompt = get_system_prompt(system_prompt)
-            
-            # Get all tools
-            tools = self.tool_manager.get_all_tools()
-            
-            # Create boto3 session and Bedrock model
-            session = boto3.Session(region_name=region)
-            bedrock_model = BedrockModel(
-                model_id=model_id,
-                boto_session=session,
-                cache_prompt="default",
-                cache_tools="default",
-            )
-            
-            # Process messages and prompt using utility functions
+        model_id: str,
+        region: str,
+        setup_timings: Dict[str, float],
+    ) -> Tuple[StrandsAgent, Union[str, List[Dict[str, Any]]], Optional[ToolSelection], List[Dict[str, Any]]]:
+        """Build the agent of a request, its processed prompt, the selection of its tools and its history
+
+        The history is the processed messages before compaction, which the agent
+        is given a compacted copy of. The duration of each setup phase is
+        recorded in setup_timings.
+        """
+        @contextmanager
+        def setup_phase(name: str) -> Iterator[None]:
+            started_at = time.perf_counter()
+            with metrics.phase(name):
+                yield
+            setup_timings[name] = round(time.perf_counter() - started_at, 3)
+
+        # Combine system prompts, pointing the agent at this request's workspace
+        context = get_request_context()
+        combined_system_prompt = get_system_prompt(system_prompt, context.workspace_dir)
+        
+        # Get all tools (may wait for a background warm-up to finish)
+        with setup_phase("tool_loading"):
+            tools = await asyncio.to_thread(self.tool_manager.get_all_tools)
+        
+        # Reuse the boto3 session and Bedrock model across requests
+        with setup_phase("model_creation"):
+            bedrock_model = self.model_router.get_model(self.model_pool, model_id, region)
+        
+        # Process messages and prompt using utility functions
+        with setup_phase("media_decode"):
             processed_messages = process_messages(messages)
             processed_prompt = process_prompt(prompt)
-            
-            # Create Strands agent and stream response
+        
+        # Keep the history within the token budget (summarizing may call the model)
+        history = list(processed_messages)
+        summarize = functools.partial(summarize_with_model, bedrock_model) if HISTORY_SUMMARIZE else None
+        with setup_phase("history_compaction"):
+            processed_messages, compaction = await asyncio.to_thread(
+                self.history_manager.compact, processed_messages, summarize
+            )
+        if compaction is not None:
+            logger.info(f"Compacted conversation history: {compaction.to_dict()}")
+
+        # Give the agent only the tools relevant to the request
+        with setup_phase("tool_selection"):
+            tools, tool_selection = self.tool_selector.select(tools, prompt, processed_messages)
+        if tool_selection is not None:
+            logger.info(f"Selected tools: {tool_selection.selected} {tool_selection.to_dict()}")
+        
+        # Create Strands agent. Strands and its conversation manager change the messages of
+        # the agent in place, so it gets a copy and the history (or the stored history it
+        # was resolved from) stays as sent. Media bytes are immutable and shared by the copy.
+        with setup_phase("agent_creation"):
             agent = StrandsAgent(
                 system_prompt=combined_system_prompt,
-                messages=processed_messages,
+                messages=copy.deepcopy(processed_messages),
                 model=bedrock_model,
                 tools=tools,
             )
+        return agent, processed_prompt, tool_selection, history
 
+    async def process_request_streaming(
+        self,
+        messages: Union[List[Message], List[Dict[str, Any]]],
+        system_prompt: Optional[str],
+        prompt: Union[str, List[Dict[str, Any]]],
+        model_info: ModelInfo,
+    ) -> AsyncGenerator[bytes, None]:
+        """Process a request and yield streaming responses as NDJSON lines
+
+        With STREAM_EARLY_METADATA, a runtimeMetadata frame is sent while the
+        agent is being built, so proxies see the first byte of the response
+        before MCP tools of a cold runtime have loaded. With the session store,
+        the last frame is a runtimeMetadata frame with the version of the
+        stored history.
+        """
+        coalescer = DeltaCoalescer()
+        progress = ModelCallProgress()
+        setup_task = None
+        try:
+            # Get model info
+            model_id, region = extract_model_info(model_info)
+            
+            setup_started_at = time.perf_counter()
+            setup_timings: Dict[str, float] = {}
+            state = "warm" if self.is_ready() else "cold"
+            setup_task = asyncio.create_task(
+                self.create_agent(messages, system_prompt, prompt, model_id, region, setup_timings)
+            )
+            if STREAM_EARLY_METADATA:
+                yield serialize_event({
+                    "event": {
+                        "runtimeMetadata": {
+                            "sessionId": get_request_context().session_id,
+                            "modelId": model_id,
+                            "state": state,
+                        }
+                    }
+                })
+            agent, processed_prompt, tool_selection, history = await setup_task
+            setup_timings["total"] = round(time.perf_counter() - setup_started_at, 3)
+            logger.info(f"Built agent of {model_id} ({state}): {setup_timings}")
+            if STREAM_EARLY_METADATA:
+                runtime_metadata: Dict[str, Any] = {"setupTimings": setup_timings}
+                if tool_selection is not None:
+                    runtime_metadata["toolSelection"] = tool_selection.to_dict()
+                yield serialize_event({"event": {"runtimeMetadata": runtime_metadata}})
+
+            usage = TokenUsage()
+            stream_started_at = time.perf_counter()
+            first_token_seconds = None
+            serialization_seconds = 0.0
+            # The messages of this turn, as the agent adds them to its (compacted) history
+            turn: List[Dict[str, Any]] = [{
+                "role": "user",
+                "content": [{"text": processed_prompt}] if isinstance(processed_prompt, str) else processed_prompt,
+            }]
             async for event in agent.stream_async(processed_prompt):
-                if "event" in event:
-                    yield json.dumps(event, ensure_ascii=False) + "\n"
+                if "message" in event:
+                    turn.append(event["message"])
+                if "event" not in event:
+                    continue
+                if first_token_seconds is None and "contentBlockDelta" in event["event"]:
+                    first_token_seconds = time.perf_counter() - stream_started_at
+                    metrics.observe_seconds("time_to_first_token", first_token_seconds, model=model_id)
+                    set_span_attribute("time_to_first_token", first_token_seconds)
+                usage.add_event(event)
+                progress.add_event(event)
+                serialize_started_at = time.perf_counter()
+                if not coalescer.enabled:
+                    frame = serialize_event(event)
+                else:
+                    frame = b"".join(serialize_event(ready) for ready in coalescer.push(event))
+                serialization_seconds += time.perf_counter() - serialize_started_at
+                if frame:
+                    yield frame
+            for buffered in coalescer.flush():
+                yield serialize_event(buffered)
+            # Not a span, since spans cannot be held across yields of the stream
+            metrics.observe_seconds("agent_stream", time.perf_counter() - stream_started_at, model=model_id)
+            metrics.observe_seconds("serialization", serialization_seconds)
+
+            self.prompt_cache_stats.record(usage)
+            logger.info(f"Token usage of {model_id}: {usage.tokens}")
+            if tool_selection is not None:
+                # Every model call of the agent loop sends the tool specs
+                tokens_saved = tool_selection.tokens_saved_per_call * usage.model_calls
+                self.tool_selector.record_saved(tokens_saved)
+                set_span_attribute("tool_spec_tokens_saved", tokens_saved)
+                logger.info(f"Tool selection saved ~{tokens_saved} input tokens over {usage.model_calls} model calls")
+
+            # Only a completed turn is stored, so the version the client holds stays valid otherwise.
+            # The history is stored uncompacted, like the history the client would send, so turns
+            # dropped or summarized for this request are still there for the next one.
+            session_id = get_request_context().session_id
+            if self.session_store.enabled and session_id:
+                history_version = await asyncio.to_thread(self.session_store.save, session_id, history + turn)
+                yield serialize_event({"event": {"runtimeMetadata": {"historyVersion": history_version}}})
 
+        except asyncio.CancelledError:
+            # The client disconnected, so the rest of the answer is never generated
+            stream_stats.record_cancelled_model_call(progress.tokens)
+            raise
         except Exception as e:
             logger.error(f"Error processing agent request: {e}")
             error_event = {
@@ -81,4 +242,10 @@ class AgentManager:
                     }
                 }
             }
-            yield json.dumps(error_event, ensure_ascii=False) + "\n"
+            for buffered in coalescer.flush():
+                yield serialize_event(buffered)
+            yield serialize_event(error_event)
+        finally:
+            # The client may disconnect after the early frame, while the agent is being built
+            if setup_task is not None and not setup_task.done():
+                setup_task.cancel()
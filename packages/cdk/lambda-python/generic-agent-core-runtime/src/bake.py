@@ -0,0 +1,243 @@
+"""Pinned MCP server environments for the agent core runtime.
+
+At build time, every uvx and npx server in mcp.json is installed into its own
+environment under MCP_TOOLS_DIR, and the installed versions are written to the
+lockfile at MCP_LOCK_PATH. Versions already in the lockfile are installed as is,
+so a lockfile committed next to mcp.json makes the build reproducible.
+
+    python -m src.bake [--update]
+
+With MCP_SERVER_MODE=pinned, the runtime starts the installed executables
+directly, so a cold container starts its MCP servers without resolving or
+downloading packages.
+"""
+
+import argparse
+import json
+import logging
+import os
+import re
+import shutil
+import subprocess
+import time
+from typing import List, Dict, Tuple, Optional, Any
+from .config import get_uv_environment, MCP_LOCK_PATH, MCP_TOOLS_DIR, MCP_SERVER_STARTUP_TIMEOUT
+from .mcp_pool import MCPServerReplica, _run_with_timeout
+from .schema_cache import server_cache_key
+
+logger = logging.getLogger(__name__)
+
+# Bumped when the layout of the lockfile changes
+LOCK_FORMAT_VERSION = 1
+
+_UNSAFE_PATH_CHARS = re.compile(r"[^A-Za-z0-9_.-]")
+
+
+class ServerPackage:
+    """The package an MCP server is launched from with uvx or npx"""
+
+    def __init__(self, installer: str, package: str, version: Optional[str], executable: str, args: List[str]):
+        self.installer = installer
+        self.package = package
+        self.version = version
+        self.executable = executable
+        self.args = args
+
+
+def _split_python_version(spec: str) -> Tuple[str, Optional[str]]:
+    """Split "pkg@1.2.3", "pkg==1.2.3" or "pkg@latest" into the name and the version"""
+    for separator in ("==", "@"):
+        if separator in spec:
+            name, version = spec.split(separator, 1)
+            return name, None if version == "latest" else version
+    return spec, None
+
+
+def _split_node_version(spec: str) -> Tuple[str, Optional[str]]:
+    """Split "pkg@1.2.3" or "@scope/pkg@latest" into the name and the version"""
+    at = spec.rfind("@")
+    if at <= 0:
+        return spec, None
+    version = spec[at + 1:]
+    return spec[:at], None if version == "latest" else version
+
+
+def parse_server_package(server: Dict[str, Any]) -> Optional[ServerPackage]:
+    """Get the package of a server, or None if it is not launched in a way that can be pinned"""
+    command = os.path.basename(server.get("command", ""))
+    args = list(server.get("args", []))
+
+    if command == "uvx":
+        source = None
+        while args and args[0] == "--from" and len(args) > 1:
+            source = args[1]
+            args = args[2:]
+        if not args or args[0].startswith("-"):
+            # Other uvx options change the environment, so the server is started as configured
+            return None
+        executable, version = _split_python_version(args[0])
+        package = executable
+        if source is not None:
+            package, version = _split_python_version(source)
+        return ServerPackage("uv", package, version, executable, args[1:])
+
+    if command == "npx":
+        while args and args[0] in ("-y", "--yes"):
+            args = args[1:]
+        if not args or args[0].startswith("-"):
+            return None
+        package, version = _split_node_version(args[0])
+        return ServerPackage("npm", package, version, "", args[1:])
+
+    return None
+
+
+def _run(command: List[str]) -> str:
+    result = subprocess.run(command, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"{' '.join(command)} failed: {result.stderr.strip()}")
+    return result.stdout
+
+
+def install_python_package(package: ServerPackage, directory: str) -> Tuple[str, str]:
+    """Install a package into a virtual environment, and get its version and executable"""
+    python = os.path.join(directory, "bin", "python")
+    requirement = f"{package.package}=={package.version}" if package.version else package.package
+    _run(["uv", "venv", "--quiet", directory])
+    _run(["uv", "pip", "install", "--quiet", "--python", python, requirement])
+
+    # The name without extras, e.g. "pkg" of "pkg[cli]"
+    name = package.package.split("[", 1)[0]
+    show = _run(["uv", "pip", "show", "--python", python, name])
+    version = next(line.split(":", 1)[1].strip() for line in show.splitlines() if line.startswith("Version:"))
+    return version, os.path.join(directory, "bin", package.executable)
+
+
+def install_node_package(package: ServerPackage, directory: str) -> Tuple[str, str]:
+    """Install a package into a node_modules directory, and get its version and executable"""
+    os.makedirs(directory, exist_ok=True)
+    _run([
+        "npm", "install", "--prefix", directory, "--no-audit", "--no-fund",
+        f"{package.package}@{package.version or 'latest'}",
+    ])
+
+    with open(os.path.join(directory, "node_modules", package.package, "package.json")) as f:
+        package_json = json.load(f)
+    # npx runs the executable named like the package, or the only one it has
+    executables = package_json.get("bin", {})
+    executable = package.package.split("/")[-1]
+    if isinstance(executables, dict) and executable not in executables and len(executables) == 1:
+        executable = next(iter(executables))
+    return package_json["version"], os.path.join(directory, "node_modules", ".bin", executable)
+
+
+def measure_startup(server_name: str, server: Dict[str, Any]) -> Optional[float]:
+    """Start an installed server once, checking that it answers without network access to packages"""
+    replica = MCPServerReplica(server_name, 0, server, get_uv_environment())
+    try:
+        _run_with_timeout(replica.start, MCP_SERVER_STARTUP_TIMEOUT)
+        logger.info(f"MCP server {server_name} started with {len(replica.tools)} tools in {replica.startup_seconds}s")
+        return replica.startup_seconds
+    except Exception as e:
+        logger.warning(f"MCP server {server_name} did not start: {e}")
+        return None
+    finally:
+        replica.stop()
+
+
+def load_lock(path: str = MCP_LOCK_PATH) -> Dict[str, Any]:
+    """Read the lockfile, or an empty one if there is none"""
+    try:
+        with open(path, "r") as f:
+            lock = json.load(f)
+    except FileNotFoundError:
+        return {"version": LOCK_FORMAT_VERSION, "servers": {}}
+    if lock.get("version") != LOCK_FORMAT_VERSION:
+        logger.warning(f"Ignoring {path}, written in another lockfile format")
+        return {"version": LOCK_FORMAT_VERSION, "servers": {}}
+    return lock
+
+
+def bake(
+    mcp_servers: Dict[str, Dict[str, Any]],
+    lock: Dict[str, Any],
+    tools_dir: str = MCP_TOOLS_DIR,
+    update: bool = False,
+) -> Dict[str, Any]:
+    """Install the servers, and get the lockfile with their versions and timings"""
+    locked_servers = {}
+    for server_name, server in mcp_servers.items():
+        package = parse_server_package(server)
+        if package is None:
+            logger.info(f"MCP server {server_name} is not launched with uvx or npx, it is started as configured")
+            continue
+
+        config_key = server_cache_key(server)
+        entry = lock["servers"].get(server_name)
+        if not update and entry is not None and entry.get("config_key") == config_key:
+            package.version = entry["version"]
+
+        directory = os.path.join(tools_dir, _UNSAFE_PATH_CHARS.sub("_", server_name))
+        shutil.rmtree(directory, ignore_errors=True)
+        started_at = time.perf_counter()
+        install = install_python_package if package.installer == "uv" else install_node_package
+        version, command = install(package, directory)
+        install_seconds = round(time.perf_counter() - started_at, 3)
+        logger.info(f"Installed {package.package} {version} for MCP server {server_name} in {install_seconds}s")
+
+        locked_servers[server_name] = {
+            "config_key": config_key,
+            "installer": package.installer,
+            "package": package.package,
+            "version": version,
+            "command": command,
+            "args": package.args,
+            "install_seconds": install_seconds,
+            "startup_seconds": measure_startup(server_name, {**server, "command": command, "args": package.args}),
+        }
+    return {"version": LOCK_FORMAT_VERSION, "servers": locked_servers}
+
+
+def pin_mcp_servers(mcp_servers: Dict[str, Dict[str, Any]], lock: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """Replace the launch command of baked servers with their installed executable
+
+    Servers that changed in mcp.json since the bake, or were not baked, are
+    started as configured.
+    """
+    pinned = {}
+    for server_name, server in mcp_servers.items():
+        entry = lock["servers"].get(server_name)
+        if entry is None:
+            pinned[server_name] = server
+        elif entry.get("config_key") != server_cache_key(server) or not os.path.exists(entry["command"]):
+            logger.warning(f"MCP server {server_name} changed since it was baked, it is started as configured")
+            pinned[server_name] = server
+        else:
+            pinned[server_name] = {
+                **server,
+                "command": entry["command"],
+                "args": entry["args"],
+                "version": entry["version"],
+            }
+    return pinned
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Install the MCP servers of mcp.json at pinned versions")
+    parser.add_argument("--mcp-json", default="mcp.json")
+    parser.add_argument("--lock", default=MCP_LOCK_PATH, help="Lockfile with the versions to install")
+    parser.add_argument("--tools-dir", default=MCP_TOOLS_DIR, help="Directory of the server environments")
+    parser.add_argument("--update", action="store_true", help="Install the latest versions and update the lockfile")
+    args = parser.parse_args()
+
+    with open(args.mcp_json, "r") as f:
+        mcp_servers = json.load(f).get("mcpServers", {})
+    lock = bake(mcp_servers, load_lock(args.lock), args.tools_dir, args.update)
+    with open(args.lock, "w") as f:
+        json.dump(lock, f, indent=2)
+        f.write("\n")
+    logger.info(f"Wrote {args.lock} with {len(lock['servers'])} pinned MCP servers")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Shared boto3 sessions and Bedrock models for the agent core runtime."""
+
+import boto3
+import logging
+import threading
+from botocore.config import Config as BotocoreConfig
+from collections import OrderedDict
+from contextvars import ContextVar
+from typing import Dict, Optional, Any
+from .config import MODEL_POOL_MAX_SIZE
+from .context import find_request_context
+from .prompt_cache import PromptCachingBedrockModel
+
+logger = logging.getLogger(__name__)
+
+
+# Set while a routed attempt of a model call runs, so its stream goes to the attempt
+# (and to the request only if the attempt wins)
+model_stream_owner: ContextVar[Optional[Any]] = ContextVar("model_stream_owner", default=None)
+
+
+def _track_model_stream(parsed: Dict[str, Any], **kwargs: Any):
+    """Let the request of a ConverseStream call close its stream when it is cancelled"""
+    owner = model_stream_owner.get() or find_request_context()
+    if owner is not None and "stream" in parsed:
+        owner.track_model_stream(parsed["stream"])
+
+
+class BedrockModelPool:
+    """Bounded LRU pool of BedrockModel instances shared across requests.
+
+    Models are keyed by (model_id, region) and cache every request field the model
+    supports. boto3 sessions are shared per region so credentials and endpoints are
+    resolved only once.
+    """
+
+    def __init__(self, max_size: int = MODEL_POOL_MAX_SIZE, client_config: Optional[BotocoreConfig] = None):
+        self.max_size = max_size
+        self.client_config = client_config
+        self._models: "OrderedDict[tuple[str, str], PromptCachingBedrockModel]" = OrderedDict()
+        self._sessions: Dict[str, boto3.Session] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _get_session(self, region: str) -> boto3.Session:
+        """Get the shared boto3 session for a region (must hold the lock)"""
+        session = self._sessions.get(region)
+        if session is None:
+            session = boto3.Session(region_name=region)
+            self._sessions[region] = session
+        return session
+
+    def get_model(self, model_id: str, region: str) -> PromptCachingBedrockModel:
+        """Get a shared BedrockModel, creating it on a miss"""
+        key = (model_id, region)
+
+        # boto3 sessions are not thread-safe, so model creation also happens under the lock
+        with self._lock:
+            model = self._models.get(key)
+            if model is not None:
+                self._models.move_to_end(key)
+                self.hits += 1
+                return model
+
+            self.misses += 1
+            model = PromptCachingBedrockModel(
+                model_id=model_id,
+                boto_session=self._get_session(region),
+                boto_client_config=self.client_config,
+            )
+            model.client.meta.events.register(
+                "after-call.bedrock-runtime.ConverseStream", _track_model_stream
+            )
+            self._models[key] = model
+
+            while len(self._models) > self.max_size:
+                evicted_key, _ = self._models.popitem(last=False)
+                self.evictions += 1
+                logger.info(f"Evicted Bedrock model from pool: {evicted_key}")
+
+            return model
+
+    def stats(self) -> Dict[str, Any]:
+        """Get pool size and hit/miss counters"""
+        with self._lock:
+            return {
+                "size": len(self._models),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
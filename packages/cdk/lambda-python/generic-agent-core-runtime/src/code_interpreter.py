@@ -0,0 +1,236 @@
+"""Code interpreter tool caching for the agent core runtime."""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Dict, Tuple, Optional, Any
+from .config import (
+    CODE_INTERPRETER_CACHE_SIZE,
+    CODE_INTERPRETER_PREWARM,
+    CODE_INTERPRETER_PREWARM_MAX_AGE,
+)
+
+logger = logging.getLogger(__name__)
+
+# Import strands-agents code interpreter tool
+try:
+    from bedrock_agentcore.tools.code_interpreter_client import (
+        CodeInterpreter as CodeInterpreterClient,
+    )
+    from strands_tools.code_interpreter import AgentCoreCodeInterpreter
+    from strands_tools.code_interpreter.agent_core_code_interpreter import SessionInfo
+    from strands_tools.code_interpreter.models import InitSessionAction
+    CODE_INTERPRETER_AVAILABLE = True
+except ImportError as e:
+    CODE_INTERPRETER_AVAILABLE = False
+    logger.warning(f"Strands code interpreter tool not available: {e}")
+    AgentCoreCodeInterpreter = None
+
+
+class CodeInterpreterSessionPool:
+    """Pool of started code interpreter sandbox sessions
+
+    Starting a sandbox session is the slowest part of the first code_interpreter
+    call in a conversation, so a few sessions are started ahead of time and handed
+    out by init_session. Sessions older than CODE_INTERPRETER_PREWARM_MAX_AGE are
+    stopped instead of being handed out, so they never expire while in use.
+    """
+
+    def __init__(self, region: str, size: int):
+        self.region = region
+        self.size = size
+        self._clients: List[Tuple[float, Any]] = []
+        self._lock = threading.Lock()
+        self._refilling = False
+        self.hits = 0
+        self.misses = 0
+
+    def take(self) -> Optional[Any]:
+        """Take a started client, or None if the pool is empty"""
+        client = None
+        expired = []
+        with self._lock:
+            while self._clients:
+                started_at, candidate = self._clients.pop(0)
+                if time.monotonic() - started_at < CODE_INTERPRETER_PREWARM_MAX_AGE:
+                    client = candidate
+                    break
+                expired.append(candidate)
+            if client is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        for c in expired:
+            _stop_quietly(c)
+        self.refill()
+        return client
+
+    def refill(self):
+        """Start sessions in the background until the pool is full"""
+        with self._lock:
+            if self._refilling or len(self._clients) >= self.size:
+                return
+            self._refilling = True
+        threading.Thread(target=self._refill, name="code-interpreter-prewarm", daemon=True).start()
+
+    def _refill(self):
+        try:
+            while True:
+                with self._lock:
+                    if len(self._clients) >= self.size:
+                        return
+                client = CodeInterpreterClient(region=self.region)
+                client.start()
+                with self._lock:
+                    self._clients.append((time.monotonic(), client))
+        except Exception as e:
+            logger.warning(f"Failed to pre-warm code interpreter session: {e}")
+        finally:
+            with self._lock:
+                self._refilling = False
+
+    def stop(self):
+        with self._lock:
+            clients = [c for _, c in self._clients]
+            self._clients = []
+        for c in clients:
+            _stop_quietly(c)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"size": len(self._clients), "hits": self.hits, "misses": self.misses}
+
+
+def _stop_quietly(client: Any):
+    try:
+        client.stop()
+    except Exception as e:
+        logger.debug(f"Error stopping code interpreter session: {e}")
+
+
+if CODE_INTERPRETER_AVAILABLE:
+
+    class PrewarmedCodeInterpreter(AgentCoreCodeInterpreter):
+        """AgentCoreCodeInterpreter that takes sandbox sessions from a pre-warmed pool
+
+        It registers sessions through internals of strands_tools (_sessions,
+        SessionInfo, _create_tool_result), so its version is pinned in pyproject.toml.
+        """
+
+        def __init__(self, region: str, session_pool: Optional[CodeInterpreterSessionPool]):
+            super().__init__(region=region)
+            self.session_pool = session_pool
+
+        def init_session(self, action: InitSessionAction) -> Dict[str, Any]:
+            client = self.session_pool.take() if self.session_pool else None
+            if client is None or action.session_name in self._sessions:
+                if client is not None:
+                    _stop_quietly(client)
+                return super().init_session(action)
+
+            self._sessions[action.session_name] = SessionInfo(
+                session_id=client.session_id, description=action.description, client=client
+            )
+            logger.info(f"Initialized pre-warmed session: {action.session_name} (ID: {client.session_id})")
+
+            return self._create_tool_result(
+                {
+                    "status": "success",
+                    "content": [
+                        {
+                            "json": {
+                                "sessionName": action.session_name,
+                                "description": action.description,
+                                "sessionId": client.session_id,
+                            }
+                        }
+                    ],
+                }
+            )
+
+
+class CodeInterpreterCache:
+    """Reuses code interpreter tools across the requests of a conversation
+
+    AgentCoreCodeInterpreter keeps sandbox sessions by the name the model chooses,
+    so one instance must never be shared between conversations. Instances are
+    therefore cached per (region, session ID) with LRU eviction, and evicted
+    instances stop their sandbox sessions in the background.
+    """
+
+    def __init__(self, max_size: int = CODE_INTERPRETER_CACHE_SIZE):
+        self.max_size = max_size
+        self._interpreters: "OrderedDict[Tuple[str, str], Any]" = OrderedDict()
+        self._session_pools: Dict[str, CodeInterpreterSessionPool] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _create_interpreter(self, region: str) -> Any:
+        """Create an interpreter (must hold the lock)"""
+        session_pool = None
+        if CODE_INTERPRETER_PREWARM > 0:
+            session_pool = self._session_pools.get(region)
+            if session_pool is None:
+                session_pool = CodeInterpreterSessionPool(region, CODE_INTERPRETER_PREWARM)
+                session_pool.refill()
+                self._session_pools[region] = session_pool
+        return PrewarmedCodeInterpreter(region=region, session_pool=session_pool)
+
+    def get_tools(self, region: str, session_id: Optional[str]) -> List[Any]:
+        """Get the code interpreter tool for the conversation"""
+        if not CODE_INTERPRETER_AVAILABLE:
+            return []
+
+        with self._lock:
+            if session_id is None:
+                # Without a session ID the interpreter cannot be reused safely
+                self.misses += 1
+                return [self._create_interpreter(region).code_interpreter]
+
+            key = (region, session_id)
+            interpreter = self._interpreters.get(key)
+            if interpreter is not None:
+                self._interpreters.move_to_end(key)
+                self.hits += 1
+                return [interpreter.code_interpreter]
+
+            self.misses += 1
+            interpreter = self._create_interpreter(region)
+            self._interpreters[key] = interpreter
+
+            evicted = []
+            while len(self._interpreters) > self.max_size:
+                _, old = self._interpreters.popitem(last=False)
+                evicted.append(old)
+
+        for old in evicted:
+            threading.Thread(target=old.cleanup_platform, daemon=True).start()
+        return [interpreter.code_interpreter]
+
+    def prewarm(self, region: str):
+        """Start pre-warming sandbox sessions for a region"""
+        if CODE_INTERPRETER_AVAILABLE and CODE_INTERPRETER_PREWARM > 0:
+            with self._lock:
+                self._create_interpreter(region)
+
+    def stop(self):
+        with self._lock:
+            interpreters = list(self._interpreters.values())
+            self._interpreters.clear()
+            session_pools = list(self._session_pools.values())
+        for interpreter in interpreters:
+            interpreter.cleanup_platform()
+        for session_pool in session_pools:
+            session_pool.stop()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "size": len(self._interpreters),
+                "hits": self.hits,
+                "misses": self.misses,
+                "prewarmed_sessions": {r: p.stats() for r, p in self._session_pools.items()},
+            }
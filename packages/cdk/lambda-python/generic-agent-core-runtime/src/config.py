@@ -1,6 +1,7 @@
 """Configuration and environment setup for the agent core runtime."""
 
 import os
+import json
 import logging
 from typing import Dict, Any
 
@@ -13,13 +14,165 @@ logger = logging.getLogger(__name__)
 
 WORKSPACE_DIR = "/tmp/ws"
 
-FIXED_SYSTEM_PROMPT = f"""## About File Output
-- You are running on AWS Bedrock AgentCore. Therefore, when writing files, always write them under `{WORKSPACE_DIR}`.
-- Similarly, if you need a workspace, please use the `{WORKSPACE_DIR}` directory. Do not ask the user about their current workspace. It's always `{WORKSPACE_DIR}`.
-- Also, users cannot directly access files written under `{WORKSPACE_DIR}`. So when submitting these files to users, *always upload them to S3 using the `upload_file_to_s3_and_retrieve_s3_url` tool and provide the S3 URL*. The S3 URL must be included in the final output.
+# Maximum number of seconds to wait for each MCP server to start and list its tools
+MCP_SERVER_STARTUP_TIMEOUT = float(os.environ.get("MCP_SERVER_STARTUP_TIMEOUT", "60"))
+
+# MCP server liveness probes (interval 0 disables them) and restart backoff, in seconds
+MCP_HEALTH_CHECK_INTERVAL = float(os.environ.get("MCP_HEALTH_CHECK_INTERVAL", "30"))
+MCP_HEALTH_CHECK_TIMEOUT = float(os.environ.get("MCP_HEALTH_CHECK_TIMEOUT", "10"))
+MCP_RESTART_BACKOFF_BASE = float(os.environ.get("MCP_RESTART_BACKOFF_BASE", "1"))
+MCP_RESTART_BACKOFF_MAX = float(os.environ.get("MCP_RESTART_BACKOFF_MAX", "60"))
+
+# "pinned" starts the MCP servers installed into MCP_TOOLS_DIR by src/bake.py at the
+# versions in MCP_LOCK_PATH, without resolving or downloading packages. "latest"
+# starts them as configured in mcp.json.
+MCP_SERVER_MODE = os.environ.get("MCP_SERVER_MODE", "latest").lower()
+MCP_LOCK_PATH = os.environ.get("MCP_LOCK_PATH", "mcp.lock.json")
+MCP_TOOLS_DIR = os.environ.get("MCP_TOOLS_DIR", "/opt/mcp-tools")
+
+# File keeping the tool specs of MCP servers across restarts ("" disables it). The
+# subprocesses of a server whose specs are cached start on the first call of its tools.
+MCP_SCHEMA_CACHE_PATH = os.environ.get("MCP_SCHEMA_CACHE_PATH", "/tmp/mcp-schema-cache.json")
+
+# Load MCP tools in the background at process start instead of on the first request
+MCP_EAGER_WARMUP = os.environ.get("MCP_EAGER_WARMUP", "false").lower() == "true"
+
+# Maximum number of BedrockModel instances kept for reuse across requests
+MODEL_POOL_MAX_SIZE = int(os.environ.get("MODEL_POOL_MAX_SIZE", "16"))
+
+# Regions a model call fails over to, in order after the region of the request
+# (comma-separated). Cross-region inference profiles (us., eu., apac.) are switched
+# to the profile of each region's geography. A call that fails before its first
+# event is made once on each region before any retry is counted.
+BEDROCK_FAILOVER_REGIONS = [
+    region.strip() for region in os.environ.get("BEDROCK_FAILOVER_REGIONS", "").split(",") if region.strip()
+]
+
+# Retries of a model call that failed before its first event (throttling, 5xx,
+# timeouts) on every region, with full-jitter exponential backoff in seconds.
+# Each retry spends a token of a budget that successful calls refill, so retries
+# stop when most calls fail instead of adding to the overload. A call that is still
+# failing then fails the request, since strands would retry it with a blocking sleep.
+BEDROCK_MAX_RETRIES = int(os.environ.get("BEDROCK_MAX_RETRIES", "0"))
+BEDROCK_RETRY_BASE_DELAY = float(os.environ.get("BEDROCK_RETRY_BASE_DELAY", "0.2"))
+BEDROCK_RETRY_MAX_DELAY = float(os.environ.get("BEDROCK_RETRY_MAX_DELAY", "5"))
+BEDROCK_RETRY_BUDGET = int(os.environ.get("BEDROCK_RETRY_BUDGET", "20"))
+
+# Start a second call on the next region when the first event of a model call takes
+# longer than this many milliseconds (0 disables), and keep the first to answer
+BEDROCK_HEDGE_AFTER_MS = float(os.environ.get("BEDROCK_HEDGE_AFTER_MS", "0"))
+
+# Consecutive failures after which a region is skipped, and seconds before it is tried again
+BEDROCK_CIRCUIT_FAILURES = int(os.environ.get("BEDROCK_CIRCUIT_FAILURES", "5"))
+BEDROCK_CIRCUIT_COOLDOWN = float(os.environ.get("BEDROCK_CIRCUIT_COOLDOWN", "30"))
+
+# Maximum number of conversations whose code interpreter is kept for reuse
+CODE_INTERPRETER_CACHE_SIZE = int(os.environ.get("CODE_INTERPRETER_CACHE_SIZE", "64"))
+
+# Number of code interpreter sandbox sessions started ahead of time (0 disables),
+# and the age in seconds after which an unused one is discarded
+CODE_INTERPRETER_PREWARM = int(os.environ.get("CODE_INTERPRETER_PREWARM", "0"))
+CODE_INTERPRETER_PREWARM_MAX_AGE = float(os.environ.get("CODE_INTERPRETER_PREWARM_MAX_AGE", "600"))
+
+# S3 multipart transfer settings and number of files uploaded in parallel
+S3_MULTIPART_THRESHOLD_MB = int(os.environ.get("S3_MULTIPART_THRESHOLD_MB", "8"))
+S3_MULTIPART_CHUNKSIZE_MB = int(os.environ.get("S3_MULTIPART_CHUNKSIZE_MB", "16"))
+S3_MAX_CONCURRENCY = int(os.environ.get("S3_MAX_CONCURRENCY", "10"))
+S3_UPLOAD_PARALLELISM = int(os.environ.get("S3_UPLOAD_PARALLELISM", "4"))
+
+# Memory for decoded media payloads reused across turns (0 disables it, the default,
+# so idle runtimes do not hold on to media), and the smallest base64 payload worth caching
+MEDIA_DECODE_CACHE_MB = int(os.environ.get("MEDIA_DECODE_CACHE_MB", "0"))
+MEDIA_DECODE_CACHE_MIN_KB = int(os.environ.get("MEDIA_DECODE_CACHE_MIN_KB", "64"))
+
+# Maximum size of an /invocations request body
+MAX_REQUEST_BODY_MB = int(os.environ.get("MAX_REQUEST_BODY_MB", "100"))
+
+# Parse request bodies incrementally while they stream in (with ijson), decoding
+# media payloads as they are parsed instead of holding the whole body as a str
+STREAMING_REQUEST_PARSE = os.environ.get("STREAMING_REQUEST_PARSE", "false").lower() == "true"
+
+# Serializer of streamed events: "auto" uses orjson when it is installed, "json" forces the stdlib
+STREAM_SERIALIZER = os.environ.get("STREAM_SERIALIZER", "auto").lower()
+
+# Merge contentBlockDelta events into frames of at most this many milliseconds
+# (0 streams every delta as it arrives) or this many bytes of text
+STREAM_COALESCE_MS = float(os.environ.get("STREAM_COALESCE_MS", "0"))
+STREAM_COALESCE_BYTES = int(os.environ.get("STREAM_COALESCE_BYTES", "1024"))
+
+# Send a runtimeMetadata frame as soon as the stream starts, before MCP tools are
+# loaded and the agent is built, and another with the setup timings once it is built
+STREAM_EARLY_METADATA = os.environ.get("STREAM_EARLY_METADATA", "false").lower() == "true"
+
+# Frames buffered for a slow client before the agent is paused, and how often in
+# seconds the connection of the client is checked while the agent works (0 only
+# notices a disconnect when a frame is written)
+STREAM_BUFFER_FRAMES = int(os.environ.get("STREAM_BUFFER_FRAMES", "64"))
+STREAM_DISCONNECT_POLL_INTERVAL = float(os.environ.get("STREAM_DISCONNECT_POLL_INTERVAL", "1"))
+
+# Maximum number of agents running at once (0 is unlimited). Further invocations
+# wait in a queue of at most ADMISSION_QUEUE_SIZE for up to ADMISSION_QUEUE_TIMEOUT
+# seconds, and are rejected with 429 when the queue is full or the wait times out.
+ADMISSION_MAX_CONCURRENT = int(os.environ.get("ADMISSION_MAX_CONCURRENT", "0"))
+ADMISSION_QUEUE_SIZE = int(os.environ.get("ADMISSION_QUEUE_SIZE", "32"))
+ADMISSION_QUEUE_TIMEOUT = float(os.environ.get("ADMISSION_QUEUE_TIMEOUT", "30"))
+
+# Maximum disk usage of WORKSPACE_DIR before new invocations are rejected (0 disables),
+# and how often in seconds the reaper measures it and removes abandoned workspaces
+WORKSPACE_QUOTA_MB = int(os.environ.get("WORKSPACE_QUOTA_MB", "0"))
+WORKSPACE_SWEEP_INTERVAL = float(os.environ.get("WORKSPACE_SWEEP_INTERVAL", "60"))
+
+# Threads for the blocking work of tools (Bedrock streams run on other threads)
+TOOL_EXECUTOR_THREADS = int(os.environ.get("TOOL_EXECUTOR_THREADS", "64"))
+
+# Maximum concurrent calls of each tool (0 is unlimited), and per-tool overrides
+# as a JSON object, e.g. {"code_interpreter": 4}
+TOOL_CONCURRENCY_DEFAULT = int(os.environ.get("TOOL_CONCURRENCY_DEFAULT", "0"))
+try:
+    TOOL_CONCURRENCY_LIMITS: Dict[str, int] = json.loads(os.environ.get("TOOL_CONCURRENCY_LIMITS", "{}"))
+except json.JSONDecodeError as e:
+    logger.warning(f"Ignoring invalid TOOL_CONCURRENCY_LIMITS: {e}")
+    TOOL_CONCURRENCY_LIMITS = {}
+
+# Number of tools given to the agent, picked by the relevance of their names and
+# descriptions to the request (0 gives every tool). Tools matching TOOL_SELECTION_ALWAYS
+# (comma-separated names or wildcards) and tools used earlier in the conversation are
+# given as well, and every tool is given when none is relevant to the request.
+TOOL_SELECTION_TOP_K = int(os.environ.get("TOOL_SELECTION_TOP_K", "0"))
+TOOL_SELECTION_ALWAYS = [
+    pattern.strip()
+    for pattern in os.environ.get("TOOL_SELECTION_ALWAYS", "upload_*,code_interpreter").split(",")
+    if pattern.strip()
+]
+
+# Estimated tokens of conversation history sent to the model (0 sends it as is).
+# The last HISTORY_KEEP_TURNS turns are never compacted, older tool results are
+# truncated to HISTORY_TOOL_RESULT_MAX_CHARS, and older turns are dropped or,
+# with HISTORY_SUMMARIZE, replaced with a summary.
+HISTORY_TOKEN_BUDGET = int(os.environ.get("HISTORY_TOKEN_BUDGET", "0"))
+HISTORY_KEEP_TURNS = int(os.environ.get("HISTORY_KEEP_TURNS", "2"))
+HISTORY_TOOL_RESULT_MAX_CHARS = int(os.environ.get("HISTORY_TOOL_RESULT_MAX_CHARS", "2000"))
+HISTORY_SUMMARIZE = os.environ.get("HISTORY_SUMMARIZE", "false").lower() == "true"
+
+# Memory for the histories of sessions kept after each turn (0 disables it), so that
+# clients send only the new turn with the historyVersion of their previous response.
+# Histories that do not fit spill to SESSION_STORE_DIR, up to SESSION_STORE_DISK_MB.
+SESSION_STORE_MEMORY_MB = int(os.environ.get("SESSION_STORE_MEMORY_MB", "0"))
+SESSION_STORE_DISK_MB = int(os.environ.get("SESSION_STORE_DISK_MB", "1024"))
+SESSION_STORE_DIR = os.environ.get("SESSION_STORE_DIR", "/tmp/session-store")
+
+# The same for every session, so that it starts the prompt cache prefix. The workspace
+# directory of the session is given at the end of the system prompt instead.
+FIXED_SYSTEM_PROMPT = """## About File Output
+- You are running on AWS Bedrock AgentCore. Therefore, when writing files, always write them under the workspace directory given at the end of this prompt.
+- Similarly, if you need a workspace, please use the workspace directory. Do not ask the user about their current workspace. It's always the workspace directory.
+- Also, users cannot directly access files written under the workspace directory. So when submitting these files to users, *always upload them to S3 using the `upload_file_to_s3_and_retrieve_s3_url` tool and provide the S3 URL*. The S3 URL must be included in the final output.
+- When submitting several files, upload them at once using the `upload_files_to_s3_and_retrieve_s3_urls` tool.
 - If the output file is an image file, the S3 URL output must be in Markdown format.
 """
 
+WORKSPACE_SYSTEM_PROMPT_TEMPLATE = "Workspace directory: `{workspace_dir}`"
+
 
 def get_aws_credentials() -> Dict[str, str]:
     """Get AWS credentials from environment or IAM role"""
@@ -38,10 +191,14 @@ def get_aws_credentials() -> Dict[str, str]:
 
 
 def get_uv_environment() -> Dict[str, str]:
-    """Get UV environment with AWS credentials"""
+    """Get UV environment with AWS credentials
+
+    The uv cache lives under /tmp for the life of the container, so servers that
+    are not baked (and their restarts) download their packages once.
+    """
     aws_creds = get_aws_credentials()
     return {
-        "UV_NO_CACHE": "1",
+        "UV_CACHE_DIR": "/tmp/.uv/cache",
         "UV_PYTHON": "/usr/local/bin/python",
         "UV_TOOL_DIR": "/tmp/.uv/tool",
         "UV_TOOL_BIN_DIR": "/tmp/.uv/tool/bin",
@@ -51,12 +208,18 @@ def get_uv_environment() -> Dict[str, str]:
     }
 
 
-def get_system_prompt(user_system_prompt: str = None) -> str:
-    """Combine user system prompt with fixed system prompt"""
+def get_system_prompt(user_system_prompt: str = None, workspace_dir: str = WORKSPACE_DIR) -> str:
+    """Combine user system prompt with fixed system prompt
+
+    The fixed system prompt comes first, so it starts the prompt cache prefix
+    whatever the user system prompt is, and the workspace directory of the
+    session comes last.
+    """
+    workspace_prompt = WORKSPACE_SYSTEM_PROMPT_TEMPLATE.format(workspace_dir=workspace_dir)
     if user_system_prompt:
-        return f"{user_system_prompt}\n{FIXED_SYSTEM_PROMPT}"
+        return f"{FIXED_SYSTEM_PROMPT}\n{user_system_prompt}\n\n{workspace_prompt}"
     else:
-        return FIXED_SYSTEM_PROMPT
+        return f"{FIXED_SYSTEM_PROMPT}\n{workspace_prompt}"
 
 
 def extract_model_info(model_info: Any) -> tuple[str, str]:
@@ -0,0 +1,97 @@
+"""Request-scoped context for the agent core runtime."""
+
+import asyncio
+import logging
+import os
+import re
+import threading
+from contextvars import ContextVar, Token
+from typing import Set, Optional, Any
+from .config import WORKSPACE_DIR
+from .utils import create_id
+
+logger = logging.getLogger(__name__)
+
+# Session IDs come from request headers, so only safe characters are used in paths
+_UNSAFE_PATH_CHARS = re.compile(r"[^A-Za-z0-9_.-]")
+
+
+class RequestContext:
+    """Session information and workspace of a single invocation"""
+
+    def __init__(self, session_id: Optional[str], trace_id: Optional[str]):
+        self.session_id = session_id
+        self.trace_id = trace_id
+        self.workspace_dir = get_workspace_dir(session_id)
+        # Set once the client has disconnected, so no more work is done for it
+        self.cancelled = threading.Event()
+        self._tool_tasks: Set[asyncio.Task] = set()
+        self._model_stream: Optional[Any] = None
+        self._lock = threading.Lock()
+
+    def track_tool_task(self, task: asyncio.Task):
+        """Register the task of an in-flight tool call (strands does not cancel them)"""
+        with self._lock:
+            self._tool_tasks.add(task)
+
+    def untrack_tool_task(self, task: asyncio.Task):
+        with self._lock:
+            self._tool_tasks.discard(task)
+
+    def track_model_stream(self, stream: Any):
+        """Register the response stream of the current model call, to close it on cancel
+
+        The stream is read by a thread that keeps reading it (and the model keeps
+        generating tokens) after the request is cancelled, unless it is closed.
+        """
+        with self._lock:
+            if not self.cancelled.is_set():
+                self._model_stream = stream
+                return
+        stream.close()
+
+    def cancel(self) -> int:
+        """Cancel in-flight tool calls and close the model stream of the request
+
+        Returns the number of tool calls cancelled.
+        """
+        with self._lock:
+            self.cancelled.set()
+            tool_tasks, self._tool_tasks = self._tool_tasks, set()
+            model_stream, self._model_stream = self._model_stream, None
+
+        if model_stream is not None:
+            try:
+                model_stream.close()
+            except Exception as e:
+                logger.warning(f"Error closing model stream: {e}")
+        return sum(1 for task in tool_tasks if task.cancel())
+
+
+_request_context: ContextVar[Optional[RequestContext]] = ContextVar(
+    "request_context", default=None
+)
+
+
+def get_workspace_dir(session_id: Optional[str]) -> str:
+    """Get the per-session workspace directory under WORKSPACE_DIR"""
+    name = _UNSAFE_PATH_CHARS.sub("_", session_id or "").strip(".")
+    return os.path.join(WORKSPACE_DIR, name or create_id())
+
+
+def set_request_context(context: RequestContext) -> Token:
+    """Bind the context to the current task (and the tools it runs)"""
+    return _request_context.set(context)
+
+
+def find_request_context() -> Optional[RequestContext]:
+    """Get the context of the invocation being processed, if any"""
+    return _request_context.get()
+
+
+def get_request_context() -> RequestContext:
+    """Get the context of the invocation being processed"""
+    context = _request_context.get()
+    if context is None:
+        raise RuntimeError("No request context is bound to the current task")
+    return context
@@ -0,0 +1,260 @@
+"""Bounded execution of blocking tool work for the agent core runtime."""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from strands.types.tools import AgentTool, ToolGenerator, ToolSpec, ToolUse
+from typing import Callable, List, Dict, Optional, Any, AsyncIterator
+from .config import (
+    ADMISSION_MAX_CONCURRENT,
+    TOOL_EXECUTOR_THREADS,
+    TOOL_CONCURRENCY_DEFAULT,
+    TOOL_CONCURRENCY_LIMITS,
+)
+from .context import find_request_context
+from .metrics import metrics
+from .tool_cache import canonical_input, result_size
+
+logger = logging.getLogger(__name__)
+
+# Whether the current task is running a tool call, whose blocking work goes to the tool threads
+_in_tool_call: ContextVar[bool] = ContextVar("in_tool_call", default=False)
+
+
+class InstrumentedThreadPoolExecutor(ThreadPoolExecutor):
+    """Thread pool that tracks how much work is waiting for a thread"""
+
+    def __init__(self, max_workers: int, thread_name_prefix: str = ""):
+        super().__init__(max_workers=max_workers, thread_name_prefix=thread_name_prefix)
+        self._metrics_lock = threading.Lock()
+        self.queued = 0
+        self.max_queued = 0
+        self.running = 0
+        self.completed = 0
+
+    def submit(self, fn: Callable[..., Any], /, *args: Any, **kwargs: Any) -> Future:
+        with self._metrics_lock:
+            self.queued += 1
+            self.max_queued = max(self.max_queued, self.queued)
+
+        def run():
+            with self._metrics_lock:
+                self.queued -= 1
+                self.running += 1
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                with self._metrics_lock:
+                    self.running -= 1
+                    self.completed += 1
+
+        try:
+            return super().submit(run)
+        except Exception:
+            with self._metrics_lock:
+                self.queued -= 1
+            raise
+
+    def stats(self) -> Dict[str, Any]:
+        with self._metrics_lock:
+            return {
+                "max_workers": self._max_workers,
+                "queued": self.queued,
+                "max_queued": self.max_queued,
+                "running": self.running,
+                "completed": self.completed,
+            }
+
+
+class LoopExecutor(ThreadPoolExecutor):
+    """Default executor of the event loop that keeps the blocking work of tools on their own threads
+
+    Work submitted from a tool call goes to the bounded tool pool. Everything else
+    (Bedrock streams and their hedges, storage, startup) runs on the threads of
+    this executor, so tools can never starve it.
+    """
+
+    def __init__(self, tool_pool: ThreadPoolExecutor, max_workers: int):
+        super().__init__(max_workers=max_workers, thread_name_prefix="loop-worker")
+        self.tool_pool = tool_pool
+
+    def submit(self, fn: Callable[..., Any], /, *args: Any, **kwargs: Any) -> Future:
+        if _in_tool_call.get():
+            return self.tool_pool.submit(fn, *args, **kwargs)
+        return super().submit(fn, *args, **kwargs)
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False):
+        self.tool_pool.shutdown(wait=wait, cancel_futures=cancel_futures)
+        super().shutdown(wait=wait, cancel_futures=cancel_futures)
+
+
+class ToolLimiter:
+    """Concurrency limit and queue metrics of a single tool"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._semaphore = asyncio.Semaphore(limit) if limit > 0 else None
+        self.queued = 0
+        self.max_queued = 0
+        self.running = 0
+        self.calls = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.run_seconds = 0.0
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """Wait for a free slot and hold it while the tool runs"""
+        queued_at = time.perf_counter()
+        self.queued += 1
+        self.max_queued = max(self.max_queued, self.queued)
+        try:
+            if self._semaphore is not None:
+                await self._semaphore.acquire()
+        finally:
+            self.queued -= 1
+
+        started_at = time.perf_counter()
+        waited = started_at - queued_at
+        self.calls += 1
+        self.running += 1
+        self.wait_seconds += waited
+        self.max_wait_seconds = max(self.max_wait_seconds, waited)
+        try:
+            yield
+        finally:
+            self.running -= 1
+            self.run_seconds += time.perf_counter() - started_at
+            if self._semaphore is not None:
+                self._semaphore.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "limit": self.limit or None,
+            "queued": self.queued,
+            "max_queued": self.max_queued,
+            "running": self.running,
+            "calls": self.calls,
+            "wait_seconds": round(self.wait_seconds, 3),
+            "max_wait_seconds": round(self.max_wait_seconds, 3),
+            "run_seconds": round(self.run_seconds, 3),
+        }
+
+
+class LimitedTool(AgentTool):
+    """Agent tool that runs within the concurrency limit of its name"""
+
+    def __init__(self, tool: AgentTool, limiter: ToolLimiter):
+        super().__init__()
+        self.tool = tool
+        self.limiter = limiter
+
+    @property
+    def tool_name(self) -> str:
+        return self.tool.tool_name
+
+    @property
+    def tool_spec(self) -> ToolSpec:
+        return self.tool.tool_spec
+
+    @property
+    def tool_type(self) -> str:
+        return self.tool.tool_type
+
+    async def stream(self, tool_use: ToolUse, invocation_state: Dict[str, Any], **kwargs: Any) -> ToolGenerator:
+        labels = {"tool": self.tool_name, "server": _server_name(self.tool)}
+        metrics.observe_bytes("tool_input", len(canonical_input(tool_use.get("input", {}))), **labels)
+
+        # Each tool call runs in its own task, which the request cancels when its client disconnects
+        context = find_request_context()
+        task = asyncio.current_task()
+        if context is not None:
+            context.track_tool_task(task)
+        try:
+            async with self.limiter.slot():
+                # Timed without a span, since spans cannot be held across yields
+                started_at = time.perf_counter()
+                status = "error"
+                # Strands runs each tool call in its own task, so this only routes the work of the call
+                in_tool_call = _in_tool_call.set(True)
+                try:
+                    async for event in self.tool.stream(tool_use, invocation_state, **kwargs):
+                        if isinstance(event, dict) and event.get("toolUseId"):
+                            status = event.get("status", status)
+                            metrics.observe_bytes("tool_result", result_size(event.get("content", [])), **labels)
+                        yield event
+                except asyncio.CancelledError:
+                    status = "cancelled"
+                    raise
+                finally:
+                    _in_tool_call.reset(in_tool_call)
+                    metrics.observe_seconds("tool_call", time.perf_counter() - started_at, status=status, **labels)
+        finally:
+            if context is not None:
+                context.untrack_tool_task(task)
+
+
+def _server_name(tool: AgentTool) -> str:
+    """Get the name of the MCP server of a (wrapped) tool, or builtin for other tools"""
+    while not hasattr(tool, "server") and hasattr(tool, "tool"):
+        tool = tool.tool
+    server = getattr(tool, "server", None)
+    return getattr(server, "name", "builtin")
+
+
+class ToolExecutor:
+    """Runs blocking tool work away from the event loop
+
+    Strands runs sync tools and the Bedrock stream with asyncio.to_thread, which
+    uses the default executor of the event loop. The installed LoopExecutor sends
+    the work of tool calls to the bounded tool pool, and runs the rest on threads
+    of its own, sized so every admitted agent can stream and hedge at once. Each
+    tool also has a concurrency limit, so a slow tool queues up behind its own
+    limit instead of taking every tool thread.
+    """
+
+    def __init__(
+        self,
+        max_threads: int = TOOL_EXECUTOR_THREADS,
+        default_limit: int = TOOL_CONCURRENCY_DEFAULT,
+        limits: Optional[Dict[str, int]] = None,
+    ):
+        self.thread_pool = InstrumentedThreadPoolExecutor(max_threads, thread_name_prefix="tool-worker")
+        self.default_limit = default_limit
+        self.limits = TOOL_CONCURRENCY_LIMITS if limits is None else limits
+        self._limiters: Dict[str, ToolLimiter] = {}
+        self._lock = threading.Lock()
+
+    def install(self, loop: asyncio.AbstractEventLoop):
+        """Make the default executor of the event loop run tool work on the bounded thread pool"""
+        # The default size of asyncio, or a stream and a hedge for each admitted agent
+        max_workers = max(min(32, (os.cpu_count() or 1) + 4), 2 * ADMISSION_MAX_CONCURRENT)
+        loop.set_default_executor(LoopExecutor(self.thread_pool, max_workers))
+
+    def get_limiter(self, tool_name: str) -> ToolLimiter:
+        with self._lock:
+            limiter = self._limiters.get(tool_name)
+            if limiter is None:
+                limiter = ToolLimiter(int(self.limits.get(tool_name, self.default_limit)))
+                self._limiters[tool_name] = limiter
+            return limiter
+
+    def wrap_tools(self, tools: List[Any]) -> List[Any]:
+        """Apply the per-tool concurrency limits to agent tools"""
+        return [LimitedTool(t, self.get_limiter(t.tool_name)) for t in tools]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            limiters = dict(self._limiters)
+        return {
+            "threads": self.thread_pool.stats(),
+            "tools": {name: limiter.stats() for name, limiter in limiters.items()},
+        }
+
+
+tool_executor = ToolExecutor()
@@ -0,0 +1,290 @@
+"""Conversation history compaction for the agent core runtime."""
+
+import hashlib
+import json
+import logging
+import threading
+from collections import OrderedDict
+from typing import Callable, List, Dict, Tuple, Optional, Any
+from .config import (
+    HISTORY_TOKEN_BUDGET,
+    HISTORY_KEEP_TURNS,
+    HISTORY_TOOL_RESULT_MAX_CHARS,
+)
+from .utils import MEDIA_TYPES
+
+logger = logging.getLogger(__name__)
+
+# Rough token estimates: ~4 characters per token of text, and a fixed cost per
+# image (the maximum for Claude) since its dimensions are not known here. Binary
+# documents and videos also get a fixed cost (a few PDF pages, a short video),
+# since their size says little about their tokens and their pages or durations
+# are not known here either.
+_CHARS_PER_TOKEN = 4
+_IMAGE_TOKENS = 1600
+_DOCUMENT_TOKENS = 5000
+_VIDEO_TOKENS = 10000
+
+# Document formats whose bytes are text, so they are estimated like text
+_TEXT_DOCUMENT_FORMATS = {"txt", "csv", "md", "html"}
+
+# Number of summaries of dropped turns remembered, so later turns of a session
+# that drop the same turns do not summarize them again
+_SUMMARY_CACHE_MAX_SIZE = 256
+
+SUMMARY_SYSTEM_PROMPT = """You summarize the beginning of a conversation between a user and an AI assistant.
+The summary replaces those messages in the conversation, so keep every fact, decision, file path, URL and open task the assistant may need later.
+Answer with the summary only."""
+
+
+def estimate_block_tokens(block: Dict[str, Any]) -> int:
+    """Estimate the tokens of a content block"""
+    if "text" in block:
+        return len(block["text"]) // _CHARS_PER_TOKEN + 1
+    if "image" in block:
+        return _IMAGE_TOKENS
+    if "video" in block:
+        return _VIDEO_TOKENS
+    if "document" in block:
+        document = block["document"]
+        if document.get("format") in _TEXT_DOCUMENT_FORMATS:
+            return len(document.get("source", {}).get("bytes", b"")) // _CHARS_PER_TOKEN + 1
+        return _DOCUMENT_TOKENS
+    if "toolUse" in block:
+        return len(json.dumps(block["toolUse"].get("input", {}), ensure_ascii=False)) // _CHARS_PER_TOKEN + 1
+    if "toolResult" in block:
+        return sum(estimate_block_tokens(b) for b in block["toolResult"].get("content", []))
+    if "json" in block:
+        return len(json.dumps(block["json"], ensure_ascii=False)) // _CHARS_PER_TOKEN + 1
+    return 0
+
+
+def estimate_message_tokens(message: Dict[str, Any]) -> int:
+    """Estimate the tokens of a message"""
+    return sum(estimate_block_tokens(b) for b in message.get("content", []) if isinstance(b, dict))
+
+
+def _is_turn_start(message: Dict[str, Any]) -> bool:
+    """Whether a message starts a turn (a user message that is not a tool result)"""
+    return message["role"] == "user" and not any(
+        isinstance(b, dict) and "toolResult" in b for b in message.get("content", [])
+    )
+
+
+def _media_reference(block: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Replace a media block with a text reference to it"""
+    for media_type in MEDIA_TYPES:
+        if media_type in block:
+            media = block[media_type]
+            size = len(media.get("source", {}).get("bytes", b""))
+            name = media.get("name") or media.get("format", "")
+            return {"text": f"[{media_type} {name} ({size} bytes) was removed from the conversation history]"}
+    return None
+
+
+def _truncate_tool_result(block: Dict[str, Any], max_chars: int) -> Optional[Dict[str, Any]]:
+    """Truncate the content of a tool result, or None if it is short enough"""
+    tool_result = block["toolResult"]
+    content = []
+    truncated = False
+    for b in tool_result.get("content", []):
+        text = b.get("text")
+        if text is None and "json" in b:
+            text = json.dumps(b["json"], ensure_ascii=False)
+        if text is not None and len(text) > max_chars:
+            b = {"text": f"{text[:max_chars]}\n... [{len(text) - max_chars} characters were removed from the conversation history]"}
+            truncated = True
+        elif _media_reference(b) is not None:
+            b = _media_reference(b)
+            truncated = True
+        content.append(b)
+    return {"toolResult": {**tool_result, "content": content}} if truncated else None
+
+
+class CompactionReport:
+    """What history compaction removed from a request"""
+
+    def __init__(self, tokens_before: int):
+        self.tokens_before = tokens_before
+        self.tokens_after = tokens_before
+        self.truncated_tool_results = 0
+        self.replaced_media = 0
+        self.dropped_messages = 0
+        self.summarized = False
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "tokens_before": self.tokens_before,
+            "tokens_after": self.tokens_after,
+            "truncated_tool_results": self.truncated_tool_results,
+            "replaced_media": self.replaced_media,
+            "dropped_messages": self.dropped_messages,
+            "summarized": self.summarized,
+        }
+
+
+class HistoryManager:
+    """Keeps the conversation history sent to the model within a token budget
+
+    Clients resend the whole history on every turn. Once its estimated size
+    exceeds the budget, the turns before the last HISTORY_KEEP_TURNS are
+    compacted step by step until it fits: tool results are truncated, media is
+    replaced with references, and finally the oldest turns are dropped (or
+    summarized when a summarizer is given). Whole turns are dropped, so every
+    toolUse keeps its toolResult.
+    """
+
+    def __init__(
+        self,
+        token_budget: int = HISTORY_TOKEN_BUDGET,
+        keep_turns: int = HISTORY_KEEP_TURNS,
+        tool_result_max_chars: int = HISTORY_TOOL_RESULT_MAX_CHARS,
+    ):
+        self.token_budget = token_budget
+        self.keep_turns = keep_turns
+        self.tool_result_max_chars = tool_result_max_chars
+        self._summaries: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.compacted_requests = 0
+        self.removed_tokens = 0
+
+    def compact(
+        self,
+        messages: List[Dict[str, Any]],
+        summarize: Optional[Callable[[List[Dict[str, Any]]], str]] = None,
+    ) -> Tuple[List[Dict[str, Any]], Optional[CompactionReport]]:
+        """Compact the history if it exceeds the budget
+
+        Returns the messages to send and a report, or None if the history fits.
+        """
+        if self.token_budget <= 0 or not messages or not isinstance(messages[0], dict):
+            return messages, None
+
+        tokens = [estimate_message_tokens(m) for m in messages]
+        report = CompactionReport(sum(tokens))
+        if report.tokens_before <= self.token_budget:
+            return messages, None
+
+        turn_starts = [i for i, m in enumerate(messages) if _is_turn_start(m)]
+        if not self.keep_turns:
+            protected_from = len(messages)
+        elif len(turn_starts) >= self.keep_turns:
+            protected_from = turn_starts[-self.keep_turns]
+        else:
+            protected_from = 0
+        messages = list(messages)
+
+        # Truncate tool results and replace media in old turns
+        for i in range(protected_from):
+            content = []
+            changed = False
+            for block in messages[i].get("content", []):
+                if "toolResult" in block:
+                    truncated = _truncate_tool_result(block, self.tool_result_max_chars)
+                    if truncated is not None:
+                        block = truncated
+                        changed = True
+                        report.truncated_tool_results += 1
+                else:
+                    reference = _media_reference(block)
+                    if reference is not None:
+                        block = reference
+                        changed = True
+                        report.replaced_media += 1
+                content.append(block)
+            if changed:
+                messages[i] = {**messages[i], "content": content}
+                tokens[i] = estimate_message_tokens(messages[i])
+
+        # Drop (or summarize) the oldest turns
+        if sum(tokens) > self.token_budget:
+            candidates = [i for i in turn_starts if 0 < i < protected_from] + [protected_from]
+            drop_until = next(
+                (i for i in candidates if sum(tokens[i:]) <= self.token_budget), protected_from
+            )
+
+            if drop_until > 0:
+                dropped, messages, tokens = messages[:drop_until], messages[drop_until:], tokens[drop_until:]
+                report.dropped_messages = len(dropped)
+                summary = self._summarize(dropped, summarize) if summarize is not None else None
+                if summary:
+                    summary_block = {"text": f"Summary of the earlier conversation:\n{summary}"}
+                    if messages:
+                        messages[0] = {**messages[0], "content": [summary_block, *messages[0]["content"]]}
+                        tokens[0] = estimate_message_tokens(messages[0])
+                    else:
+                        # Keep the roles alternating before the new prompt
+                        messages = [
+                            {"role": "user", "content": [summary_block]},
+                            {"role": "assistant", "content": [{"text": "Understood."}]},
+                        ]
+                        tokens = [estimate_message_tokens(m) for m in messages]
+                    report.summarized = True
+
+        report.tokens_after = sum(tokens)
+        with self._lock:
+            self.compacted_requests += 1
+            self.removed_tokens += report.tokens_before - report.tokens_after
+        return messages, report
+
+    def _summarize(
+        self,
+        messages: List[Dict[str, Any]],
+        summarize: Callable[[List[Dict[str, Any]]], str],
+    ) -> Optional[str]:
+        """Summarize dropped turns, reusing the summary of the same turns"""
+        key = hashlib.blake2b(
+            json.dumps(messages, ensure_ascii=False, default=repr).encode(), digest_size=16
+        ).hexdigest()
+        with self._lock:
+            summary = self._summaries.get(key)
+            if summary is not None:
+                self._summaries.move_to_end(key)
+                return summary
+
+        try:
+            summary = summarize(messages)
+        except Exception as e:
+            logger.warning(f"Failed to summarize conversation history: {e}")
+            return None
+
+        with self._lock:
+            self._summaries[key] = summary
+            while len(self._summaries) > _SUMMARY_CACHE_MAX_SIZE:
+                self._summaries.popitem(last=False)
+        return summary
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "token_budget": self.token_budget or None,
+                "compacted_requests": self.compacted_requests,
+                "removed_tokens": self.removed_tokens,
+                "cached_summaries": len(self._summaries),
+            }
+
+
+def transcript(messages: List[Dict[str, Any]]) -> str:
+    """Render messages as plain text for summarization"""
+    lines = []
+    for message in messages:
+        for block in message.get("content", []):
+            if "text" in block:
+                lines.append(f"{message['role']}: {block['text']}")
+            elif "toolUse" in block:
+                tool_use = block["toolUse"]
+                lines.append(f"{message['role']} used tool {tool_use.get('name')}: {json.dumps(tool_use.get('input'), ensure_ascii=False)}")
+            elif "toolResult" in block:
+                texts = [b.get("text", "") for b in block["toolResult"].get("content", [])]
+                lines.append(f"tool result: {' '.join(texts)[:HISTORY_TOOL_RESULT_MAX_CHARS]}")
+    return "\n".join(lines)
+
+
+def summarize_with_model(model: Any, messages: List[Dict[str, Any]]) -> str:
+    """Summarize messages with the BedrockModel of the request"""
+    response = model.client.converse(
+        modelId=model.config["model_id"],
+        system=[{"text": SUMMARY_SYSTEM_PROMPT}],
+        messages=[{"role": "user", "content": [{"text": transcript(messages)}]}],
+    )
+    return "".join(b.get("text", "") for b in response["output"]["message"]["content"])
@@ -0,0 +1,446 @@
+"""Managed pool of stdio MCP servers for the agent core runtime."""
+
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from strands.tools.mcp import MCPClient
+from strands.types.tools import AgentTool, ToolGenerator, ToolSpec, ToolUse
+from mcp import stdio_client, StdioServerParameters
+from typing import List, Dict, Optional, Any
+from .config import (
+    MCP_SERVER_STARTUP_TIMEOUT,
+    MCP_HEALTH_CHECK_INTERVAL,
+    MCP_HEALTH_CHECK_TIMEOUT,
+    MCP_RESTART_BACKOFF_BASE,
+    MCP_RESTART_BACKOFF_MAX,
+)
+from .schema_cache import MCPSchemaCache
+
+logger = logging.getLogger(__name__)
+
+
+def _run_with_timeout(func, timeout: float) -> Any:
+    """Run func in a daemon thread and wait at most timeout seconds
+
+    MCP calls on a dead server can block forever, so they must never hold up a
+    non-daemon thread or the process would not be able to exit.
+    """
+    result: Dict[str, Any] = {}
+
+    def target():
+        try:
+            result["value"] = func()
+        except Exception as e:
+            result["error"] = e
+
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    if thread.is_alive():
+        raise TimeoutError(f"did not finish within {timeout}s")
+    if "error" in result:
+        raise result["error"]
+    return result["value"]
+
+
+class MCPServerReplica:
+    """A single stdio subprocess of an MCP server
+
+    Only one start of a replica is in flight at a time. Stopping the replica
+    abandons the start in flight, whose client is stopped when it comes up
+    instead of replacing the client of a later start.
+    """
+
+    def __init__(self, server_name: str, index: int, server: Dict[str, Any], uv_env: Dict[str, str]):
+        self.server_name = server_name
+        self.index = index
+        self.server = server
+        self.uv_env = uv_env
+        self.client: Optional[MCPClient] = None
+        self.tools: Dict[str, AgentTool] = {}
+        self.healthy = False
+        self.in_flight = 0
+        self.restarts = 0
+        self.failures = 0
+        self.next_restart_at = 0.0
+        self.startup_seconds: Optional[float] = None
+        self.starting = False
+        self.start_deadline = 0.0
+        # Incremented by every start and stop, so a start knows whether it was abandoned
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def _create_client(self) -> MCPClient:
+        server = self.server
+        uv_env = self.uv_env
+        return MCPClient(
+            lambda: stdio_client(
+                StdioServerParameters(
+                    command=server["command"],
+                    args=server.get("args", []),
+                    env={**uv_env, **server.get("env", {})},
+                )
+            )
+        )
+
+    def start(self) -> List[AgentTool]:
+        """Spawn the subprocess, handshake and list its tools"""
+        with self._lock:
+            if self.starting:
+                raise RuntimeError(f"MCP server {self.name} is already starting")
+            self._generation += 1
+            generation = self._generation
+            self.starting = True
+            self.start_deadline = time.monotonic() + MCP_SERVER_STARTUP_TIMEOUT
+
+        started_at = time.perf_counter()
+        client = self._create_client()
+        try:
+            client.start()
+            tools = client.list_tools_sync()
+        except Exception:
+            with self._lock:
+                if generation == self._generation:
+                    self.starting = False
+            # A client that failed to initialize keeps its subprocess until stopped
+            self._stop_in_background(client)
+            raise
+
+        with self._lock:
+            abandoned = generation != self._generation
+            if not abandoned:
+                self.starting = False
+                self.client = client
+                self.tools = {t.tool_name: t for t in tools}
+                self.healthy = True
+                self.failures = 0
+                self.startup_seconds = round(time.perf_counter() - started_at, 3)
+        if abandoned:
+            self._stop_in_background(client)
+            raise RuntimeError(f"MCP server {self.name} started after its start was abandoned")
+        return tools
+
+    def stop(self):
+        """Stop the subprocess without waiting for a hung server, abandoning a start in flight"""
+        with self._lock:
+            self._generation += 1
+            self.starting = False
+            client = self.client
+            self.client = None
+            self.healthy = False
+        if client is not None:
+            self._stop_in_background(client)
+
+    def _stop_in_background(self, client: MCPClient):
+        threading.Thread(target=self._stop_client, args=(client,), daemon=True).start()
+
+    def _stop_client(self, client: MCPClient):
+        try:
+            client.stop(None, None, None)
+        except Exception as e:
+            logger.debug(f"Error stopping MCP client {self.name}: {e}")
+
+    def probe(self, timeout: float) -> bool:
+        """Check that the server still answers requests"""
+        client = self.client
+        if client is None:
+            return False
+        try:
+            _run_with_timeout(client.list_tools_sync, timeout)
+            return True
+        except Exception as e:
+            logger.warning(f"MCP server {self.name} failed liveness probe: {e!r}")
+            return False
+
+    @property
+    def name(self) -> str:
+        return f"{self.server_name}[{self.index}]"
+
+
+class ManagedMCPServer:
+    """An MCP server from mcp.json, run as one or more replicas
+
+    When its tool specs are in the schema cache, the server is lazy: agents are
+    built from the cached specs and the replicas only start on the first call of
+    one of its tools.
+    """
+
+    def __init__(
+        self,
+        server_name: str,
+        server: Dict[str, Any],
+        uv_env: Dict[str, str],
+        schema_cache: Optional[MCPSchemaCache] = None,
+    ):
+        self.name = server_name
+        self.server = server
+        replicas = max(int(server.get("replicas", 1)), 1)
+        self.replicas = [MCPServerReplica(server_name, i, server, uv_env) for i in range(replicas)]
+        self.schema_cache = schema_cache
+        # Tool specs discovered from the first replica that started (or read from the schema cache)
+        self.tool_specs: Dict[str, ToolSpec] = {}
+        self.lazy = False
+        self._cached_specs = False
+        self._lock = threading.Lock()
+        self._connect_lock = threading.Lock()
+
+    def load_cached_tool_specs(self) -> bool:
+        """Take the tool specs from the schema cache, making the server lazy if they are there"""
+        tool_specs = self.schema_cache.get(self.name, self.server) if self.schema_cache else None
+        if not tool_specs:
+            return False
+        with self._lock:
+            self.tool_specs = {spec["name"]: spec for spec in tool_specs}
+            self.lazy = True
+            self._cached_specs = True
+        return True
+
+    def start_replica(self, replica: MCPServerReplica):
+        """Start a replica and register its tool specs"""
+        tools = replica.start()
+        with self._lock:
+            if self._cached_specs:
+                # The first replica to start checks the specs read from the schema cache
+                self._cached_specs = False
+                discovered = {t.tool_name: t.tool_spec for t in tools}
+                if discovered != self.tool_specs:
+                    logger.info(f"Tool specs of MCP server {self.name} differ from the schema cache")
+                    self.tool_specs = discovered
+            else:
+                for t in tools:
+                    self.tool_specs.setdefault(t.tool_name, t.tool_spec)
+            tool_specs = list(self.tool_specs.values())
+        if self.schema_cache is not None:
+            self.schema_cache.put(self.name, self.server, tool_specs)
+        logger.info(f"Started MCP server {replica.name} with {len(tools)} tools in {replica.startup_seconds}s")
+
+    def connect(self):
+        """Start the replicas of a lazy server
+
+        Returns once the first replica is up; the others start in the background.
+        Concurrent first calls wait for the same start.
+        """
+        with self._connect_lock:
+            if not self.lazy:
+                return
+            first, *others = self.replicas
+            try:
+                _run_with_timeout(lambda: self.start_replica(first), MCP_SERVER_STARTUP_TIMEOUT)
+            except TimeoutError:
+                first.stop()
+                raise
+            finally:
+                # From now on, replicas that are down are restarted by the health checks
+                self.lazy = False
+            for replica in others:
+                threading.Thread(target=self._start_in_background, args=(replica,), daemon=True).start()
+
+    def _start_in_background(self, replica: MCPServerReplica):
+        try:
+            self.start_replica(replica)
+        except Exception as e:
+            logger.error(f"Error creating MCP client for {replica.name}: {e}")
+
+    def acquire(self, tool_name: str) -> Optional[MCPServerReplica]:
+        """Pick the least busy healthy replica that provides the tool"""
+        with self._lock:
+            candidates = [r for r in self.replicas if r.healthy and tool_name in r.tools]
+            if not candidates:
+                return None
+            replica = min(candidates, key=lambda r: r.in_flight)
+            replica.in_flight += 1
+            return replica
+
+    def release(self, replica: MCPServerReplica):
+        with self._lock:
+            replica.in_flight -= 1
+
+    def check_health(self):
+        """Probe every replica and restart the ones that are down"""
+        if self.lazy:
+            return
+        for replica in self.replicas:
+            if replica.starting:
+                if time.monotonic() < replica.start_deadline:
+                    continue
+                # A start from the pool or a lazy connect that hung is abandoned and retried
+                logger.warning(f"MCP server {replica.name} did not start within {MCP_SERVER_STARTUP_TIMEOUT}s")
+                replica.stop()
+            elif replica.healthy and replica.probe(MCP_HEALTH_CHECK_TIMEOUT):
+                continue
+
+            if replica.healthy:
+                replica.stop()
+            if time.monotonic() < replica.next_restart_at:
+                continue
+
+            try:
+                logger.info(f"Restarting MCP server {replica.name}")
+                replica.restarts += 1
+                try:
+                    _run_with_timeout(lambda: self.start_replica(replica), MCP_SERVER_STARTUP_TIMEOUT)
+                except TimeoutError:
+                    # The start keeps running in its thread, and stops its client if it ever comes up
+                    replica.stop()
+                    raise
+            except Exception as e:
+                replica.failures += 1
+                backoff = min(MCP_RESTART_BACKOFF_BASE * 2 ** (replica.failures - 1), MCP_RESTART_BACKOFF_MAX)
+                replica.next_restart_at = time.monotonic() + backoff
+                logger.error(f"Error restarting MCP server {replica.name}, retrying in {backoff}s: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "lazy": self.lazy,
+            "replicas": [
+                {
+                    "healthy": r.healthy,
+                    "in_flight": r.in_flight,
+                    "restarts": r.restarts,
+                    "startup_seconds": r.startup_seconds,
+                }
+                for r in self.replicas
+            ]
+        }
+
+
+class PooledMCPTool(AgentTool):
+    """Agent tool that dispatches each call to the least busy replica of its server
+
+    The tool stays valid across server restarts because the replica is looked up
+    at call time instead of being bound when the agent is created.
+    """
+
+    def __init__(self, server: ManagedMCPServer, tool_name: str):
+        super().__init__()
+        self.server = server
+        self._tool_name = tool_name
+        # Used if the tool disappears when the server reconnects with other tools
+        self._tool_spec = server.tool_specs[tool_name]
+
+    @property
+    def tool_name(self) -> str:
+        return self._tool_name
+
+    @property
+    def tool_spec(self) -> ToolSpec:
+        return self.server.tool_specs.get(self._tool_name, self._tool_spec)
+
+    @property
+    def tool_type(self) -> str:
+        return "python"
+
+    async def stream(self, tool_use: ToolUse, invocation_state: Dict[str, Any], **kwargs: Any) -> ToolGenerator:
+        if self.server.lazy:
+            try:
+                await asyncio.to_thread(self.server.connect)
+            except Exception as e:
+                logger.error(f"Error creating MCP client for {self.server.name}: {e}")
+
+        replica = self.server.acquire(self._tool_name)
+        if replica is None:
+            yield {
+                "toolUseId": tool_use["toolUseId"],
+                "status": "error",
+                "content": [{"text": f"MCP server {self.server.name} is not available. Please try again later."}],
+            }
+            return
+
+        try:
+            async for event in replica.tools[self._tool_name].stream(tool_use, invocation_state, **kwargs):
+                yield event
+        finally:
+            self.server.release(replica)
+
+
+class MCPServerPool:
+    """Starts the MCP servers in mcp.json and keeps them running"""
+
+    def __init__(
+        self,
+        mcp_servers: Dict[str, Dict[str, Any]],
+        uv_env: Dict[str, str],
+        schema_cache: Optional[MCPSchemaCache] = None,
+    ):
+        self.servers = {
+            server_name: ManagedMCPServer(server_name, server, uv_env, schema_cache)
+            for server_name, server in mcp_servers.items()
+        }
+        self._stop_event = threading.Event()
+        self._health_thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """Start all replicas concurrently, waiting at most MCP_SERVER_STARTUP_TIMEOUT
+
+        Replicas that are still starting after the timeout keep starting in the
+        background and their tools become available once they are up, until the
+        health checks abandon and restart them. Servers
+        whose tool specs are in the schema cache are not started until needed.
+        """
+        replicas = [
+            (s, r) for s in self.servers.values() if not s.load_cached_tool_specs() for r in s.replicas
+        ]
+        if not replicas:
+            return
+
+        executor = ThreadPoolExecutor(max_workers=len(replicas), thread_name_prefix="mcp-startup")
+        try:
+            futures = [(r, executor.submit(s.start_replica, r)) for s, r in replicas]
+            deadline = time.monotonic() + MCP_SERVER_STARTUP_TIMEOUT
+
+            for replica, future in futures:
+                try:
+                    future.result(timeout=max(0, deadline - time.monotonic()))
+                except FutureTimeoutError:
+                    logger.error(
+                        f"MCP server {replica.name} did not start within {MCP_SERVER_STARTUP_TIMEOUT}s"
+                    )
+                except Exception as e:
+                    logger.error(f"Error creating MCP client for {replica.name}: {e}")
+        finally:
+            # Do not block on servers that timed out
+            executor.shutdown(wait=False)
+
+    def start_health_checks(self):
+        """Start the background thread that probes and restarts servers"""
+        if MCP_HEALTH_CHECK_INTERVAL <= 0 or self._health_thread is not None:
+            return
+        self._health_thread = threading.Thread(
+            target=self._health_check_loop, name="mcp-health-check", daemon=True
+        )
+        self._health_thread.start()
+
+    def _health_check_loop(self):
+        while not self._stop_event.wait(MCP_HEALTH_CHECK_INTERVAL):
+            for server in self.servers.values():
+                try:
+                    server.check_health()
+                except Exception as e:
+                    logger.error(f"Error checking health of MCP server {server.name}: {e}")
+
+    def stop(self):
+        self._stop_event.set()
+        for server in self.servers.values():
+            for replica in server.replicas:
+                replica.stop()
+
+    def get_tools(self) -> List[AgentTool]:
+        """Get pooled tools of every server whose tools have been discovered"""
+        return [
+            PooledMCPTool(server, tool_name)
+            for server in self.servers.values()
+            for tool_name in list(server.tool_specs)
+        ]
+
+    def get_startup_timings(self) -> Dict[str, Optional[float]]:
+        """Get the startup time of the slowest replica of each server"""
+        timings = {}
+        for server in self.servers.values():
+            seconds = [r.startup_seconds for r in server.replicas if r.startup_seconds is not None]
+            timings[server.name] = max(seconds) if seconds else None
+        return timings
+
+    def stats(self) -> Dict[str, Any]:
+        return {name: server.stats() for name, server in self.servers.items()}
@@ -0,0 +1,155 @@
+"""Latency and payload metrics for the agent core runtime."""
+
+import logging
+import re
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Iterator, List, Dict, Tuple, Optional, Any
+
+logger = logging.getLogger(__name__)
+
+# Import OpenTelemetry API (optional, installed with aws-opentelemetry-distro)
+try:
+    from opentelemetry import trace
+    tracer = trace.get_tracer(__name__)
+    OTEL_AVAILABLE = True
+except ImportError:
+    OTEL_AVAILABLE = False
+
+METRIC_PREFIX = "agentcore"
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+BYTES_BUCKETS = (1024, 10 * 1024, 100 * 1024, 1024 ** 2, 10 * 1024 ** 2, 100 * 1024 ** 2)
+
+_INVALID_NAME_CHARS = re.compile(r"[^a-zA-Z0-9_]")
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    """Prometheus histogram with labels"""
+
+    def __init__(self, name: str, description: str, buckets: Tuple[float, ...]):
+        self.name = name
+        self.description = description
+        self.buckets = buckets
+        # Per label set: the count of each bucket, and [sum, count]
+        self._series: Dict[LabelKey, Tuple[List[int], List[float]]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, labels: Dict[str, str]):
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = ([0] * len(self.buckets), [0.0, 0])
+                self._series[key] = series
+            counts, total = series
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            total[0] += value
+            total[1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {key: (list(counts), list(total)) for key, (counts, total) in self._series.items()}
+        for key, (counts, (total, count)) in sorted(series.items()):
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append(f"{self.name}_bucket{_format_labels(key, le=_format_value(bound))} {bucket_count}")
+            lines.append(f"{self.name}_bucket{_format_labels(key, le='+Inf')} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _format_labels(key: LabelKey, **extra: str) -> str:
+    items = list(key) + list(extra.items())
+    if not items:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in items)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(items, escaped)) + "}"
+
+
+class Metrics:
+    """Histograms of the phases of request processing and of payload sizes"""
+
+    def __init__(self):
+        self._histograms: Dict[str, Histogram] = {}
+        self._lock = threading.Lock()
+
+    def _get_histogram(self, name: str, description: str, buckets: Tuple[float, ...]) -> Histogram:
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = Histogram(f"{METRIC_PREFIX}_{name}", description, buckets)
+                self._histograms[name] = histogram
+            return histogram
+
+    def observe_seconds(self, phase: str, seconds: float, **labels: str):
+        """Record the duration of a phase"""
+        self._get_histogram(
+            f"{phase}_seconds", f"Duration of {phase.replace('_', ' ')} in seconds", SECONDS_BUCKETS
+        ).observe(seconds, labels)
+
+    def observe_bytes(self, payload: str, size: int, **labels: str):
+        """Record the size of a payload"""
+        self._get_histogram(
+            f"{payload}_bytes", f"Size of {payload.replace('_', ' ')} in bytes", BYTES_BUCKETS
+        ).observe(size, labels)
+
+    @contextmanager
+    def phase(self, name: str, **labels: str) -> Iterator[None]:
+        """Time a phase as a histogram observation and, with OpenTelemetry, a span"""
+        span = (
+            tracer.start_as_current_span(
+                f"{METRIC_PREFIX}.{name}", attributes={f"{METRIC_PREFIX}.{k}": str(v) for k, v in labels.items()}
+            )
+            if OTEL_AVAILABLE
+            else nullcontext()
+        )
+        started_at = time.perf_counter()
+        with span:
+            try:
+                yield
+            finally:
+                self.observe_seconds(name, time.perf_counter() - started_at, **labels)
+
+    def render(self, stats: Optional[Dict[str, Any]] = None) -> str:
+        """Render the histograms, and the numbers in stats as gauges, in Prometheus text format"""
+        lines = []
+        with self._lock:
+            histograms = list(self._histograms.values())
+        for histogram in histograms:
+            lines.extend(histogram.render())
+        for name, value in _flatten(stats or {}, METRIC_PREFIX):
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def _flatten(stats: Dict[str, Any], prefix: str) -> Iterator[Tuple[str, float]]:
+    """Flatten nested stats into metric names and numbers (other values are skipped)"""
+    for key, value in stats.items():
+        name = f"{prefix}_{_INVALID_NAME_CHARS.sub('_', str(key))}"
+        if isinstance(value, dict):
+            yield from _flatten(value, name)
+        elif isinstance(value, bool):
+            yield name, int(value)
+        elif isinstance(value, (int, float)):
+            yield name, value
+
+
+def set_span_attribute(name: str, value: Any):
+    """Set an attribute on the current OpenTelemetry span, if any"""
+    if OTEL_AVAILABLE:
+        trace.get_current_span().set_attribute(f"{METRIC_PREFIX}.{name}", value)
+
+
+metrics = Metrics()
@@ -0,0 +1,145 @@
+"""Request body parsing for the agent core runtime."""
+
+import json
+import logging
+import re
+import threading
+import time
+from fastapi import Request
+from typing import Dict, Any
+from .config import MAX_REQUEST_BODY_MB, STREAMING_REQUEST_PARSE
+from .utils import decode_base64_string
+
+logger = logging.getLogger(__name__)
+
+# Import incremental JSON parser (optional)
+try:
+    import ijson
+    from ijson.common import ObjectBuilder
+    IJSON_AVAILABLE = True
+except ImportError:
+    IJSON_AVAILABLE = False
+    if STREAMING_REQUEST_PARSE:
+        logger.warning("ijson is not installed, request bodies are parsed in one go")
+
+# Base64 payload of an image, document or video block of the content of a message or
+# of the prompt, the blocks process_messages and process_prompt convert. Media nested
+# in tool uses and tool results is left as text, as with json.loads.
+_MEDIA_BYTES_PREFIX = re.compile(r"^(messages\.item\.content|prompt)\.item\.(image|document|video)\.source\.bytes$")
+
+
+class RequestTooLargeError(Exception):
+    """Raised when the request body exceeds MAX_REQUEST_BODY_MB"""
+
+
+class _BodyReader:
+    """File-like async reader over the request body stream that enforces the size limit"""
+
+    def __init__(self, request: Request, max_bytes: int):
+        self._stream = request.stream()
+        self._max_bytes = max_bytes
+        self._pending = b""
+        self.size = 0
+
+    async def _next_chunk(self) -> bytes:
+        async for chunk in self._stream:
+            if not chunk:
+                continue
+            self.size += len(chunk)
+            if self.size > self._max_bytes:
+                raise RequestTooLargeError(
+                    f"Request body exceeds the limit of {self._max_bytes} bytes"
+                )
+            return chunk
+        return b""
+
+    async def read(self, size: int = -1) -> bytes:
+        if not self._pending:
+            self._pending = await self._next_chunk()
+        if size < 0 or size >= len(self._pending):
+            data, self._pending = self._pending, b""
+        else:
+            data, self._pending = self._pending[:size], self._pending[size:]
+        return data
+
+    async def read_all(self) -> bytearray:
+        body = bytearray(self._pending)
+        self._pending = b""
+        while chunk := await self._next_chunk():
+            body += chunk
+        return body
+
+
+class ParseStats:
+    """Counters of request body parsing"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.bytes = 0
+        self.seconds = 0.0
+        self.rejected = 0
+
+    def record(self, size: int, seconds: float):
+        with self._lock:
+            self.requests += 1
+            self.bytes += size
+            self.seconds += seconds
+
+    def record_rejected(self):
+        with self._lock:
+            self.rejected += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "bytes": self.bytes,
+                "seconds": round(self.seconds, 3),
+                "rejected": self.rejected,
+            }
+
+
+parse_stats = ParseStats()
+
+
+async def _parse_incrementally(reader: _BodyReader) -> Any:
+    """Build the request object while the body streams in
+
+    Media payloads are decoded as soon as they are parsed, so the base64 text is
+    released right away instead of being kept alongside the decoded bytes.
+    """
+    builder = ObjectBuilder()
+    async for prefix, event, value in ijson.parse_async(reader, use_float=True):
+        if event == "string" and _MEDIA_BYTES_PREFIX.match(prefix):
+            value = decode_base64_string(value)
+        builder.event(event, value)
+    return builder.value
+
+
+async def parse_request_body(request: Request) -> Dict[str, Any]:
+    """Read and parse the JSON request body within the MAX_REQUEST_BODY_MB limit"""
+    started_at = time.perf_counter()
+    max_bytes = MAX_REQUEST_BODY_MB * 1024 * 1024
+
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > max_bytes:
+        parse_stats.record_rejected()
+        raise RequestTooLargeError(f"Request body exceeds the limit of {max_bytes} bytes")
+
+    reader = _BodyReader(request, max_bytes)
+    try:
+        if STREAMING_REQUEST_PARSE and IJSON_AVAILABLE:
+            request_data = await _parse_incrementally(reader)
+        else:
+            # json.loads decodes the body to a str before parsing it, so the body is held twice
+            # (and media payloads a third time once decoded) until STREAMING_REQUEST_PARSE is on
+            request_data = json.loads(await reader.read_all())
+    except RequestTooLargeError:
+        parse_stats.record_rejected()
+        raise
+
+    elapsed = time.perf_counter() - started_at
+    parse_stats.record(reader.size, elapsed)
+    logger.info(f"Parsed request body of {reader.size} bytes in {elapsed:.3f}s")
+    return request_data
@@ -0,0 +1,159 @@
+"""Prompt caching for the agent core runtime."""
+
+import logging
+import re
+import threading
+from strands.models import BedrockModel
+from strands.types.content import Messages
+from strands.types.tools import ToolSpec
+from typing import List, Dict, Optional, Any
+
+logger = logging.getLogger(__name__)
+
+# Prompt caching (same as SUPPORTED_CACHE_FIELDS in packages/common)
+# https://docs.aws.amazon.com/bedrock/latest/userguide/prompt-caching.html
+SUPPORTED_CACHE_FIELDS: Dict[str, List[str]] = {
+    "anthropic.claude-opus-4-1-20250805-v1:0": ["messages", "system", "tools"],
+    "anthropic.claude-opus-4-20250514-v1:0": ["messages", "system", "tools"],
+    "anthropic.claude-sonnet-4-20250514-v1:0": ["messages", "system", "tools"],
+    "anthropic.claude-3-7-sonnet-20250219-v1:0": ["messages", "system", "tools"],
+    "anthropic.claude-3-5-haiku-20241022-v1:0": ["messages", "system", "tools"],
+    "amazon.nova-premier-v1:0": ["messages", "system"],
+    "amazon.nova-pro-v1:0": ["messages", "system"],
+    "amazon.nova-lite-v1:0": ["messages", "system"],
+    "amazon.nova-micro-v1:0": ["messages", "system"],
+}
+
+# Fields of models missing from the table above, by model family, so a newly released
+# model keeps its prompt caching until the table catches up
+FAMILY_CACHE_FIELDS = (
+    ("anthropic.claude-", ["messages", "system", "tools"]),
+    ("amazon.nova-", ["messages", "system"]),
+)
+
+CRI_PREFIX_PATTERN = re.compile(r"^(us|eu|apac)\.")
+
+CACHE_POINT = {"cachePoint": {"type": "default"}}
+
+
+def get_supported_cache_fields(model_id: str) -> List[str]:
+    """Get the request fields the model can cache"""
+    # Remove CRI prefix
+    base_model_id = CRI_PREFIX_PATTERN.sub("", model_id)
+    cache_fields = SUPPORTED_CACHE_FIELDS.get(base_model_id)
+    if cache_fields is None:
+        cache_fields = next((f for prefix, f in FAMILY_CACHE_FIELDS if base_model_id.startswith(prefix)), [])
+    return cache_fields
+
+
+def apply_auto_cache_to_messages(messages: Messages, cache_fields: List[str]) -> Messages:
+    """Place cache points on the last two user messages (for cache read and write respectively)
+
+    Messages are copied instead of modified, so the agent's history never keeps
+    cache points from earlier model calls. Cache points sent by the client are
+    dropped, so the request never exceeds the cache point limit.
+    """
+    if "messages" not in cache_fields or not messages:
+        return messages
+
+    is_tools_supported = "tools" in cache_fields
+    cachable_indices = [
+        index
+        for index, message in enumerate(messages)
+        if message["role"] == "user"
+        # For Amazon Nova, placing cachePoint after toolResult is not supported
+        and (is_tools_supported or not any("toolResult" in block for block in message["content"]))
+    ][-2:]
+
+    cached_messages = []
+    for index, message in enumerate(messages):
+        content = message["content"]
+        has_cache_point = any("cachePoint" in block for block in content)
+        if index in cachable_indices:
+            content = [block for block in content if "cachePoint" not in block] + [CACHE_POINT]
+        elif has_cache_point:
+            content = [block for block in content if "cachePoint" not in block]
+        else:
+            cached_messages.append(message)
+            continue
+        cached_messages.append({**message, "content": content})
+    return cached_messages
+
+
+class PromptCachingBedrockModel(BedrockModel):
+    """BedrockModel that caches every field of the request the model supports
+
+    The tools get a cache point from BedrockModel itself, and the conversation
+    gets them on each model call, so the tool loop of a request reads the
+    history written by the previous call. The last line of the system prompt
+    is specific to the session (its workspace directory), so the cache point
+    of the system prompt goes before it, and sessions share the cached prefix.
+
+    The system prompt of strands is a single string, so the request is adjusted
+    in format_request, an internal of BedrockModel whose version is pinned in
+    pyproject.toml.
+    """
+
+    def __init__(self, model_id: str, **kwargs: Any):
+        self.cache_fields = get_supported_cache_fields(model_id)
+        super().__init__(
+            model_id=model_id,
+            cache_prompt="default" if "system" in self.cache_fields else None,
+            cache_tools="default" if "tools" in self.cache_fields else None,
+            **kwargs,
+        )
+
+    def format_request(
+        self,
+        messages: Messages,
+        tool_specs: Optional[List[ToolSpec]] = None,
+        system_prompt: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        messages = apply_auto_cache_to_messages(messages, self.cache_fields)
+        request = super().format_request(messages, tool_specs, system_prompt)
+        if "system" in self.cache_fields and system_prompt and "\n" in system_prompt:
+            shared, _, session = system_prompt.rpartition("\n")
+            request["system"] = [{"text": shared}, CACHE_POINT, {"text": session}]
+        return request
+
+
+class TokenUsage:
+    """Token usage of the model calls of a request, from metadata events"""
+
+    FIELDS = ("inputTokens", "outputTokens", "cacheReadInputTokens", "cacheWriteInputTokens")
+
+    def __init__(self):
+        self.tokens = {field: 0 for field in self.FIELDS}
+        self.model_calls = 0
+
+    def add_event(self, event: Dict[str, Any]):
+        usage = event.get("event", {}).get("metadata", {}).get("usage")
+        if usage:
+            self.model_calls += 1
+            for field in self.FIELDS:
+                self.tokens[field] += usage.get(field, 0)
+
+
+class PromptCacheStats:
+    """Token usage totals across requests"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.tokens = {field: 0 for field in TokenUsage.FIELDS}
+
+    def record(self, usage: TokenUsage):
+        with self._lock:
+            self.requests += 1
+            for field, count in usage.tokens.items():
+                self.tokens[field] += count
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            cached = self.tokens["cacheReadInputTokens"]
+            total_input = self.tokens["inputTokens"] + cached + self.tokens["cacheWriteInputTokens"]
+            return {
+                "requests": self.requests,
+                **self.tokens,
+                "cache_hit_ratio": round(cached / total_input, 3) if total_input else None,
+            }
@@ -0,0 +1,501 @@
+"""Routing of Bedrock model calls across regions for the agent core runtime."""
+
+import asyncio
+import logging
+import random
+import threading
+import time
+from botocore.config import Config as BotocoreConfig
+from botocore.exceptions import ClientError, ConnectionError as BotocoreConnectionError, HTTPClientError
+from strands.models import Model
+from strands.types.content import Messages
+from strands.types.exceptions import ModelThrottledException
+from strands.types.streaming import StreamEvent
+from strands.types.tools import ToolSpec
+from typing import List, Dict, Set, Tuple, Optional, Any, AsyncGenerator, Callable
+from .config import (
+    BEDROCK_FAILOVER_REGIONS,
+    BEDROCK_MAX_RETRIES,
+    BEDROCK_RETRY_BASE_DELAY,
+    BEDROCK_RETRY_MAX_DELAY,
+    BEDROCK_RETRY_BUDGET,
+    BEDROCK_HEDGE_AFTER_MS,
+    BEDROCK_CIRCUIT_FAILURES,
+    BEDROCK_CIRCUIT_COOLDOWN,
+)
+from .clients import BedrockModelPool, model_stream_owner
+from .context import find_request_context
+from .metrics import metrics
+from .prompt_cache import CRI_PREFIX_PATTERN, PromptCachingBedrockModel
+
+logger = logging.getLogger(__name__)
+
+# Error codes of calls that may succeed when made again, possibly in another region
+RETRYABLE_ERROR_CODES = frozenset({
+    "ThrottlingException",
+    "TooManyRequestsException",
+    "ServiceUnavailableException",
+    "InternalServerException",
+    "ModelNotReadyException",
+    "ModelTimeoutException",
+})
+
+# Cross-region inference profile of the regions of each prefix
+_GEOGRAPHIES = (("us-", "us"), ("eu-", "eu"), ("ap-", "apac"))
+
+# Retry budget tokens refilled by each successful call
+_RETRY_REFILL = 0.1
+
+# Model ID and region
+Route = Tuple[str, str]
+
+# Posted by an attempt once its stream has ended
+_END = object()
+
+
+class ModelCallFailedError(Exception):
+    """Raised when a model call failed in every region it was tried in"""
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Whether a model call that failed with the error may succeed when made again"""
+    # strands raises ModelThrottledException for ThrottlingException
+    if isinstance(error, ModelThrottledException):
+        return True
+    if isinstance(error, ClientError):
+        return error.response.get("Error", {}).get("Code") in RETRYABLE_ERROR_CODES
+    return isinstance(error, (BotocoreConnectionError, HTTPClientError))
+
+
+def route_model_id(model_id: str, region: str) -> str:
+    """Get the model ID to call in a region, switching a cross-region inference profile to its geography"""
+    match = CRI_PREFIX_PATTERN.match(model_id)
+    geography = next((g for prefix, g in _GEOGRAPHIES if region.startswith(prefix)), None)
+    if match is None or geography is None:
+        return model_id
+    return f"{geography}.{model_id[match.end():]}"
+
+
+def _route_name(route: Route) -> str:
+    return f"{route[0]}@{route[1]}"
+
+
+class CircuitBreaker:
+    """Skips a route after consecutive failures, until a probe call succeeds again
+
+    After failures consecutive failures the circuit opens, and calls go to the
+    other routes. Once cooldown seconds have passed, a single call is let
+    through (half-open): its success closes the circuit, and its failure opens
+    it again for another cooldown.
+    """
+
+    def __init__(self, failures: int, cooldown: float):
+        self.failures = failures
+        self.cooldown = cooldown
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self.probing = False
+        self.opens = 0
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if self.probing else "open"
+
+    def allow(self) -> bool:
+        """Whether a call may be made, letting a single probe through once the cooldown has passed"""
+        if self.opened_at is None:
+            return True
+        if self.probing or time.monotonic() - self.opened_at < self.cooldown:
+            return False
+        self.probing = True
+        return True
+
+    def record_success(self):
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        if self.probing or (self.opened_at is None and self.consecutive_failures >= self.failures > 0):
+            self.opened_at = time.monotonic()
+            self.opens += 1
+        self.probing = False
+
+    def release(self):
+        """Forget a probe that was abandoned before it succeeded or failed"""
+        self.probing = False
+
+
+class ModelCallAttempt:
+    """A call of a model on one route, whose stream is closed if another call answers first"""
+
+    def __init__(self, route: Route, hedge: bool):
+        self.route = route
+        self.hedge = hedge
+        self.started_at = time.perf_counter()
+        self.cancelled = False
+        self._stream: Optional[Any] = None
+        self._lock = threading.Lock()
+
+    @property
+    def stream(self) -> Optional[Any]:
+        return self._stream
+
+    def track_model_stream(self, stream: Any):
+        """Register the response stream of the call (from the ConverseStream hook)"""
+        with self._lock:
+            if not self.cancelled:
+                self._stream = stream
+                return
+        stream.close()
+
+    def cancel(self):
+        """Close the stream of the call (blocks until a read of it in progress returns)"""
+        with self._lock:
+            self.cancelled = True
+            stream, self._stream = self._stream, None
+        if stream is not None:
+            try:
+                stream.close()
+            except Exception as e:
+                logger.warning(f"Error closing model stream of {_route_name(self.route)}: {e}")
+
+
+class BedrockRouter:
+    """Retries, hedging and regional failover of Bedrock model calls
+
+    A call is made on the region of the request first. A call that fails
+    before its first event with a retryable error (throttling, 5xx, timeouts)
+    fails over at once to the next failover region it was not made on. Once it
+    failed on every region, it is retried after a full-jitter exponential
+    backoff, up to max_retries times. Each retry spends a token of the retry
+    budget, which successful calls refill by a tenth of a token, so retries stop
+    when most calls fail instead of adding to the overload.
+
+    When the first event of a call takes longer than hedge_after seconds, a
+    second call is made on the next region, and the first of the two to answer
+    is kept while the other is closed. Every route has a circuit breaker, and
+    routes whose circuit is open are skipped (unless every route is open).
+
+    Once the regions and retries are spent, every error (throttling included)
+    is raised as ModelCallFailedError. The event loop of strands retries
+    ModelThrottledException with a blocking sleep on the event loop thread, and
+    each of its retries would go through every region and retry again, so all
+    backoff stays here.
+    """
+
+    def __init__(
+        self,
+        failover_regions: List[str] = BEDROCK_FAILOVER_REGIONS,
+        max_retries: int = BEDROCK_MAX_RETRIES,
+        retry_base_delay: float = BEDROCK_RETRY_BASE_DELAY,
+        retry_max_delay: float = BEDROCK_RETRY_MAX_DELAY,
+        retry_budget: int = BEDROCK_RETRY_BUDGET,
+        hedge_after_ms: float = BEDROCK_HEDGE_AFTER_MS,
+        circuit_failures: int = BEDROCK_CIRCUIT_FAILURES,
+        circuit_cooldown: float = BEDROCK_CIRCUIT_COOLDOWN,
+    ):
+        self.failover_regions = failover_regions
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self.retry_budget = retry_budget
+        self.hedge_after = hedge_after_ms / 1000
+        self.circuit_failures = circuit_failures
+        self.circuit_cooldown = circuit_cooldown
+        self._retry_tokens = float(retry_budget)
+        self._breakers: Dict[Route, CircuitBreaker] = {}
+        self._route_stats: Dict[Route, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.retries = 0
+        self.retries_denied = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.failovers = 0
+        self.failed_calls = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.failover_regions) or self.max_retries > 0 or self.hedge_after > 0
+
+    @property
+    def client_config(self) -> Optional[BotocoreConfig]:
+        """Client config of the models, without retries of botocore when calls are routed"""
+        if not self.enabled:
+            return None
+        return BotocoreConfig(retries={"mode": "standard", "total_max_attempts": 1})
+
+    def get_model(self, model_pool: BedrockModelPool, model_id: str, region: str) -> Model:
+        """Get the model of a request, routed when retries, hedging or failover regions are configured"""
+        if not self.enabled:
+            return model_pool.get_model(model_id=model_id, region=region)
+        routes = [(model_id, region)] + [
+            (route_model_id(model_id, r), r) for r in self.failover_regions if r != region
+        ]
+        return RoutedBedrockModel(self, model_pool, routes)
+
+    def choose_route(self, routes: List[Route], exclude: Set[Route]) -> Route:
+        """Get the first route not tried yet whose circuit allows a call
+
+        When every route was tried, they are tried again in order. When every
+        circuit is open, the route that opened first is used anyway.
+        """
+        candidates = [route for route in routes if route not in exclude] or routes
+        with self._lock:
+            breakers = [self._get_breaker(route) for route in candidates]
+            for route, breaker in zip(candidates, breakers):
+                if breaker.allow():
+                    return route
+            return min(zip(candidates, breakers), key=lambda item: item[1].opened_at or 0)[0]
+
+    def _get_breaker(self, route: Route) -> CircuitBreaker:
+        # Must hold the lock
+        breaker = self._breakers.get(route)
+        if breaker is None:
+            breaker = CircuitBreaker(self.circuit_failures, self.circuit_cooldown)
+            self._breakers[route] = breaker
+            self._route_stats[route] = {"attempts": 0, "successes": 0, "failures": 0, "throttles": 0}
+        return breaker
+
+    def backoff(self, retry: int) -> float:
+        """Seconds to wait before a retry, with full jitter"""
+        return random.uniform(0, min(self.retry_max_delay, self.retry_base_delay * 2 ** (retry - 1)))
+
+    def spend_retry_token(self) -> bool:
+        with self._lock:
+            if self._retry_tokens < 1:
+                self.retries_denied += 1
+                return False
+            self._retry_tokens -= 1
+            self.retries += 1
+            return True
+
+    def record_attempt(self, route: Route, hedge: bool):
+        with self._lock:
+            self._get_breaker(route)
+            self._route_stats[route]["attempts"] += 1
+            if hedge:
+                self.hedges += 1
+
+    def record_answer(self, attempt: ModelCallAttempt, routes: List[Route]):
+        """Record the call that answered first, and the time to its first event"""
+        first_event_seconds = time.perf_counter() - attempt.started_at
+        metrics.observe_seconds("model_first_event", first_event_seconds, region=attempt.route[1])
+        with self._lock:
+            self._get_breaker(attempt.route).record_success()
+            self._route_stats[attempt.route]["successes"] += 1
+            self._retry_tokens = min(float(self.retry_budget), self._retry_tokens + _RETRY_REFILL)
+            self.calls += 1
+            if attempt.hedge:
+                self.hedge_wins += 1
+            if attempt.route != routes[0]:
+                self.failovers += 1
+
+    def record_failure(self, route: Route, error: BaseException):
+        """Record a call that failed before its first event (only retryable errors count against the route)"""
+        with self._lock:
+            breaker = self._get_breaker(route)
+            if not is_retryable(error):
+                breaker.release()
+                return
+            breaker.record_failure()
+            stats = self._route_stats[route]
+            stats["failures"] += 1
+            if isinstance(error, ModelThrottledException):
+                stats["throttles"] += 1
+
+    def record_failed_call(self):
+        with self._lock:
+            self.calls += 1
+            self.failed_calls += 1
+
+    def release(self, route: Route):
+        """Forget an attempt that was abandoned before it answered"""
+        with self._lock:
+            self._get_breaker(route).release()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "calls": self.calls,
+                "failed_calls": self.failed_calls,
+                "retries": self.retries,
+                "retries_denied": self.retries_denied,
+                "retry_tokens": round(self._retry_tokens, 1),
+                "hedges": self.hedges,
+                "hedge_wins": self.hedge_wins,
+                "failovers": self.failovers,
+                "routes": {
+                    _route_name(route): {
+                        **self._route_stats[route],
+                        "open": breaker.opened_at is not None,
+                        "state": breaker.state,
+                        "opens": breaker.opens,
+                    }
+                    for route, breaker in self._breakers.items()
+                },
+            }
+
+
+class RoutedBedrockModel(Model):
+    """Model whose calls are routed across the Bedrock models of several regions
+
+    The pooled model of each route makes the calls, so requests share their
+    clients. The model of the first route stands in for the routed model
+    everywhere else (its config, client and structured output).
+    """
+
+    def __init__(self, router: BedrockRouter, model_pool: BedrockModelPool, routes: List[Route]):
+        self.router = router
+        self.model_pool = model_pool
+        self.routes = routes
+        self.primary = model_pool.get_model(model_id=routes[0][0], region=routes[0][1])
+
+    @property
+    def config(self) -> Dict[str, Any]:
+        return self.primary.config
+
+    @property
+    def client(self) -> Any:
+        return self.primary.client
+
+    def update_config(self, **model_config: Any) -> None:
+        self.primary.update_config(**model_config)
+
+    def get_config(self) -> Any:
+        return self.primary.get_config()
+
+    def structured_output(self, output_model: Any, prompt: Messages, system_prompt: Optional[str] = None, **kwargs: Any):
+        return self.primary.structured_output(output_model, prompt, system_prompt=system_prompt, **kwargs)
+
+    async def _run_attempt(
+        self,
+        attempt: ModelCallAttempt,
+        post: Callable[[ModelCallAttempt, Any], None],
+        messages: Messages,
+        tool_specs: Optional[List[ToolSpec]],
+        system_prompt: Optional[str],
+    ):
+        """Make a call on the route of the attempt, posting its events (runs as a task of its own)"""
+        # The worker thread of the model copies the context of this task, so its stream registers with the attempt
+        model_stream_owner.set(attempt)
+        try:
+            model_id, region = attempt.route
+            model: PromptCachingBedrockModel = self.model_pool.get_model(model_id=model_id, region=region)
+            async for event in model.stream(messages, tool_specs, system_prompt):
+                post(attempt, event)
+            post(attempt, _END)
+        except Exception as e:
+            post(attempt, e)
+
+    async def stream(
+        self,
+        messages: Messages,
+        tool_specs: Optional[List[ToolSpec]] = None,
+        system_prompt: Optional[str] = None,
+        **kwargs: Any,
+    ) -> AsyncGenerator[StreamEvent, None]:
+        loop = asyncio.get_running_loop()
+        queue: "asyncio.Queue[Tuple[ModelCallAttempt, Any]]" = asyncio.Queue()
+        router = self.router
+        in_flight: List[ModelCallAttempt] = []
+        tasks: Set[asyncio.Task] = set()
+        tried: Set[Route] = set()
+        winner: Optional[ModelCallAttempt] = None
+        finished = False
+        hedged = False
+        retries = 0
+
+        def post(attempt: ModelCallAttempt, item: Any):
+            queue.put_nowait((attempt, item))
+
+        def cancel(attempt: ModelCallAttempt):
+            # Closing a stream waits for the read of its worker thread, so it is not done on the event loop
+            loop.run_in_executor(None, attempt.cancel)
+
+        def start(hedge: bool):
+            exclude = {a.route for a in in_flight} if hedge else tried
+            attempt = ModelCallAttempt(router.choose_route(self.routes, exclude), hedge)
+            in_flight.append(attempt)
+            tried.add(attempt.route)
+            router.record_attempt(attempt.route, hedge)
+            task = asyncio.create_task(self._run_attempt(attempt, post, messages, tool_specs, system_prompt))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+        start(hedge=False)
+        try:
+            # Until a call answers: hedge a slow call, and retry failed calls on the next route
+            while winner is None:
+                timeout = None
+                if router.hedge_after > 0 and not hedged:
+                    timeout = max(0.0, in_flight[-1].started_at + router.hedge_after - time.perf_counter())
+                try:
+                    attempt, item = await asyncio.wait_for(queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    hedged = True
+                    start(hedge=True)
+                    continue
+
+                in_flight.remove(attempt)
+                if isinstance(item, Exception):
+                    router.record_failure(attempt.route, item)
+                    if not is_retryable(item):
+                        router.record_failed_call()
+                        raise item
+                    logger.warning(f"Model call on {_route_name(attempt.route)} failed: {item}")
+                    if in_flight:
+                        # The hedged call may still answer
+                        continue
+                    if any(route not in tried for route in self.routes):
+                        # Failing over to a region the call was not made on is not a retry
+                        start(hedge=False)
+                        continue
+                    if retries >= router.max_retries or not router.spend_retry_token():
+                        router.record_failed_call()
+                        raise ModelCallFailedError(
+                            f"Model call failed on {', '.join(sorted({_route_name(r) for r in tried}))} "
+                            f"after {retries} retries: {item}"
+                        ) from item
+                    retries += 1
+                    await asyncio.sleep(router.backoff(retries))
+                    start(hedge=False)
+                    continue
+
+                # The first call to answer is kept, and the others are closed
+                winner = attempt
+                for other in in_flight:
+                    cancel(other)
+                    router.release(other.route)
+                in_flight.clear()
+                router.record_answer(winner, self.routes)
+                context = find_request_context()
+                if context is not None and winner.stream is not None:
+                    context.track_model_stream(winner.stream)
+                if item is _END:
+                    finished = True
+                    return
+                yield item
+
+            while True:
+                attempt, item = await queue.get()
+                if attempt is not winner:
+                    continue
+                if item is _END:
+                    finished = True
+                    return
+                if isinstance(item, Exception):
+                    finished = True
+                    raise item
+                yield item
+        finally:
+            for attempt in in_flight:
+                cancel(attempt)
+                router.release(attempt.route)
+            if winner is not None and not finished:
+                cancel(winner)
@@ -0,0 +1,119 @@
+"""On-disk cache of MCP tool schemas for the agent core runtime."""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from strands.types.tools import ToolSpec
+from typing import List, Dict, Optional, Any
+from .config import MCP_SCHEMA_CACHE_PATH
+
+logger = logging.getLogger(__name__)
+
+# Bumped when the layout of the cache file changes
+CACHE_FORMAT_VERSION = 1
+
+
+def hash_config(config: Any) -> str:
+    """Hash a JSON value, independently of its key order and formatting"""
+    return hashlib.sha256(json.dumps(config, sort_keys=True).encode()).hexdigest()
+
+
+def server_cache_key(server: Dict[str, Any]) -> str:
+    """Key of the cached tool specs of a server (env is hashed, so secrets are not written)"""
+    return hash_config({
+        "command": server.get("command"),
+        "args": server.get("args", []),
+        "env": server.get("env", {}),
+    })
+
+
+class MCPSchemaCache:
+    """Tool specs of MCP servers, persisted across process restarts
+
+    Entries are keyed by the command, args and env of their server, and the
+    whole cache is discarded when its format version or the hash of mcp.json
+    changes. A server may still change its tools without a config change (e.g.
+    an unpinned uvx package), so the specs are checked again when the server
+    connects, and the entry is replaced if they differ.
+    """
+
+    def __init__(self, config_hash: str, path: str = MCP_SCHEMA_CACHE_PATH):
+        self.config_hash = config_hash
+        self.path = path
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.updates = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    def load(self):
+        """Read the cache file, unless it was written for another mcp.json"""
+        if not self.enabled:
+            return
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable MCP schema cache {self.path}: {e}")
+            return
+
+        if data.get("version") != CACHE_FORMAT_VERSION or data.get("config_hash") != self.config_hash:
+            logger.info(f"Discarding MCP schema cache {self.path}, written for another mcp.json")
+            return
+        with self._lock:
+            self._entries = data.get("servers", {})
+        logger.info(f"Loaded tool specs of {len(self._entries)} MCP servers from {self.path}")
+
+    def get(self, server_name: str, server: Dict[str, Any]) -> Optional[List[ToolSpec]]:
+        """Get the cached tool specs of a server, if any"""
+        with self._lock:
+            entry = self._entries.get(server_name)
+            if entry is not None and entry.get("key") == server_cache_key(server) and entry.get("tool_specs"):
+                self.hits += 1
+                return entry["tool_specs"]
+            self.misses += 1
+            return None
+
+    def put(self, server_name: str, server: Dict[str, Any], tool_specs: List[ToolSpec]):
+        """Store the tool specs discovered from a server, writing the file if they changed"""
+        if not self.enabled:
+            return
+        key = server_cache_key(server)
+        tool_specs = sorted(tool_specs, key=lambda spec: spec["name"])
+        with self._lock:
+            entry = self._entries.get(server_name)
+            if entry is not None and entry.get("key") == key and entry.get("tool_specs") == tool_specs:
+                return
+            self._entries[server_name] = {"key": key, "tool_specs": tool_specs, "saved_at": time.time()}
+            self.updates += 1
+            data = {"version": CACHE_FORMAT_VERSION, "config_hash": self.config_hash, "servers": self._entries}
+            self._write(data)
+
+    def _write(self, data: Dict[str, Any]):
+        # Written to a temporary file first, so a crash never leaves a truncated cache
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(temp_path, "w") as f:
+                json.dump(data, f)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Error writing MCP schema cache {self.path}: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "servers": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "updates": self.updates,
+            }
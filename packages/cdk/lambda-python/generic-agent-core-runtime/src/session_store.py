@@ -0,0 +1,235 @@
+"""Server-side conversation histories for the agent core runtime."""
+
+import copy
+import hashlib
+import logging
+import os
+import pickle
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Tuple, Optional, Any
+from .config import SESSION_STORE_MEMORY_MB, SESSION_STORE_DISK_MB, SESSION_STORE_DIR
+from .utils import create_id
+
+logger = logging.getLogger(__name__)
+
+_SPILL_SUFFIX = ".pkl"
+
+
+class HistoryVersionMismatchError(Exception):
+    """Raised when the history version of a request is not the one stored for its session"""
+
+
+def estimate_size(value: Any) -> int:
+    """Estimate the memory of a history in bytes, from its text and media payloads"""
+    if isinstance(value, (str, bytes)):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(len(key) + estimate_size(item) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return sum(estimate_size(item) for item in value)
+    return 8
+
+
+class StoredHistory:
+    """The history of a session after its last turn, and the version the client was given"""
+
+    def __init__(self, session_id: str, version: str, messages: List[Any]):
+        self.session_id = session_id
+        self.version = version
+        self.messages = messages
+        self.size = estimate_size(messages)
+
+
+class SessionHistoryStore:
+    """Processed histories of sessions, so clients send only the new turn
+
+    After each turn the history of the agent (with media already decoded) is
+    stored under the runtime session ID with a new version, which is sent to
+    the client in a runtimeMetadata frame. A request carrying that version sends
+    only the new prompt, and is given the stored history. Any other version
+    raises HistoryVersionMismatchError, and the client falls back to sending its
+    full history without a version.
+
+    Histories are kept in a memory-bounded LRU. The least recently used ones
+    spill to files under the directory, up to disk_bytes (oldest files are
+    removed first), and move back to memory on their next request.
+    """
+
+    def __init__(
+        self,
+        memory_bytes: int = SESSION_STORE_MEMORY_MB * 1024 * 1024,
+        directory: str = SESSION_STORE_DIR,
+        disk_bytes: int = SESSION_STORE_DISK_MB * 1024 * 1024,
+    ):
+        self.memory_bytes = memory_bytes
+        self.directory = directory
+        self.disk_bytes = disk_bytes
+        self._histories: "OrderedDict[str, StoredHistory]" = OrderedDict()
+        self._memory_size = 0
+        # Spilled files by name, oldest first, and their sizes
+        self._spilled: "OrderedDict[str, int]" = OrderedDict()
+        self._disk_size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_loads = 0
+        self.mismatches = 0
+        self.spills = 0
+        self.bytes_not_resent = 0
+        if self.enabled and self.disk_bytes > 0:
+            self._index_spilled()
+
+    @property
+    def enabled(self) -> bool:
+        return self.memory_bytes > 0
+
+    def _index_spilled(self):
+        """Keep the histories spilled before a restart of the process"""
+        try:
+            entries = [e for e in os.scandir(self.directory) if e.name.endswith(_SPILL_SUFFIX)]
+        except FileNotFoundError:
+            return
+        for entry in sorted(entries, key=lambda e: e.stat().st_mtime):
+            size = entry.stat().st_size
+            self._spilled[entry.name] = size
+            self._disk_size += size
+
+    @staticmethod
+    def _file_name(session_id: str) -> str:
+        # Session IDs come from request headers, so they are hashed into file names
+        return hashlib.sha256(session_id.encode()).hexdigest() + _SPILL_SUFFIX
+
+    def resolve(self, session_id: Optional[str], history_version: str, messages: List[Any]) -> List[Any]:
+        """Get the history of a request: the stored history of its session followed by the messages sent"""
+        stored = self._get(session_id) if self.enabled and session_id else None
+        if stored is None or stored.version != history_version:
+            with self._lock:
+                self.mismatches += 1
+            raise HistoryVersionMismatchError(
+                f"History version {history_version} is not stored for session {session_id}, "
+                "send the full history without a version"
+            )
+        with self._lock:
+            self.hits += 1
+            self.bytes_not_resent += stored.size
+        # A new list, since the agent appends to it while the stored version stays valid
+        return stored.messages + list(messages)
+
+    def save(self, session_id: str, messages: List[Any]) -> str:
+        """Store the history of a session after a turn, and get its new version"""
+        # A snapshot, so messages still referenced by the agent cannot change the stored history
+        stored = StoredHistory(session_id, create_id(), copy.deepcopy(list(messages)))
+        file_name = self._file_name(session_id)
+        with self._lock:
+            previous = self._histories.pop(session_id, None)
+            if previous is not None:
+                self._memory_size -= previous.size
+            self._histories[session_id] = stored
+            self._memory_size += stored.size
+            stale_size = self._spilled.pop(file_name, None)
+            if stale_size is not None:
+                self._disk_size -= stale_size
+            evicted = []
+            while self._memory_size > self.memory_bytes and self._histories:
+                _, history = self._histories.popitem(last=False)
+                self._memory_size -= history.size
+                evicted.append(history)
+
+        if stale_size is not None:
+            self._remove(file_name)
+        # Written outside the lock, so a large spill does not hold up other sessions.
+        # A request for a history being written misses it and falls back to a full resend.
+        for history in evicted:
+            self._spill(history)
+        return stored.version
+
+    def _get(self, session_id: str) -> Optional[StoredHistory]:
+        file_name = self._file_name(session_id)
+        with self._lock:
+            stored = self._histories.get(session_id)
+            if stored is not None:
+                self._histories.move_to_end(session_id)
+                return stored
+            size = self._spilled.pop(file_name, None)
+            if size is None:
+                return None
+            self._disk_size -= size
+
+        try:
+            with open(os.path.join(self.directory, file_name), "rb") as f:
+                data = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError) as e:
+            logger.warning(f"Error reading spilled history of session {session_id}: {e}")
+            return None
+        finally:
+            self._remove(file_name)
+        if data.get("session_id") != session_id:
+            return None
+
+        stored = StoredHistory(session_id, data["version"], data["messages"])
+        with self._lock:
+            self.disk_loads += 1
+            if session_id not in self._histories:
+                self._histories[session_id] = stored
+                self._memory_size += stored.size
+        return stored
+
+    def _spill(self, history: StoredHistory):
+        """Write an evicted history to disk, removing the oldest files beyond the quota"""
+        if self.disk_bytes <= 0 or history.size > self.disk_bytes:
+            return
+        file_name = self._file_name(history.session_id)
+        path = os.path.join(self.directory, file_name)
+        # Written to a temporary file first, so a crash never leaves a truncated history
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(temp_path, "wb") as f:
+                pickle.dump(
+                    {"session_id": history.session_id, "version": history.version, "messages": history.messages},
+                    f,
+                    protocol=pickle.HIGHEST_PROTOCOL,
+                )
+            os.replace(temp_path, path)
+            size = os.path.getsize(path)
+        except OSError as e:
+            logger.warning(f"Error spilling history of session {history.session_id}: {e}")
+            return
+
+        removed: List[Tuple[str, int]] = []
+        with self._lock:
+            previous_size = self._spilled.pop(file_name, None)
+            if previous_size is not None:
+                self._disk_size -= previous_size
+            self._spilled[file_name] = size
+            self._disk_size += size
+            self.spills += 1
+            while self._disk_size > self.disk_bytes and self._spilled:
+                oldest = self._spilled.popitem(last=False)
+                self._disk_size -= oldest[1]
+                removed.append(oldest)
+        for name, _ in removed:
+            self._remove(name)
+
+    def _remove(self, file_name: str):
+        try:
+            os.remove(os.path.join(self.directory, file_name))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Error removing spilled history {file_name}: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "sessions": len(self._histories),
+                "bytes": self._memory_size,
+                "spilled_sessions": len(self._spilled),
+                "spilled_bytes": self._disk_size,
+                "hits": self.hits,
+                "disk_loads": self.disk_loads,
+                "mismatches": self.mismatches,
+                "spills": self.spills,
+                "bytes_not_resent": self.bytes_not_resent,
+            }
@@ -0,0 +1,145 @@
+"""S3 uploads for the agent core runtime."""
+
+import boto3
+import hashlib
+import logging
+import os
+import threading
+import time
+from boto3.s3.transfer import TransferConfig
+from botocore.exceptions import ClientError
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Tuple, Any
+from .config import (
+    S3_MULTIPART_THRESHOLD_MB,
+    S3_MULTIPART_CHUNKSIZE_MB,
+    S3_MAX_CONCURRENCY,
+    S3_UPLOAD_PARALLELISM,
+)
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+
+def file_sha256(filepath: str) -> str:
+    """Hash a file without reading it into memory at once"""
+    digest = hashlib.sha256()
+    with open(filepath, "rb") as f:
+        for chunk in iter(lambda: f.read(MB), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class S3Uploader:
+    """Uploads workspace files to S3 with shared clients and content-hash dedup
+
+    Objects are uploaded with the sha256 of their content as metadata. Before
+    a transfer, a HEAD of the key compares it with the sha256 of the file, so
+    an unchanged file is not uploaded again while an object that was deleted
+    or expired in the meantime is.
+    """
+
+    def __init__(self):
+        self.transfer_config = TransferConfig(
+            multipart_threshold=S3_MULTIPART_THRESHOLD_MB * MB,
+            multipart_chunksize=S3_MULTIPART_CHUNKSIZE_MB * MB,
+            max_concurrency=S3_MAX_CONCURRENCY,
+        )
+        self._clients: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=S3_UPLOAD_PARALLELISM, thread_name_prefix="s3-upload"
+        )
+        self.uploads = 0
+        self.skipped = 0
+        self.uploaded_bytes = 0
+        self.upload_seconds = 0.0
+
+    def get_client(self, region: str) -> Any:
+        """Get the shared S3 client for a region (clients are thread-safe, creation is not)"""
+        with self._lock:
+            client = self._clients.get(region)
+            if client is None:
+                client = boto3.session.Session().client("s3", region_name=region)
+                self._clients[region] = client
+            return client
+
+    @staticmethod
+    def _is_uploaded(client: Any, bucket: str, key: str, sha256: str) -> bool:
+        """Whether the object of the key was uploaded from the same content"""
+        try:
+            head = client.head_object(Bucket=bucket, Key=key)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") not in ("404", "NoSuchKey", "NotFound"):
+                logger.warning(f"Error checking s3://{bucket}/{key}, uploading it: {e}")
+            return False
+        return head.get("Metadata", {}).get("sha256") == sha256
+
+    def upload(self, filepath: str, bucket: str, key: str, region: str) -> str:
+        """Upload a file unless an identical object already exists, and return its URL"""
+        client = self.get_client(region)
+        # hashlib releases the GIL while hashing, so the calling thread hashes the file
+        sha256 = file_sha256(filepath)
+
+        if self._is_uploaded(client, bucket, key, sha256):
+            with self._lock:
+                self.skipped += 1
+            logger.info(f"Skipped upload of unchanged file {filepath} to s3://{bucket}/{key}")
+        else:
+            started_at = time.perf_counter()
+            with metrics.phase("s3_upload"):
+                client.upload_file(
+                    filepath,
+                    bucket,
+                    key,
+                    ExtraArgs={"Metadata": {"sha256": sha256}},
+                    Config=self.transfer_config,
+                )
+            elapsed = time.perf_counter() - started_at
+            size = os.path.getsize(filepath)
+            metrics.observe_bytes("s3_upload", size)
+
+            with self._lock:
+                self.uploads += 1
+                self.uploaded_bytes += size
+                self.upload_seconds += elapsed
+            logger.info(
+                f"Uploaded {size} bytes to s3://{bucket}/{key} in {elapsed:.3f}s "
+                f"({size / MB / max(elapsed, 1e-6):.1f} MB/s)"
+            )
+
+        return f"https://{bucket}.s3.{region}.amazonaws.com/{key}"
+
+    def upload_many(self, files: List[Tuple[str, str]], bucket: str, region: str) -> List[Any]:
+        """Upload (filepath, key) pairs in parallel
+
+        Returns the URL of each file, or the exception raised while uploading it.
+        """
+        futures = [
+            self._executor.submit(self.upload, filepath, bucket, key, region)
+            for filepath, key in files
+        ]
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                results.append(e)
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "uploads": self.uploads,
+                "skipped": self.skipped,
+                "uploaded_bytes": self.uploaded_bytes,
+                "upload_seconds": round(self.upload_seconds, 3),
+                "throughput_mb_per_second": round(
+                    self.uploaded_bytes / MB / self.upload_seconds, 2
+                ) if self.upload_seconds else None,
+            }
+
+
+s3_uploader = S3Uploader()
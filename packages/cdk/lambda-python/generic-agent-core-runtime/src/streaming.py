@@ -0,0 +1,285 @@
+"""Serialization of streamed events for the agent core runtime."""
+
+import asyncio
+import json
+import logging
+import threading
+import time
+from typing import AsyncIterator, Awaitable, Callable, List, Dict, Tuple, Optional, Any
+from .config import (
+    STREAM_SERIALIZER,
+    STREAM_COALESCE_MS,
+    STREAM_COALESCE_BYTES,
+    STREAM_BUFFER_FRAMES,
+    STREAM_DISCONNECT_POLL_INTERVAL,
+)
+from .context import RequestContext
+
+logger = logging.getLogger(__name__)
+
+# Import faster JSON serializer (optional)
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+
+def _serialize_json(event: Dict[str, Any]) -> bytes:
+    return (json.dumps(event, ensure_ascii=False) + "\n").encode()
+
+
+def _serialize_orjson(event: Dict[str, Any]) -> bytes:
+    try:
+        return orjson.dumps(event, option=orjson.OPT_APPEND_NEWLINE)
+    except TypeError:
+        # orjson is stricter than json (e.g. integers over 64 bits)
+        return _serialize_json(event)
+
+
+if STREAM_SERIALIZER == "orjson" and not ORJSON_AVAILABLE:
+    logger.warning("orjson is not installed, streamed events are serialized with json")
+
+# Serializes an event to an NDJSON line
+serialize_event = (
+    _serialize_orjson if ORJSON_AVAILABLE and STREAM_SERIALIZER != "json" else _serialize_json
+)
+
+
+def _delta_text_path(delta: Dict[str, Any]) -> Optional[Tuple[str, ...]]:
+    """Get the path of the text of a delta that can be concatenated, if any"""
+    if len(delta) != 1:
+        return None
+    if isinstance(delta.get("text"), str):
+        return ("text",)
+    if set(delta.get("toolUse", {})) == {"input"}:
+        return ("toolUse", "input")
+    if set(delta.get("reasoningContent", {})) == {"text"}:
+        return ("reasoningContent", "text")
+    return None
+
+
+class DeltaCoalescer:
+    """Merges consecutive contentBlockDelta events of a content block into one event
+
+    Deltas are buffered until STREAM_COALESCE_MS has passed since the first one
+    or STREAM_COALESCE_BYTES of text is buffered, and any other event flushes
+    the buffer first, so the order of events is kept. The time bound is checked
+    when an event arrives, so a frame is never held back once the model stops
+    streaming the block.
+    """
+
+    def __init__(self, window_ms: float = STREAM_COALESCE_MS, max_bytes: int = STREAM_COALESCE_BYTES):
+        self.window = window_ms / 1000
+        self.max_bytes = max_bytes
+        self._key: Optional[Tuple[Any, Tuple[str, ...]]] = None
+        self._parts: List[str] = []
+        self._size = 0
+        self._started_at = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.window > 0
+
+    def push(self, event: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Add an event and get the events to send now"""
+        block_delta = event.get("event", {}).get("contentBlockDelta")
+        path = _delta_text_path(block_delta.get("delta", {})) if block_delta else None
+        if path is None:
+            return self.flush() + [event]
+
+        key = (block_delta.get("contentBlockIndex"), path)
+        text = block_delta["delta"]
+        for name in path:
+            text = text[name]
+
+        ready = []
+        if key != self._key:
+            ready = self.flush()
+            self._key = key
+            self._started_at = time.monotonic()
+        self._parts.append(text)
+        self._size += len(text)
+
+        if self._size >= self.max_bytes or time.monotonic() - self._started_at >= self.window:
+            ready += self.flush()
+        return ready
+
+    def flush(self) -> List[Dict[str, Any]]:
+        """Get the buffered deltas as a single event"""
+        if self._key is None:
+            return []
+        index, path = self._key
+        value: Any = "".join(self._parts)
+        for name in reversed(path):
+            value = {name: value}
+
+        block_delta: Dict[str, Any] = {"delta": value}
+        if index is not None:
+            block_delta["contentBlockIndex"] = index
+
+        self._key = None
+        self._parts = []
+        self._size = 0
+        return [{"event": {"contentBlockDelta": block_delta}}]
+
+
+class StreamStats:
+    """Counters of streamed responses, and of the work saved by abandoning them"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.streams = 0
+        self.finished = 0
+        self.abandoned = 0
+        self.cancelled_tool_calls = 0
+        self.backpressure_waits = 0
+        self.backpressure_seconds = 0.0
+        self.model_calls = 0
+        self.output_tokens = 0
+        self.output_tokens_saved = 0
+
+    def record_model_call(self, output_tokens: int):
+        with self._lock:
+            self.model_calls += 1
+            self.output_tokens += output_tokens
+
+    def record_cancelled_model_call(self, partial_output_tokens: int):
+        """Estimate the output tokens a cancelled model call (or the next one) did not generate"""
+        with self._lock:
+            if self.model_calls:
+                average = self.output_tokens // self.model_calls
+                self.output_tokens_saved += max(average - partial_output_tokens, 0)
+
+    def record_backpressure(self, seconds: float):
+        with self._lock:
+            self.backpressure_waits += 1
+            self.backpressure_seconds += seconds
+
+    def record_stream(self, abandoned: bool, cancelled_tool_calls: int = 0):
+        with self._lock:
+            self.streams += 1
+            if abandoned:
+                self.abandoned += 1
+                self.cancelled_tool_calls += cancelled_tool_calls
+            else:
+                self.finished += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "streams": self.streams,
+                "finished": self.finished,
+                "abandoned": self.abandoned,
+                "cancelled_tool_calls": self.cancelled_tool_calls,
+                "output_tokens_saved": self.output_tokens_saved,
+                "backpressure_waits": self.backpressure_waits,
+                "backpressure_seconds": round(self.backpressure_seconds, 3),
+            }
+
+
+stream_stats = StreamStats()
+
+
+class ModelCallProgress:
+    """Output tokens of the model call in progress, estimated from its deltas"""
+
+    def __init__(self):
+        self.chars = 0
+
+    @property
+    def tokens(self) -> int:
+        # ~4 characters per token
+        return self.chars // 4
+
+    def add_event(self, event: Dict[str, Any]):
+        inner = event.get("event", {})
+        if "messageStart" in inner:
+            self.chars = 0
+        elif "contentBlockDelta" in inner:
+            delta = inner["contentBlockDelta"].get("delta", {})
+            path = _delta_text_path(delta)
+            if path is not None:
+                for name in path:
+                    delta = delta[name]
+                self.chars += len(delta)
+        elif "metadata" in inner:
+            stream_stats.record_model_call(inner["metadata"].get("usage", {}).get("outputTokens", 0))
+            self.chars = 0
+
+
+# Marks the end of the frames in the buffer
+_END = object()
+
+
+async def stream_with_backpressure(
+    frames: AsyncIterator[bytes],
+    is_disconnected: Callable[[], Awaitable[bool]],
+    context: RequestContext,
+    buffer_frames: int = STREAM_BUFFER_FRAMES,
+    poll_interval: float = STREAM_DISCONNECT_POLL_INTERVAL,
+) -> AsyncIterator[bytes]:
+    """Stream frames to a client through a bounded buffer, and stop the agent when it disconnects
+
+    The agent produces frames in its own task. Once buffer_frames are waiting for
+    a slow client, it is paused until the client catches up. When the client
+    disconnects (noticed by polling the connection, or when the server stops
+    reading the stream), the agent task, its in-flight tool calls and the model
+    stream are cancelled.
+    """
+    buffer: asyncio.Queue = asyncio.Queue(maxsize=max(buffer_frames, 1))
+
+    async def produce():
+        try:
+            async for frame in frames:
+                if buffer.full():
+                    waited_at = time.perf_counter()
+                    await buffer.put(frame)
+                    stream_stats.record_backpressure(time.perf_counter() - waited_at)
+                else:
+                    buffer.put_nowait(frame)
+        except Exception as e:
+            await buffer.put(e)
+            return
+        await buffer.put(_END)
+
+    producer = asyncio.create_task(produce())
+    cancelled_tool_calls = 0
+
+    def abandon():
+        nonlocal cancelled_tool_calls
+        producer.cancel()
+        cancelled_tool_calls = context.cancel()
+        # Nobody reads the buffered frames anymore
+        while not buffer.empty():
+            buffer.get_nowait()
+        buffer.put_nowait(_END)
+
+    async def watch():
+        while not producer.done():
+            await asyncio.sleep(poll_interval)
+            if await is_disconnected():
+                logger.info("Client disconnected, cancelling the agent")
+                abandon()
+                return
+
+    watcher = asyncio.create_task(watch()) if poll_interval > 0 else None
+    finished = False
+    try:
+        while True:
+            frame = await buffer.get()
+            if frame is _END:
+                finished = True
+                return
+            if isinstance(frame, Exception):
+                finished = True
+                raise frame
+            yield frame
+    finally:
+        if watcher is not None:
+            watcher.cancel()
+        if not finished:
+            # The server stopped reading the stream (the client disconnected)
+            logger.info("Stream was abandoned, cancelling the agent")
+            abandon()
+        stream_stats.record_stream(context.cancelled.is_set(), cancelled_tool_calls)
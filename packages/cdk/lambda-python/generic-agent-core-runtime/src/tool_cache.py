@@ -0,0 +1,191 @@
+"""Result cache of MCP tools for the agent core runtime."""
+
+import copy
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from strands.types.tools import AgentTool, ToolGenerator, ToolResult, ToolSpec, ToolUse
+from typing import List, Dict, Tuple, Optional, Any
+
+logger = logging.getLogger(__name__)
+
+# Defaults of the "cache" setting of an MCP server in mcp.json
+DEFAULT_TTL_SECONDS = 300
+DEFAULT_MAX_ENTRIES = 256
+DEFAULT_MAX_BYTES = 8 * 1024 * 1024
+
+
+def canonical_input(tool_input: Any) -> str:
+    """Serialize tool input so that equal inputs give the same key"""
+    return json.dumps(tool_input, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=repr)
+
+
+def result_size(content: List[Dict[str, Any]]) -> int:
+    """Approximate the memory held by the content of a tool result"""
+    size = 0
+    for block in content:
+        if "text" in block:
+            size += len(block["text"])
+        elif "json" in block:
+            size += len(canonical_input(block["json"]))
+        else:
+            for media in block.values():
+                if isinstance(media, dict):
+                    size += len(media.get("source", {}).get("bytes", b""))
+    return size
+
+
+class ResultCache:
+    """LRU cache of tool results with a TTL and an entry and byte budget"""
+
+    def __init__(self, ttl: float, max_entries: int, max_bytes: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, int, List[Dict[str, Any]]]]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+
+    def get(self, key: Tuple[str, str]) -> Optional[List[Dict[str, Any]]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def put(self, key: Tuple[str, str], content: List[Dict[str, Any]]):
+        size = result_size(content)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl, size, content)
+            self._size += size
+            while len(self._entries) > self.max_entries or self._size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key: Tuple[str, str]):
+        """Remove an entry (must hold the lock)"""
+        _, size, _ = self._entries.pop(key)
+        self._size -= size
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "expirations": self.expirations,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+            }
+
+
+class CachedTool(AgentTool):
+    """Agent tool that answers repeated calls with the same input from a cache
+
+    Only successful results are cached, and a cached result is returned with the
+    toolUseId of the call it answers.
+    """
+
+    def __init__(self, tool: AgentTool, cache: ResultCache):
+        super().__init__()
+        self.tool = tool
+        self.cache = cache
+
+    @property
+    def tool_name(self) -> str:
+        return self.tool.tool_name
+
+    @property
+    def tool_spec(self) -> ToolSpec:
+        return self.tool.tool_spec
+
+    @property
+    def tool_type(self) -> str:
+        return self.tool.tool_type
+
+    async def stream(self, tool_use: ToolUse, invocation_state: Dict[str, Any], **kwargs: Any) -> ToolGenerator:
+        key = (self.tool_name, canonical_input(tool_use.get("input", {})))
+        content = self.cache.get(key)
+        if content is not None:
+            yield ToolResult(toolUseId=tool_use["toolUseId"], status="success", content=copy.deepcopy(content))
+            return
+
+        async for event in self.tool.stream(tool_use, invocation_state, **kwargs):
+            if isinstance(event, dict) and event.get("toolUseId") and event.get("status") == "success":
+                self.cache.put(key, copy.deepcopy(event.get("content", [])))
+            yield event
+
+
+class ToolResultCache:
+    """Result caches of MCP tools, configured by the "cache" setting of each server in mcp.json
+
+        "cache": {
+            "ttlSeconds": 300,
+            "maxEntries": 256,
+            "maxBytes": 8388608,
+            "tools": {"read_documentation": {"ttlSeconds": 3600}, "recommend": false}
+        }
+
+    Tools of a server share one cache, except tools with their own settings.
+    Servers without the setting are not cached, and "cache": true uses the defaults.
+    """
+
+    def __init__(self):
+        self._caches: Dict[Tuple[str, Optional[str]], ResultCache] = {}
+        self._lock = threading.Lock()
+
+    def _get_cache(self, server_name: str, tool_name: str, config: Dict[str, Any]) -> Optional[ResultCache]:
+        tool_config = config.get("tools", {}).get(tool_name)
+        if tool_config is False:
+            return None
+        key = (server_name, tool_name if isinstance(tool_config, dict) else None)
+        settings = {**config, **tool_config} if isinstance(tool_config, dict) else config
+
+        with self._lock:
+            cache = self._caches.get(key)
+            if cache is None:
+                cache = ResultCache(
+                    ttl=float(settings.get("ttlSeconds", DEFAULT_TTL_SECONDS)),
+                    max_entries=int(settings.get("maxEntries", DEFAULT_MAX_ENTRIES)),
+                    max_bytes=int(settings.get("maxBytes", DEFAULT_MAX_BYTES)),
+                )
+                self._caches[key] = cache
+            return cache
+
+    def wrap_tools(self, tools: List[Any]) -> List[Any]:
+        """Wrap pooled MCP tools whose server enables caching"""
+        wrapped = []
+        for tool in tools:
+            config = tool.server.server.get("cache")
+            if config is True:
+                config = {}
+            cache = self._get_cache(tool.server.name, tool.tool_name, config) if isinstance(config, dict) else None
+            wrapped.append(CachedTool(tool, cache) if cache is not None else tool)
+        return wrapped
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            caches = dict(self._caches)
+        return {
+            f"{server}/{tool}" if tool else server: cache.stats()
+            for (server, tool), cache in caches.items()
+        }
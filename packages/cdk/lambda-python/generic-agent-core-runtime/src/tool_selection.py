@@ -0,0 +1,224 @@
+"""Relevance-based tool selection for the agent core runtime."""
+
+import fnmatch
+import json
+import logging
+import math
+import re
+import threading
+from collections import Counter
+from typing import List, Dict, Set, Tuple, Union, Optional, Any
+from .config import TOOL_SELECTION_TOP_K, TOOL_SELECTION_ALWAYS
+
+logger = logging.getLogger(__name__)
+
+# Words of a name (snake_case, kebab-case or camelCase) or of a sentence
+_WORD = re.compile(r"[A-Z]?[a-z]+|[A-Z]+(?![a-z])|[0-9]+")
+
+_STOP_WORDS = frozenset(
+    "a an and are as at be by can do for from get how i in is it me my of on or "
+    "please the this that to use using what when which with you your".split()
+)
+
+# Name words count more than description words when ranking
+_NAME_WEIGHT = 3
+
+# Messages at the end of the history whose text is matched along with the prompt
+_RECENT_MESSAGES = 2
+
+# ~4 characters per token
+_CHARS_PER_TOKEN = 4
+
+
+def tokenize(text: str) -> List[str]:
+    """Split text into lowercase terms, without stop words"""
+    return [word for word in (w.lower() for w in _WORD.findall(text)) if len(word) > 1 and word not in _STOP_WORDS]
+
+
+def tool_terms(tool_spec: Dict[str, Any]) -> List[str]:
+    """Get the terms of a tool: its name, description and parameters"""
+    terms = tokenize(tool_spec.get("name", "")) * _NAME_WEIGHT + tokenize(tool_spec.get("description", ""))
+    properties = tool_spec.get("inputSchema", {}).get("json", {}).get("properties", {})
+    for name, schema in properties.items():
+        terms += tokenize(name)
+        if isinstance(schema, dict):
+            terms += tokenize(schema.get("description", ""))
+    return terms
+
+
+def estimate_spec_tokens(tool_spec: Dict[str, Any]) -> int:
+    """Estimate the input tokens of a tool spec in a model call"""
+    return len(json.dumps(tool_spec, ensure_ascii=False)) // _CHARS_PER_TOKEN + 1
+
+
+def request_text(prompt: Union[str, List[Dict[str, Any]]], messages: List[Dict[str, Any]]) -> str:
+    """Get the text a request is matched with: the prompt and the last messages"""
+    blocks = [{"text": prompt}] if isinstance(prompt, str) else list(prompt)
+    for message in messages[-_RECENT_MESSAGES:]:
+        blocks += message.get("content", [])
+    return "\n".join(b["text"] for b in blocks if isinstance(b, dict) and isinstance(b.get("text"), str))
+
+
+def used_tool_names(messages: List[Dict[str, Any]]) -> Set[str]:
+    """Get the names of the tools used in the history, which the model must still be given"""
+    return {
+        b["toolUse"].get("name")
+        for message in messages
+        for b in message.get("content", [])
+        if isinstance(b, dict) and "toolUse" in b
+    }
+
+
+class BM25Index:
+    """Okapi BM25 ranking of documents made of terms"""
+
+    def __init__(self, documents: List[List[str]], k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.term_counts = [Counter(document) for document in documents]
+        self.lengths = [len(document) for document in documents]
+        self.average_length = sum(self.lengths) / len(documents) if documents else 0.0
+        document_frequency = Counter(term for counts in self.term_counts for term in counts)
+        n = len(documents)
+        self.idf = {
+            term: math.log(1 + (n - frequency + 0.5) / (frequency + 0.5))
+            for term, frequency in document_frequency.items()
+        }
+
+    def scores(self, query: List[str]) -> List[float]:
+        """Score every document against the query terms"""
+        terms = [term for term in set(query) if term in self.idf]
+        scores = []
+        for counts, length in zip(self.term_counts, self.lengths):
+            norm = self.k1 * (1 - self.b + self.b * length / self.average_length) if self.average_length else self.k1
+            scores.append(sum(
+                self.idf[term] * counts[term] * (self.k1 + 1) / (counts[term] + norm)
+                for term in terms
+                if counts[term]
+            ))
+        return scores
+
+
+class ToolSelection:
+    """The tools given to the agent of a request, and the input tokens it saves"""
+
+    def __init__(self, total: int, selected: List[str], fallback: bool, tokens_all: int, tokens_selected: int):
+        self.total = total
+        self.selected = selected
+        self.fallback = fallback
+        self.tokens_all = tokens_all
+        self.tokens_selected = tokens_selected
+
+    @property
+    def tokens_saved_per_call(self) -> int:
+        return self.tokens_all - self.tokens_selected
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "total": self.total,
+            "selected": len(self.selected),
+            "fallback": self.fallback,
+            "specTokens": self.tokens_selected,
+            "specTokensSavedPerCall": self.tokens_saved_per_call,
+        }
+
+
+class ToolSelector:
+    """Gives the agent of each request only the tools relevant to it
+
+    Every model call of the agent loop sends the specs of all its tools, which
+    with several MCP servers is thousands of input tokens. Tools are ranked with
+    BM25 over their names, descriptions and parameters against the prompt and
+    the last messages, and the top_k are given, along with the tools matching
+    the always patterns and the tools used earlier in the conversation (the
+    model must be given the tools of toolUse blocks in the history). When no
+    tool matches the request at all, every tool is given.
+
+    The selected tools keep the order they came in, so requests selecting the
+    same tools send the same specs and share the cached prompt prefix.
+    """
+
+    def __init__(self, top_k: int = TOOL_SELECTION_TOP_K, always: List[str] = TOOL_SELECTION_ALWAYS):
+        self.top_k = top_k
+        self.always = always
+        self._lock = threading.Lock()
+        self._index_key: Optional[Tuple[Any, ...]] = None
+        self._index: Optional[BM25Index] = None
+        self._spec_tokens: List[int] = []
+        self.requests = 0
+        self.fallbacks = 0
+        self.selected_tools = 0
+        self.tokens_saved = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.top_k > 0
+
+    def _get_index(self, tools: List[Any]) -> Tuple[BM25Index, List[int]]:
+        """Get the index of the tools, built again only when the tools change"""
+        key = tuple((t.tool_name, t.tool_spec.get("description", "")) for t in tools)
+        with self._lock:
+            if key != self._index_key:
+                self._index = BM25Index([tool_terms(t.tool_spec) for t in tools])
+                self._spec_tokens = [estimate_spec_tokens(t.tool_spec) for t in tools]
+                self._index_key = key
+            return self._index, self._spec_tokens
+
+    def select(
+        self,
+        tools: List[Any],
+        prompt: Union[str, List[Dict[str, Any]]],
+        messages: List[Dict[str, Any]],
+    ) -> Tuple[List[Any], Optional[ToolSelection]]:
+        """Get the tools to give the agent of a request, and the selection report if tools were selected"""
+        if not self.enabled or len(tools) <= self.top_k:
+            return tools, None
+
+        index, spec_tokens = self._get_index(tools)
+        scores = index.scores(tokenize(request_text(prompt, messages)))
+        tokens_all = sum(spec_tokens)
+
+        if max(scores, default=0) <= 0:
+            selection = ToolSelection(len(tools), [t.tool_name for t in tools], True, tokens_all, tokens_all)
+            self._record(selection)
+            return tools, selection
+
+        ranked = sorted((i for i, score in enumerate(scores) if score > 0), key=lambda i: -scores[i])
+        chosen = set(ranked[:self.top_k])
+        used = used_tool_names(messages)
+        for i, tool in enumerate(tools):
+            if tool.tool_name in used or any(fnmatch.fnmatchcase(tool.tool_name, p) for p in self.always):
+                chosen.add(i)
+
+        selected = [tool for i, tool in enumerate(tools) if i in chosen]
+        selection = ToolSelection(
+            len(tools),
+            [t.tool_name for t in selected],
+            False,
+            tokens_all,
+            sum(spec_tokens[i] for i in chosen),
+        )
+        self._record(selection)
+        return selected, selection
+
+    def _record(self, selection: ToolSelection):
+        with self._lock:
+            self.requests += 1
+            self.selected_tools += len(selection.selected)
+            if selection.fallback:
+                self.fallbacks += 1
+
+    def record_saved(self, tokens: int):
+        """Record the input tokens a request saved over all its model calls"""
+        with self._lock:
+            self.tokens_saved += tokens
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "top_k": self.top_k or None,
+                "requests": self.requests,
+                "fallbacks": self.fallbacks,
+                "average_selected": round(self.selected_tools / self.requests, 1) if self.requests else None,
+                "input_tokens_saved": self.tokens_saved,
+            }
@@ -1,150 +1,212 @@
 """Tool management for the agent core runtime."""
 
 import os
-import boto3
+import time
 import json
 import logging
+import threading
 from strands import tool
-from strands.tools.mcp import MCPClient
-from mcp import stdio_client, StdioServerParameters
-from typing import List, Any
-from .config import get_uv_environment, get_aws_credentials, WORKSPACE_DIR
-
-# Import strands-agents code interpreter tool
-try:
-    from strands_tools.code_interpreter import AgentCoreCodeInterpreter
-    CODE_INTERPRETER_AVAILABLE = True
-except ImportError as e:
-    CODE_INTERPRETER_AVAILABLE = False
-    logger = logging.getLogger(__name__)
-    logger.warning(f"Strands code interpreter tool not available: {e}")
-    AgentCoreCodeInterpreter = None
+from typing import List, Dict, Optional, Any
+from .config import get_uv_environment, get_aws_credentials, MCP_SERVER_MODE
+from .context import get_request_context
+from .utils import is_in_directory
+from .mcp_pool import MCPServerPool
+from .schema_cache import MCPSchemaCache, hash_config
+from .bake import load_lock, pin_mcp_servers
+from .code_interpreter import CodeInterpreterCache
+from .executor import tool_executor
+from .tool_cache import ToolResultCache
+from .storage import s3_uploader
 
 logger = logging.getLogger(__name__)
 
 
+def _get_upload_key(filepath: str) -> str:
+    """Validate that the file is in the request's workspace and get its S3 key"""
+    context = get_request_context()
+    workspace_dir = context.workspace_dir
+
+    if not is_in_directory(filepath, workspace_dir):
+        raise ValueError(
+            f"{filepath} does not appear to be a file under the {workspace_dir} directory. Files to be uploaded must exist under {workspace_dir}."
+        )
+
+    filename = os.path.basename(filepath)
+    return f"agentcore/{context.trace_id}/{filename}"
+
+
+# Built once and shared by all requests. Session and workspace are read from
+# the request context at call time.
+@tool
+def upload_file_to_s3_and_retrieve_s3_url(filepath: str) -> str:
+    """Upload the file at /tmp/ws/* and retrieve the s3 path
+
+    Args:
+        filepath: The path to the uploading file
+    """
+    bucket = os.environ.get("FILE_BUCKET")
+    if not bucket:
+        # For local testing, provide a fallback message
+        logger.warning(
+            "FILE_BUCKET environment variable not set. Using local file path for testing."
+        )
+        return f"Local file path (S3 upload skipped): {filepath}"
+
+    aws_creds = get_aws_credentials()
+    region = aws_creds.get("AWS_REGION", "us-east-1")
+    key = _get_upload_key(filepath)
+
+    try:
+        return s3_uploader.upload(filepath, bucket, key, region)
+    except Exception as e:
+        logger.error(f"Error uploading file to S3: {e}")
+        # For local testing, provide a fallback
+        return f"Error uploading to S3: {str(e)}. Local file path: {filepath}"
+
+
+@tool
+def upload_files_to_s3_and_retrieve_s3_urls(filepaths: List[str]) -> str:
+    """Upload several files at /tmp/ws/* in parallel and retrieve their s3 paths
+
+    Args:
+        filepaths: The paths to the uploading files
+    """
+    bucket = os.environ.get("FILE_BUCKET")
+    if not bucket:
+        logger.warning(
+            "FILE_BUCKET environment variable not set. Using local file path for testing."
+        )
+        return "\n".join(f"Local file path (S3 upload skipped): {f}" for f in filepaths)
+
+    aws_creds = get_aws_credentials()
+    region = aws_creds.get("AWS_REGION", "us-east-1")
+    files = [(filepath, _get_upload_key(filepath)) for filepath in filepaths]
+
+    lines = []
+    for filepath, result in zip(filepaths, s3_uploader.upload_many(files, bucket, region)):
+        if isinstance(result, Exception):
+            logger.error(f"Error uploading file to S3: {result}")
+            lines.append(f"{filepath}: Error uploading to S3: {str(result)}")
+        else:
+            lines.append(f"{filepath}: {result}")
+    return "\n".join(lines)
+
+
 class ToolManager:
     """Manages tools including MCP tools and built-in tools."""
     
     def __init__(self):
-        self.mcp_tools = None
-        self.session_id = None
-        self.trace_id = None
-    
-    def set_session_info(self, session_id: str, trace_id: str):
-        """Set session and trace IDs for tool operations"""
-        self.session_id = session_id
-        self.trace_id = trace_id
-    
+        self.mcp_pool: Optional[MCPServerPool] = None
+        self.schema_cache: Optional[MCPSchemaCache] = None
+        # Installed version of each MCP server pinned by the bake step
+        self.mcp_server_versions: Dict[str, str] = {}
+        self.code_interpreters = CodeInterpreterCache()
+        self.executor = tool_executor
+        self.tool_result_cache = ToolResultCache()
+        self.mcp_load_seconds: Optional[float] = None
+        self._load_lock = threading.Lock()
+
+    @property
+    def mcp_startup_timings(self) -> Dict[str, Optional[float]]:
+        """Startup timings in seconds, keyed by MCP server name"""
+        return self.mcp_pool.get_startup_timings() if self.mcp_pool else {}
+
+    def is_ready(self) -> bool:
+        """Whether MCP tools have been loaded"""
+        return self.mcp_pool is not None
+
     def load_mcp_tools(self) -> List[Any]:
-        """Load MCP tools from mcp.json"""
-        if self.mcp_tools is not None:
-            return self.mcp_tools
-            
+        """Load MCP tools from mcp.json
+
+        All servers are started concurrently, so the total startup time is bounded
+        by the slowest server (or MCP_SERVER_STARTUP_TIMEOUT) rather than their sum.
+        Servers whose tool specs are in the schema cache start on first use instead.
+        The servers are then kept alive by the pool's health checks, and tools of
+        servers with a "cache" setting answer repeated calls from a result cache.
+        """
+        if self.mcp_pool is not None:
+            return self.tool_result_cache.wrap_tools(self.mcp_pool.get_tools())
+
+        # Background warm-up and the first request may race to load the tools
+        with self._load_lock:
+            if self.mcp_pool is None:
+                started_at = time.perf_counter()
+                mcp_pool = self._create_mcp_pool()
+                mcp_pool.start()
+                mcp_pool.start_health_checks()
+                self.mcp_load_seconds = round(time.perf_counter() - started_at, 3)
+                self.mcp_pool = mcp_pool
+
+        mcp_tools = self.tool_result_cache.wrap_tools(self.mcp_pool.get_tools())
+        logger.info(f"Loaded {len(mcp_tools)} MCP tools")
+        return mcp_tools
+
+    def shutdown(self):
+        """Stop all MCP servers"""
+        if self.mcp_pool is not None:
+            self.mcp_pool.stop()
+        self.code_interpreters.stop()
+
+    def _create_mcp_pool(self) -> MCPServerPool:
+        """Create the MCP server pool from mcp.json"""
         try:
             with open("mcp.json", "r") as f:
                 mcp_json = json.loads(f.read())
 
-                if "mcpServers" not in mcp_json:
-                    logger.warning("mcpServers not defined in mcp.json")
-                    self.mcp_tools = []
-                    return self.mcp_tools
-
-                mcp_servers = mcp_json["mcpServers"]
-                mcp_clients = []
-                uv_env = get_uv_environment()
-
-                for server_name, server in mcp_servers.items():
-                    try:
-                        client = MCPClient(
-                            lambda: stdio_client(
-                                StdioServerParameters(
-                                    command=server["command"],
-                                    args=server.get("args", []),
-                                    env={**uv_env, **server.get("env", {})},
-                                )
-                            )
-                        )
-                        client.start()
-                        mcp_clients.append(client)
-                    except Exception as e:
-                        logger.error(f"Error creating MCP client for {server_name}: {e}")
-
-                # Flatten the tools
-                self.mcp_tools = sum([c.list_tools_sync() for c in mcp_clients], [])
-                logger.info(f"Loaded {len(self.mcp_tools)} MCP tools")
-                return self.mcp_tools
+            if "mcpServers" not in mcp_json:
+                logger.warning("mcpServers not defined in mcp.json")
+                return MCPServerPool({}, {})
+
+            mcp_servers = mcp_json["mcpServers"]
+            if MCP_SERVER_MODE == "pinned":
+                mcp_servers = pin_mcp_servers(mcp_servers, load_lock())
+                self.mcp_server_versions = {
+                    name: server["version"] for name, server in mcp_servers.items() if "version" in server
+                }
+                logger.info(f"Pinned MCP servers: {self.mcp_server_versions}")
+
+            # Pinned versions are part of the hash, so upgrading a server invalidates its cached specs
+            self.schema_cache = MCPSchemaCache(hash_config({**mcp_json, "mcpServers": mcp_servers}))
+            self.schema_cache.load()
+            return MCPServerPool(mcp_servers, get_uv_environment(), self.schema_cache)
         except Exception as e:
             logger.error(f"Error loading MCP tools: {e}")
-            self.mcp_tools = []
-            return self.mcp_tools
+            return MCPServerPool({}, {})
     
-    def get_upload_tool(self):
-        """Get the S3 upload tool with session context"""
-        session_id = self.session_id
-        trace_id = self.trace_id
-        
-        @tool
-        def upload_file_to_s3_and_retrieve_s3_url(filepath: str) -> str:
-            """Upload the file at /tmp/ws/* and retrieve the s3 path
-
-            Args:
-                filepath: The path to the uploading file
-            """
-            bucket = os.environ.get("FILE_BUCKET")
-            if not bucket:
-                # For local testing, provide a fallback message
-                logger.warning(
-                    "FILE_BUCKET environment variable not set. Using local file path for testing."
-                )
-                return f"Local file path (S3 upload skipped): {filepath}"
-
-            aws_creds = get_aws_credentials()
-            region = aws_creds.get("AWS_REGION", "us-east-1")
-
-            if not filepath.startswith(WORKSPACE_DIR):
-                raise ValueError(
-                    f"{filepath} does not appear to be a file under the {WORKSPACE_DIR} directory. Files to be uploaded must exist under {WORKSPACE_DIR}."
-                )
-
-            try:
-                filename = os.path.basename(filepath)
-                key = f"agentcore/{trace_id}/{filename}"
+    def get_upload_tools(self) -> List[Any]:
+        """Get the S3 upload tools"""
+        return [upload_file_to_s3_and_retrieve_s3_url, upload_files_to_s3_and_retrieve_s3_urls]
 
-                s3 = boto3.client("s3", region_name=region)
-                s3.upload_file(filepath, bucket, key)
+    def prewarm_code_interpreter(self):
+        """Start pre-warming code interpreter sessions if enabled"""
+        aws_creds = get_aws_credentials()
+        self.code_interpreters.prewarm(aws_creds.get("AWS_REGION", "us-east-1"))
 
-                return f"https://{bucket}.s3.{region}.amazonaws.com/{key}"
-            except Exception as e:
-                logger.error(f"Error uploading file to S3: {e}")
-                # For local testing, provide a fallback
-                return f"Error uploading to S3: {str(e)}. Local file path: {filepath}"
-        
-        return upload_file_to_s3_and_retrieve_s3_url
-    
     def get_code_interpreter_tool(self) -> List[Any]:
-        """Get code interpreter tool if available"""
-        code_interpreter_tools = []
-        
-        if CODE_INTERPRETER_AVAILABLE and AgentCoreCodeInterpreter:
-            try:
-                aws_creds = get_aws_credentials()
-                region = aws_creds.get("AWS_REGION", "us-east-1")
-                code_interpreter = AgentCoreCodeInterpreter(region=region)
-                code_interpreter_tools.append(code_interpreter.code_interpreter)
-                logger.info("Added code_interpreter tool (AgentCoreCodeInterpreter)")
-            except Exception as e:
-                logger.warning(f"Failed to initialize AgentCoreCodeInterpreter: {e}")
-        
-        return code_interpreter_tools
+        """Get code interpreter tool if available
+
+        The interpreter is reused across the requests of a conversation.
+        """
+        try:
+            aws_creds = get_aws_credentials()
+            region = aws_creds.get("AWS_REGION", "us-east-1")
+            return self.code_interpreters.get_tools(region, get_request_context().session_id)
+        except Exception as e:
+            logger.warning(f"Failed to initialize AgentCoreCodeInterpreter: {e}")
+            return []
     
     def get_all_tools(self) -> List[Any]:
-        """Get all available tools (MCP + built-in + code interpreter)"""
+        """Get all available tools (MCP + built-in + code interpreter)
+
+        Every tool runs within its concurrency limit from the executor.
+        """
         mcp_tools = self.load_mcp_tools()
-        upload_tool = self.get_upload_tool()
+        upload_tools = self.get_upload_tools()
         code_interpreter_tools = self.get_code_interpreter_tool()
         
-        all_tools = mcp_tools + [upload_tool] + code_interpreter_tools
-        logger.info(f"Total tools loaded: {len(all_tools)} (MCP: {len(mcp_tools)}, Built-in: 1, Code Interpreter: {len(code_interpreter_tools)})")
+        # MCP servers register their tools in the order they start, so tools are
+        # sorted to send the same tool specs (and hit the prompt cache) every time
+        all_tools = sorted(mcp_tools + upload_tools + code_interpreter_tools, key=lambda t: t.tool_name)
+        logger.info(f"Total tools loaded: {len(all_tools)} (MCP: {len(mcp_tools)}, Built-in: {len(upload_tools)}, Code Interpreter: {len(code_interpreter_tools)})")
         
-        return all_tools
\ No newline at end of file
+        return self.executor.wrap_tools(all_tools)
\ No newline at end of file
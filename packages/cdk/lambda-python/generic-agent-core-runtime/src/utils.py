@@ -1,14 +1,15 @@
 """Utility functions for the agent core runtime."""
 
-import base64
+import binascii
+import hashlib
 import os
-import shutil
-import pathlib
+import threading
 import logging
+from collections import OrderedDict
 from uuid import uuid4
 from typing import List, Dict, Union, Any
 from strands.types.content import ContentBlock
-from .config import WORKSPACE_DIR
+from .config import MEDIA_DECODE_CACHE_MB, MEDIA_DECODE_CACHE_MIN_KB
 
 logger = logging.getLogger(__name__)
 
@@ -18,17 +19,11 @@ def create_id() -> str:
     return str(uuid4())
 
 
-def create_ws_directory():
-    """Create workspace directory if it doesn't exist"""
-    logger.info("Create ws directory")
-    pathlib.Path(WORKSPACE_DIR).mkdir(exist_ok=True)
-
-
-def clean_ws_directory():
-    """Clean up workspace directory"""
-    logger.info("Clean ws directory...")
-    if os.path.exists(WORKSPACE_DIR):
-        shutil.rmtree(WORKSPACE_DIR)
+def is_in_directory(path: str, directory: str) -> bool:
+    """Check whether path resolves to a location inside directory"""
+    real_path = os.path.realpath(path)
+    real_directory = os.path.realpath(directory)
+    return os.path.commonpath([real_path, real_directory]) == real_directory
 
 
 def create_error_response(error_message: str) -> dict:
@@ -61,28 +56,113 @@ def create_empty_response() -> dict:
 
 # Base64 conversion utilities
 
+# Media blocks whose source bytes are base64 encoded in requests
+MEDIA_TYPES = ("image", "document", "video")
+
+_HASH_SLICE_SIZE = 1024 * 1024
+
+
+class DecodedMediaCache:
+    """Memory-bounded LRU cache of decoded base64 payloads
+
+    Clients resend the whole history on every turn, so the same media payloads
+    are decoded again and again. Payloads are keyed by a hash of their base64
+    text, so identical payloads share one decoded buffer across turns.
+    """
+
+    def __init__(self, max_bytes: int, min_payload_bytes: int):
+        self.max_bytes = max_bytes
+        self.min_payload_bytes = min_payload_bytes
+        self._buffers: "OrderedDict[bytes, bytes]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(value: str) -> bytes:
+        # Hash in slices so the payload is never copied as a whole
+        digest = hashlib.blake2b(digest_size=16)
+        for i in range(0, len(value), _HASH_SLICE_SIZE):
+            digest.update(value[i:i + _HASH_SLICE_SIZE].encode("ascii"))
+        return digest.digest()
+
+    def decode(self, value: str) -> bytes:
+        if len(value) < self.min_payload_bytes or self.max_bytes <= 0:
+            return _b64decode(value)
+
+        key = self._key(value)
+        with self._lock:
+            decoded = self._buffers.get(key)
+            if decoded is not None:
+                self._buffers.move_to_end(key)
+                self.hits += 1
+                return decoded
+            self.misses += 1
+
+        decoded = _b64decode(value)
+        if len(decoded) > self.max_bytes:
+            return decoded
+
+        with self._lock:
+            if key not in self._buffers:
+                self._buffers[key] = decoded
+                self._size += len(decoded)
+            while self._size > self.max_bytes:
+                _, evicted = self._buffers.popitem(last=False)
+                self._size -= len(evicted)
+        return decoded
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._buffers),
+                "bytes": self._size,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+decoded_media_cache = DecodedMediaCache(
+    max_bytes=MEDIA_DECODE_CACHE_MB * 1024 * 1024,
+    min_payload_bytes=MEDIA_DECODE_CACHE_MIN_KB * 1024,
+)
+
+
+def _b64decode(value: str) -> bytes:
+    """Decode base64 text that may lack its trailing padding"""
+    # a2b_base64 reads ASCII str in place, so a padded payload is not copied to bytes
+    # first. An unpadded one is copied once to append its padding.
+    missing_padding = -len(value) % 4
+    try:
+        if missing_padding:
+            return binascii.a2b_base64(value + "=" * missing_padding)
+        return binascii.a2b_base64(value)
+    except binascii.Error:
+        # Payloads with embedded whitespace have a misleading length
+        return binascii.a2b_base64(value + "==")
+
+
 def decode_base64_string(value: Any) -> bytes:
     """Convert base64 string or bytes to bytes"""
     if isinstance(value, bytes):
         return value
     elif isinstance(value, str):
-        return base64.b64decode(value + "==")  # add padding
+        return decoded_media_cache.decode(value)
     else:
         raise ValueError(f"Invalid value type: {type(value)}")
 
 
 def convert_content_block_bytes(block: Dict[str, Any]) -> Dict[str, Any]:
-    """Convert base64 strings to bytes in a content block"""
-    block = block.copy()
+    """Convert base64 strings to bytes in a content block
 
+    The block is converted in place, so large payloads are never copied.
+    """
     # Handle image, document, and video blocks
-    for media_type in ["image", "document", "video"]:
+    for media_type in MEDIA_TYPES:
         if media_type in block:
-            media_data = block[media_type]
-            if "source" in media_data and "bytes" in media_data["source"]:
-                media_data["source"]["bytes"] = decode_base64_string(
-                    media_data["source"]["bytes"]
-                )
+            source = block[media_type].get("source")
+            if source and "bytes" in source:
+                source["bytes"] = decode_base64_string(source["bytes"])
 
     return block
 
@@ -112,20 +192,16 @@ def process_messages(messages: Union[List[Any], List[Dict[str, Any]]]) -> List[A
     if not messages or not isinstance(messages[0], dict):
         return messages
     
-    # Import Message here to avoid circular imports
-    from .types import Message
-    
-    processed_messages = []
+    # Messages are request-owned dicts, so they are converted in place and
+    # returned as-is (Message is a TypedDict)
     for message in messages:
-        msg = message.copy()
-        if "content" in msg and isinstance(msg["content"], list):
-            msg["content"] = [
-                convert_content_block_bytes(block) if isinstance(block, dict) else block
-                for block in msg["content"]
-            ]
-        processed_messages.append(Message(**msg))
+        content = message.get("content")
+        if isinstance(content, list):
+            for block in content:
+                if isinstance(block, dict):
+                    convert_content_block_bytes(block)
     
-    return processed_messages
+    return messages
 
 
 def process_prompt(prompt: Union[str, List[Dict[str, Any]]]) -> Union[str, List[ContentBlock]]:
@@ -0,0 +1,214 @@
+"""Workspace lifecycle for the agent core runtime."""
+
+import asyncio
+import logging
+import os
+import pathlib
+import queue
+import shutil
+import threading
+import time
+from typing import Dict, Optional, Any
+from .config import WORKSPACE_DIR, WORKSPACE_QUOTA_MB, WORKSPACE_SWEEP_INTERVAL
+from .utils import create_id
+
+logger = logging.getLogger(__name__)
+
+
+class WorkspaceQuotaExceededError(Exception):
+    """Raised when WORKSPACE_DIR uses more disk than WORKSPACE_QUOTA_MB"""
+
+
+def directory_size(path: str) -> int:
+    """Get the total size of the files under path"""
+    size = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                size += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return size
+
+
+class WorkspaceLease:
+    """A workspace in use by an invocation, released once it no longer needs it"""
+
+    def __init__(self, reaper: "WorkspaceReaper", path: str):
+        self.reaper = reaper
+        self.path = path
+        self._released = False
+
+    def release(self):
+        """Hand the workspace to the reaper (only the first call has an effect)"""
+        if not self._released:
+            self._released = True
+            self.reaper.release(self.path)
+
+
+class WorkspaceReaper:
+    """Creates workspaces and deletes them in a background thread
+
+    Workspaces are shared by the invocations of a session, so a workspace is
+    only deleted once every invocation using it has released it. Deleting a
+    large workspace never blocks the event loop, and directories that were left
+    behind (e.g. by a previous process) are removed by a periodic sweep, which
+    also measures the disk usage checked against WORKSPACE_QUOTA_MB.
+    """
+
+    def __init__(
+        self,
+        root: str = WORKSPACE_DIR,
+        quota_mb: int = WORKSPACE_QUOTA_MB,
+        sweep_interval: float = WORKSPACE_SWEEP_INTERVAL,
+    ):
+        self.root = root
+        self.quota_bytes = quota_mb * 1024 * 1024
+        self.sweep_interval = sweep_interval
+        self._leases: Dict[str, int] = {}
+        self._queue: "queue.Queue[tuple[str, float]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.usage_bytes = 0
+        self.reaped = 0
+        self.reclaimed_bytes = 0
+        self.cleanup_seconds = 0.0
+        self.max_cleanup_latency = 0.0
+        self.rejected = 0
+
+    def start(self):
+        """Start the reaper thread"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="workspace-reaper", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the reaper thread and delete the workspaces waiting for it"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._drain()
+
+    async def acquire(self, path: str) -> WorkspaceLease:
+        """Create the workspace (if needed) for an invocation"""
+        if self.quota_bytes and self.usage_bytes > self.quota_bytes:
+            with self._lock:
+                self.rejected += 1
+            raise WorkspaceQuotaExceededError(
+                f"Workspace disk usage of {self.usage_bytes} bytes exceeds the quota of {self.quota_bytes} bytes"
+            )
+
+        with self._lock:
+            self._leases[path] = self._leases.get(path, 0) + 1
+        lease = WorkspaceLease(self, path)
+
+        logger.info(f"Create ws directory: {path}")
+        try:
+            await asyncio.to_thread(pathlib.Path(path).mkdir, parents=True, exist_ok=True)
+        except Exception:
+            lease.release()
+            raise
+        return lease
+
+    def release(self, path: str):
+        """Queue the workspace for deletion once no invocation uses it"""
+        with self._lock:
+            count = self._leases.get(path, 0) - 1
+            if count > 0:
+                self._leases[path] = count
+                return
+            self._leases.pop(path, None)
+        self._queue.put((path, time.monotonic()))
+        if self._thread is None:
+            # Without the reaper thread (e.g. in scripts) delete right away
+            self._drain()
+
+    def _run(self):
+        self._sweep()
+        next_sweep_at = time.monotonic() + self.sweep_interval
+        while not self._stop_event.is_set():
+            try:
+                path, released_at = self._queue.get(
+                    timeout=max(0, min(next_sweep_at - time.monotonic(), 1))
+                )
+                self._reap(path, released_at)
+            except queue.Empty:
+                pass
+            except Exception as e:
+                logger.error(f"Error cleaning ws directory: {e}")
+
+            if time.monotonic() >= next_sweep_at:
+                self._sweep()
+                next_sweep_at = time.monotonic() + self.sweep_interval
+
+    def _drain(self):
+        while True:
+            try:
+                path, released_at = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                self._reap(path, released_at)
+            except Exception as e:
+                logger.error(f"Error cleaning ws directory: {e}")
+
+    def _reap(self, path: str, released_at: float):
+        """Delete a workspace unless it was acquired again in the meantime"""
+        started_at = time.perf_counter()
+        with self._lock:
+            if path in self._leases or not os.path.exists(path):
+                return
+            # Move the workspace aside so that an invocation acquiring it while
+            # it is being deleted starts with a new, empty directory
+            trash = f"{path}.deleting-{create_id()}"
+            os.rename(path, trash)
+
+        size = directory_size(trash)
+        shutil.rmtree(trash, ignore_errors=True)
+
+        elapsed = time.perf_counter() - started_at
+        latency = time.monotonic() - released_at
+        with self._lock:
+            self.reaped += 1
+            self.reclaimed_bytes += size
+            self.cleanup_seconds += elapsed
+            self.max_cleanup_latency = max(self.max_cleanup_latency, latency)
+        logger.info(f"Cleaned ws directory {path}: reclaimed {size} bytes in {elapsed:.3f}s")
+
+    def _sweep(self):
+        """Measure disk usage and queue workspaces that nothing holds"""
+        if not os.path.isdir(self.root):
+            self.usage_bytes = 0
+            return
+
+        now = time.monotonic()
+        with self._lock:
+            leased = set(self._leases)
+        for entry in os.scandir(self.root):
+            if entry.path in leased:
+                continue
+            if ".deleting-" in entry.name:
+                shutil.rmtree(entry.path, ignore_errors=True)
+            elif entry.is_dir(follow_symlinks=False):
+                self._queue.put((entry.path, now))
+        self.usage_bytes = directory_size(self.root)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "active": len(self._leases),
+                "pending": self._queue.qsize(),
+                "reaped": self.reaped,
+                "reclaimed_bytes": self.reclaimed_bytes,
+                "cleanup_seconds": round(self.cleanup_seconds, 3),
+                "max_cleanup_latency_seconds": round(self.max_cleanup_latency, 3),
+                "usage_bytes": self.usage_bytes,
+                "quota_bytes": self.quota_bytes or None,
+                "rejected": self.rejected,
+            }
+
+
+workspace_reaper = WorkspaceReaper()
@@ -0,0 +1,149 @@
+import asyncio
+import pytest
+from src.admission import AdmissionController, AdmissionRejectedError
+
+
+async def settle():
+    # Let the waiters that were admitted resume
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_admits_up_to_the_limit_without_waiting():
+    async def run():
+        controller = AdmissionController(max_concurrent=2, queue_size=10, timeout=1)
+        await controller.acquire("a")
+        await controller.acquire("b")
+        return controller.stats()
+
+    stats = asyncio.run(run())
+    assert stats["running"] == 2
+    assert stats["waiting"] == 0
+    assert stats["queued"] == 0
+
+
+def test_free_slot_goes_to_the_session_with_fewest_running_agents():
+    async def run():
+        controller = AdmissionController(max_concurrent=2, queue_size=10, timeout=5)
+        burst = await controller.acquire("burst")
+        await controller.acquire("burst")
+
+        admitted = []
+
+        async def invoke(session_id):
+            ticket = await controller.acquire(session_id)
+            admitted.append(session_id)
+            return ticket
+
+        # The bursting session queues first, then another session
+        tasks = [asyncio.create_task(invoke("burst")) for _ in range(3)]
+        await settle()
+        tasks.append(asyncio.create_task(invoke("other")))
+        await settle()
+        assert admitted == []
+
+        burst.release()
+        await settle()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        return admitted
+
+    assert asyncio.run(run()) == ["other"]
+
+
+def test_waiters_of_a_session_are_admitted_in_order():
+    async def run():
+        controller = AdmissionController(max_concurrent=1, queue_size=10, timeout=5)
+        ticket = await controller.acquire("a")
+        admitted = []
+
+        async def invoke(name):
+            next_ticket = await controller.acquire("b")
+            admitted.append(name)
+            next_ticket.release()
+
+        tasks = []
+        for name in ("first", "second", "third"):
+            tasks.append(asyncio.create_task(invoke(name)))
+            await settle()
+        ticket.release()
+        await asyncio.gather(*tasks)
+        return admitted, controller.stats()
+
+    admitted, stats = asyncio.run(run())
+    assert admitted == ["first", "second", "third"]
+    assert stats["running"] == 0
+    assert stats["waiting"] == 0
+
+
+def test_rejects_when_the_queue_is_full():
+    async def run():
+        controller = AdmissionController(max_concurrent=1, queue_size=1, timeout=5)
+        await controller.acquire("a")
+        waiting = asyncio.create_task(controller.acquire("b"))
+        await settle()
+        with pytest.raises(AdmissionRejectedError) as e:
+            await controller.acquire("c")
+        waiting.cancel()
+        await asyncio.gather(waiting, return_exceptions=True)
+        return e.value, controller.stats()
+
+    error, stats = asyncio.run(run())
+    assert error.retry_after >= 1
+    assert stats["rejected_queue_full"] == 1
+    assert stats["waiting"] == 0
+
+
+def test_rejects_once_the_wait_times_out():
+    async def run():
+        controller = AdmissionController(max_concurrent=1, queue_size=10, timeout=0.05)
+        await controller.acquire("a")
+        with pytest.raises(AdmissionRejectedError):
+            await controller.acquire("b")
+        return controller.stats()
+
+    stats = asyncio.run(run())
+    assert stats["rejected_timeout"] == 1
+    assert stats["waiting"] == 0
+    assert stats["running"] == 1
+
+
+def test_release_only_has_an_effect_once():
+    async def run():
+        controller = AdmissionController(max_concurrent=1, queue_size=10, timeout=5)
+        ticket = await controller.acquire("a")
+        ticket.release()
+        ticket.release()
+        return controller.stats()
+
+    stats = asyncio.run(run())
+    assert stats["running"] == 0
+    assert stats["sessions_running"] == 0
+
+
+def test_cancelled_waiter_gives_back_a_slot_it_was_handed():
+    async def run():
+        controller = AdmissionController(max_concurrent=1, queue_size=10, timeout=5)
+        ticket = await controller.acquire("a")
+        waiting = asyncio.create_task(controller.acquire("b"))
+        await settle()
+        # The slot is handed to the waiter, which is cancelled before it resumes
+        ticket.release()
+        waiting.cancel()
+        await asyncio.gather(waiting, return_exceptions=True)
+        return controller.stats()
+
+    stats = asyncio.run(run())
+    assert stats["running"] == 0
+    assert stats["waiting"] == 0
+
+
+def test_disabled_controller_admits_everything():
+    async def run():
+        controller = AdmissionController(max_concurrent=0, queue_size=0, timeout=0)
+        for _ in range(100):
+            await controller.acquire("a")
+        return controller.stats()
+
+    assert asyncio.run(run())["admitted"] == 100
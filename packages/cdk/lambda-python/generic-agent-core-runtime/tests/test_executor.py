@@ -0,0 +1,49 @@
+import asyncio
+import threading
+from src.executor import ToolExecutor
+
+
+class SyncTool:
+    tool_name = "sync"
+    tool_spec = {"name": "sync"}
+    tool_type = "python"
+
+    async def stream(self, tool_use, invocation_state, **kwargs):
+        thread = await asyncio.to_thread(lambda: threading.current_thread().name)
+        yield {"toolUseId": tool_use["toolUseId"], "status": "success", "content": [{"text": thread}]}
+
+
+def test_tool_work_runs_on_the_tool_threads_and_other_work_does_not():
+    executor = ToolExecutor(max_threads=1, limits={})
+    tool = executor.wrap_tools([SyncTool()])[0]
+
+    async def run():
+        executor.install(asyncio.get_running_loop())
+        events = [e async for e in tool.stream({"toolUseId": "1", "input": {}}, {})]
+        other = await asyncio.to_thread(lambda: threading.current_thread().name)
+        return events[-1]["content"][0]["text"], other
+
+    tool_thread, other_thread = asyncio.run(run())
+
+    assert tool_thread.startswith("tool-worker")
+    assert other_thread.startswith("loop-worker")
+    assert executor.stats()["threads"]["completed"] == 1
+
+
+async def collect(stream):
+    return [e async for e in stream]
+
+
+def test_tool_limits_queue_calls_of_the_same_tool():
+    executor = ToolExecutor(max_threads=4, default_limit=1, limits={})
+    tool = executor.wrap_tools([SyncTool()])[0]
+
+    async def run():
+        executor.install(asyncio.get_running_loop())
+        await asyncio.gather(*(collect(tool.stream({"toolUseId": str(i), "input": {}}, {})) for i in range(3)))
+
+    asyncio.run(run())
+
+    stats = executor.stats()["tools"]["sync"]
+    assert stats["calls"] == 3
+    assert stats["max_queued"] == 2
@@ -0,0 +1,99 @@
+from src.history import HistoryManager, estimate_block_tokens, estimate_message_tokens
+
+
+def user(text: str):
+    return {"role": "user", "content": [{"text": text}]}
+
+
+def assistant(text: str):
+    return {"role": "assistant", "content": [{"text": text}]}
+
+
+def tool_use(tool_use_id: str):
+    return {"role": "assistant", "content": [{"toolUse": {"toolUseId": tool_use_id, "name": "search", "input": {}}}]}
+
+
+def tool_result(tool_use_id: str, text: str):
+    return {"role": "user", "content": [{"toolResult": {"toolUseId": tool_use_id, "content": [{"text": text}]}}]}
+
+
+def test_media_is_estimated_per_block_not_per_byte():
+    pdf = {"document": {"format": "pdf", "name": "report", "source": {"bytes": b"x" * 5 * 1024 * 1024}}}
+    csv = {"document": {"format": "csv", "name": "data", "source": {"bytes": b"x" * 4000}}}
+    video = {"video": {"format": "mp4", "source": {"bytes": b"x" * 50 * 1024 * 1024}}}
+
+    assert estimate_block_tokens(pdf) < 10000
+    assert estimate_block_tokens(video) < 20000
+    assert estimate_block_tokens(csv) == 1001
+
+
+def test_history_within_the_budget_is_not_compacted():
+    messages = [user("a"), assistant("b")]
+
+    assert HistoryManager(token_budget=100, keep_turns=1).compact(messages) == (messages, None)
+
+
+def test_old_tool_results_and_media_are_compacted_first():
+    image = {"image": {"format": "png", "source": {"bytes": b"png"}}}
+    messages = [
+        {"role": "user", "content": [{"text": "look"}, image]},
+        tool_use("1"),
+        tool_result("1", "x" * 4000),
+        assistant("done"),
+        user("next"),
+        assistant("ok"),
+    ]
+    manager = HistoryManager(token_budget=500, keep_turns=1, tool_result_max_chars=100)
+
+    compacted, report = manager.compact(messages)
+
+    assert len(compacted) == len(messages)
+    assert compacted[0]["content"][1]["text"].startswith("[image")
+    assert compacted[2]["content"][0]["toolResult"]["content"][0]["text"].startswith("x" * 100 + "\n...")
+    assert report.truncated_tool_results == 1
+    assert report.replaced_media == 1
+    assert report.dropped_messages == 0
+    assert report.tokens_after <= 500
+    # The history of the client is not modified
+    assert messages[2]["content"][0]["toolResult"]["content"][0]["text"] == "x" * 4000
+
+
+def test_oldest_turns_are_dropped_whole():
+    messages = [user("a" * 400), tool_use("1"), tool_result("1", "b"), assistant("c" * 400), user("d"), assistant("e")]
+    manager = HistoryManager(token_budget=50, keep_turns=1)
+
+    compacted, report = manager.compact(messages)
+
+    assert compacted == [user("d"), assistant("e")]
+    assert report.dropped_messages == 4
+    assert sum(estimate_message_tokens(m) for m in compacted) == report.tokens_after
+
+
+def test_dropped_turns_are_summarized_once():
+    messages = [user("a" * 400), assistant("b" * 400), user("c"), assistant("d")]
+    manager = HistoryManager(token_budget=50, keep_turns=1)
+    calls = []
+
+    def summarize(dropped):
+        calls.append(dropped)
+        return "they talked"
+
+    compacted, report = manager.compact(messages, summarize)
+    manager.compact(messages, summarize)
+
+    assert compacted[0]["content"][0] == {"text": "Summary of the earlier conversation:\nthey talked"}
+    assert compacted[0]["content"][1:] == [{"text": "c"}]
+    assert report.summarized
+    assert len(calls) == 1
+
+
+def test_failed_summaries_drop_the_turns():
+    messages = [user("a" * 400), assistant("b" * 400), user("c"), assistant("d")]
+
+    def summarize(dropped):
+        raise RuntimeError("throttled")
+
+    compacted, report = HistoryManager(token_budget=50, keep_turns=1).compact(messages, summarize)
+
+    assert compacted == [user("c"), assistant("d")]
+    assert not report.summarized
@@ -0,0 +1,119 @@
+import asyncio
+import base64
+import json
+import pytest
+import src.parser
+from src.parser import RequestTooLargeError, _BodyReader, parse_request_body
+from src.utils import process_messages, process_prompt
+
+
+class FakeRequest:
+    def __init__(self, chunks, headers=None):
+        self.chunks = chunks
+        self.headers = headers or {}
+
+    async def stream(self):
+        for chunk in self.chunks:
+            yield chunk
+
+
+def split(body: bytes, size: int):
+    return [body[i:i + size] for i in range(0, len(body), size)]
+
+
+BODY = {
+    "prompt": [{"text": "Describe the image"}],
+    "messages": [
+        {
+            "role": "user",
+            "content": [
+                {"text": "hi"},
+                {"image": {"format": "png", "source": {"bytes": base64.b64encode(b"\x89PNG data").decode()}}},
+            ],
+        }
+    ],
+    "model": {"modelId": "us.anthropic.m", "region": "us-east-1", "temperature": 0.5},
+}
+
+
+def test_body_reader_reads_chunks_and_counts_bytes():
+    async def run():
+        reader = _BodyReader(FakeRequest([b"abc", b"", b"defg"]), max_bytes=100)
+        return await reader.read(2), await reader.read(), await reader.read(), await reader.read(), reader.size
+
+    assert asyncio.run(run()) == (b"ab", b"c", b"defg", b"", 7)
+
+
+def test_body_reader_reads_the_rest_at_once():
+    async def run():
+        reader = _BodyReader(FakeRequest([b"abc", b"def", b"gh"]), max_bytes=100)
+        first = await reader.read(1)
+        return first, await reader.read_all()
+
+    assert asyncio.run(run()) == (b"a", bytearray(b"bcdefgh"))
+
+
+def test_body_reader_stops_at_the_limit():
+    async def run():
+        reader = _BodyReader(FakeRequest([b"abcd", b"efgh", b"ijkl"]), max_bytes=10)
+        await reader.read_all()
+
+    with pytest.raises(RequestTooLargeError):
+        asyncio.run(run())
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_parses_the_body_and_decodes_media(monkeypatch, streaming):
+    monkeypatch.setattr(src.parser, "STREAMING_REQUEST_PARSE", streaming)
+    request = FakeRequest(split(json.dumps(BODY).encode(), 16))
+
+    data = asyncio.run(parse_request_body(request))
+
+    assert data["prompt"] == BODY["prompt"]
+    assert data["model"] == BODY["model"]
+    payload = data["messages"][0]["content"][1]["image"]["source"]["bytes"]
+    # The incremental parser decodes media payloads as they are parsed, the other path leaves them to the agent
+    assert payload == (b"\x89PNG data" if streaming else base64.b64encode(b"\x89PNG data").decode())
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_rejects_bodies_over_the_limit(monkeypatch, streaming):
+    monkeypatch.setattr(src.parser, "STREAMING_REQUEST_PARSE", streaming)
+    monkeypatch.setattr(src.parser, "MAX_REQUEST_BODY_MB", 1)
+    body = json.dumps({"prompt": "x" * (2 * 1024 * 1024)}).encode()
+
+    with pytest.raises(RequestTooLargeError):
+        asyncio.run(parse_request_body(FakeRequest(split(body, 64 * 1024))))
+
+
+def test_rejects_bodies_by_content_length_before_reading(monkeypatch):
+    monkeypatch.setattr(src.parser, "MAX_REQUEST_BODY_MB", 1)
+    request = FakeRequest([], headers={"content-length": str(2 * 1024 * 1024)})
+
+    with pytest.raises(RequestTooLargeError):
+        asyncio.run(parse_request_body(request))
+
+
+def test_both_parse_paths_give_the_same_messages(monkeypatch):
+    image = {"image": {"format": "png", "source": {"bytes": base64.b64encode(b"\x89PNG data").decode()}}}
+    body = json.dumps({
+        "prompt": [{"text": "And this one?"}, image],
+        "messages": [
+            {"role": "user", "content": [{"text": "Describe it"}, image]},
+            {"role": "assistant", "content": [{"toolUse": {"toolUseId": "1", "name": "draw", "input": image}}]},
+            {"role": "user", "content": [{"toolResult": {"toolUseId": "1", "content": [image]}}]},
+        ],
+    }).encode()
+
+    def parse(streaming):
+        monkeypatch.setattr(src.parser, "STREAMING_REQUEST_PARSE", streaming)
+        data = asyncio.run(parse_request_body(FakeRequest(split(body, 16))))
+        return process_messages(data["messages"]), process_prompt(data["prompt"])
+
+    assert parse(True) == parse(False)
+    messages, prompt = parse(True)
+    assert messages[0]["content"][1]["image"]["source"]["bytes"] == b"\x89PNG data"
+    assert prompt[1]["image"]["source"]["bytes"] == b"\x89PNG data"
+    # Media nested in tool uses and tool results stays base64 text
+    assert messages[1]["content"][0]["toolUse"]["input"] == image
+    assert messages[2]["content"][0]["toolResult"]["content"][0] == image
@@ -0,0 +1,67 @@
+from src.config import FIXED_SYSTEM_PROMPT, get_system_prompt
+from src.prompt_cache import CACHE_POINT, PromptCachingBedrockModel, apply_auto_cache_to_messages, get_supported_cache_fields
+
+
+def user(text: str):
+    return {"role": "user", "content": [{"text": text}]}
+
+
+def assistant(text: str):
+    return {"role": "assistant", "content": [{"text": text}]}
+
+
+def test_cache_fields_of_listed_and_unlisted_models():
+    assert get_supported_cache_fields("us.anthropic.claude-sonnet-4-20250514-v1:0") == ["messages", "system", "tools"]
+    assert get_supported_cache_fields("apac.amazon.nova-pro-v1:0") == ["messages", "system"]
+    # Models released after the table was written keep caching by family
+    assert get_supported_cache_fields("us.anthropic.claude-sonnet-4-5-20250929-v1:0") == ["messages", "system", "tools"]
+    assert get_supported_cache_fields("amazon.nova-2-lite-v1:0") == ["messages", "system"]
+    assert get_supported_cache_fields("meta.llama3-70b-instruct-v1:0") == []
+
+
+def test_cache_points_go_on_the_last_two_user_messages():
+    messages = [user("a"), assistant("b"), user("c"), assistant("d"), user("e")]
+
+    cached = apply_auto_cache_to_messages(messages, ["messages"])
+
+    assert [CACHE_POINT in m["content"] for m in cached] == [False, False, True, False, True]
+    # The history itself is not modified
+    assert all(CACHE_POINT not in m["content"] for m in messages)
+
+
+def test_cache_points_of_the_client_are_dropped():
+    messages = [user("a"), user("b"), user("c")]
+    messages[0] = {"role": "user", "content": [{"text": "a"}, CACHE_POINT]}
+
+    cached = apply_auto_cache_to_messages(messages, ["messages"])
+
+    assert cached[0]["content"] == [{"text": "a"}]
+
+
+def test_fixed_system_prompt_is_the_same_for_every_session():
+    first = get_system_prompt("Be concise", "/tmp/ws/session-1")
+    second = get_system_prompt("Be concise", "/tmp/ws/session-2")
+
+    assert first.startswith(FIXED_SYSTEM_PROMPT)
+    assert "/tmp/ws" not in FIXED_SYSTEM_PROMPT
+    assert first.rpartition("\n")[0] == second.rpartition("\n")[0]
+    assert first.endswith("`/tmp/ws/session-1`")
+
+
+def test_system_cache_point_goes_before_the_workspace_of_the_session():
+    model = PromptCachingBedrockModel("us.anthropic.claude-sonnet-4-20250514-v1:0", region_name="us-east-1")
+    system_prompt = get_system_prompt("Be concise", "/tmp/ws/session-1")
+
+    request = model.format_request([user("hi")], None, system_prompt)
+
+    shared, _, session = system_prompt.rpartition("\n")
+    assert request["system"] == [{"text": shared}, CACHE_POINT, {"text": session}]
+
+
+def test_models_without_caching_get_no_cache_points():
+    model = PromptCachingBedrockModel("meta.llama3-70b-instruct-v1:0", region_name="us-east-1")
+
+    request = model.format_request([user("hi")], None, "a\nb")
+
+    assert request["system"] == [{"text": "a\nb"}]
+    assert request["messages"] == [user("hi")]
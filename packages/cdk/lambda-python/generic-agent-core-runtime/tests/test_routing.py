@@ -0,0 +1,215 @@
+import asyncio
+import pytest
+import time
+from botocore.exceptions import ClientError
+from strands.types.exceptions import ModelThrottledException
+from src.routing import BedrockRouter, CircuitBreaker, ModelCallFailedError, is_retryable, route_model_id
+
+
+def client_error(code: str) -> ClientError:
+    return ClientError({"Error": {"Code": code, "Message": code}}, "ConverseStream")
+
+
+def test_circuit_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(failures=3, cooldown=60)
+
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+
+    assert breaker.state == "open"
+    assert not breaker.allow()
+    assert breaker.opens == 1
+
+
+def test_success_resets_the_failure_count():
+    breaker = CircuitBreaker(failures=2, cooldown=60)
+
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+
+    assert breaker.state == "closed"
+
+
+def test_half_open_circuit_lets_a_single_probe_through():
+    breaker = CircuitBreaker(failures=1, cooldown=0.01)
+    breaker.record_failure()
+    time.sleep(0.02)
+
+    assert breaker.allow()
+    assert breaker.state == "half_open"
+    assert not breaker.allow()
+
+
+def test_probe_success_closes_the_circuit():
+    breaker = CircuitBreaker(failures=1, cooldown=0.01)
+    breaker.record_failure()
+    time.sleep(0.02)
+    breaker.allow()
+
+    breaker.record_success()
+
+    assert breaker.state == "closed"
+    assert breaker.allow()
+
+
+def test_probe_failure_opens_the_circuit_again():
+    breaker = CircuitBreaker(failures=1, cooldown=0.01)
+    breaker.record_failure()
+    time.sleep(0.02)
+    breaker.allow()
+
+    breaker.record_failure()
+
+    assert breaker.state == "open"
+    assert not breaker.allow()
+    assert breaker.opens == 2
+
+
+def test_released_probe_lets_another_one_through():
+    breaker = CircuitBreaker(failures=1, cooldown=0.01)
+    breaker.record_failure()
+    time.sleep(0.02)
+    breaker.allow()
+
+    breaker.release()
+
+    assert breaker.allow()
+
+
+def test_retryable_errors():
+    assert is_retryable(ModelThrottledException("throttled"))
+    assert is_retryable(client_error("ServiceUnavailableException"))
+    assert not is_retryable(client_error("ValidationException"))
+    assert not is_retryable(ValueError("bad"))
+
+
+def test_route_model_id_switches_the_geography_of_inference_profiles():
+    assert route_model_id("us.anthropic.claude-sonnet-4-20250514-v1:0", "eu-west-1") == (
+        "eu.anthropic.claude-sonnet-4-20250514-v1:0"
+    )
+    assert route_model_id("us.amazon.nova-pro-v1:0", "ap-northeast-1") == "apac.amazon.nova-pro-v1:0"
+    assert route_model_id("anthropic.claude-sonnet-4-20250514-v1:0", "eu-west-1") == (
+        "anthropic.claude-sonnet-4-20250514-v1:0"
+    )
+
+
+def test_router_skips_routes_whose_circuit_is_open():
+    router = BedrockRouter(failover_regions=["us-west-2"], max_retries=0, circuit_failures=1, circuit_cooldown=60)
+    routes = [("us.m", "us-east-1"), ("us.m", "us-west-2")]
+
+    assert router.choose_route(routes, set()) == routes[0]
+    router.record_failure(routes[0], ModelThrottledException("throttled"))
+
+    assert router.choose_route(routes, set()) == routes[1]
+    assert router.stats()["routes"]["us.m@us-east-1"]["throttles"] == 1
+
+
+def test_router_uses_the_route_that_opened_first_when_every_circuit_is_open():
+    router = BedrockRouter(failover_regions=["us-west-2"], max_retries=0, circuit_failures=1, circuit_cooldown=60)
+    routes = [("us.m", "us-east-1"), ("us.m", "us-west-2")]
+    router.record_failure(routes[1], ModelThrottledException("throttled"))
+    router.record_failure(routes[0], ModelThrottledException("throttled"))
+
+    assert router.choose_route(routes, set()) == routes[1]
+
+
+def test_non_retryable_errors_do_not_count_against_a_route():
+    router = BedrockRouter(failover_regions=["us-west-2"], max_retries=0, circuit_failures=1, circuit_cooldown=60)
+    routes = [("us.m", "us-east-1"), ("us.m", "us-west-2")]
+
+    router.record_failure(routes[0], client_error("ValidationException"))
+
+    assert router.choose_route(routes, set()) == routes[0]
+
+
+def test_retry_budget_runs_out():
+    router = BedrockRouter(failover_regions=[], max_retries=3, retry_budget=2)
+
+    assert router.spend_retry_token()
+    assert router.spend_retry_token()
+    assert not router.spend_retry_token()
+    assert router.stats()["retries_denied"] == 1
+
+
+def test_router_is_disabled_without_retries_hedging_or_failover():
+    router = BedrockRouter(failover_regions=[], max_retries=0, hedge_after_ms=0)
+
+    assert not router.enabled
+    assert router.client_config is None
+
+
+class FakeModel:
+    def __init__(self, region: str, throttled: bool):
+        self.region = region
+        self.throttled = throttled
+        self.calls = 0
+
+    async def stream(self, messages, tool_specs=None, system_prompt=None, **kwargs):
+        self.calls += 1
+        if self.throttled:
+            raise ModelThrottledException(f"throttled in {self.region}")
+        yield {"messageStart": {"role": "assistant"}}
+        yield {"contentBlockDelta": {"delta": {"text": self.region}}}
+
+
+class FakeModelPool:
+    def __init__(self, throttled_regions):
+        self.models = {}
+        self.throttled_regions = throttled_regions
+
+    def get_model(self, model_id: str, region: str):
+        if region not in self.models:
+            self.models[region] = FakeModel(region, region in self.throttled_regions)
+        return self.models[region]
+
+
+def stream(router: BedrockRouter, pool: FakeModelPool):
+    async def run():
+        model = router.get_model(pool, "us.m", "us-east-1")
+        return [event async for event in model.stream([{"role": "user", "content": [{"text": "hi"}]}])]
+
+    return asyncio.run(run())
+
+
+def test_throttled_call_fails_over_without_retries():
+    router = BedrockRouter(failover_regions=["us-west-2"], max_retries=0, hedge_after_ms=0)
+    pool = FakeModelPool({"us-east-1"})
+
+    events = stream(router, pool)
+
+    assert events[-1] == {"contentBlockDelta": {"delta": {"text": "us-west-2"}}}
+    assert router.stats()["failovers"] == 1
+    assert router.stats()["retries"] == 0
+
+
+def test_throttling_that_exhausts_the_retries_never_reaches_strands_as_a_throttle():
+    router = BedrockRouter(
+        failover_regions=["us-west-2"], max_retries=1, retry_base_delay=0.001, hedge_after_ms=0
+    )
+    pool = FakeModelPool({"us-east-1", "us-west-2"})
+
+    # strands would retry a ModelThrottledException with a blocking sleep
+    with pytest.raises(ModelCallFailedError) as error:
+        stream(router, pool)
+
+    assert not isinstance(error.value, ModelThrottledException)
+    assert isinstance(error.value.__cause__, ModelThrottledException)
+
+    # Each region once, then one retry, and no more
+    assert sum(model.calls for model in pool.models.values()) == 3
+    assert router.stats()["retries"] == 1
+    assert router.stats()["failed_calls"] == 1
+
+
+def test_throttling_stops_when_the_retry_budget_runs_out():
+    router = BedrockRouter(failover_regions=[], max_retries=5, retry_budget=1, retry_base_delay=0.001)
+    pool = FakeModelPool({"us-east-1"})
+
+    with pytest.raises(ModelCallFailedError):
+        stream(router, pool)
+
+    assert pool.models["us-east-1"].calls == 2
+    assert router.stats()["retries_denied"] == 1
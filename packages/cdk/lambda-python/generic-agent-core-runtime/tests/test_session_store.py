@@ -0,0 +1,99 @@
+import os
+import pytest
+from src.session_store import HistoryVersionMismatchError, SessionHistoryStore
+
+
+def user(text: str):
+    return {"role": "user", "content": [{"text": text}]}
+
+
+def assistant(text: str):
+    return {"role": "assistant", "content": [{"text": text}]}
+
+
+def store(tmp_path, memory_bytes=1024 * 1024, disk_bytes=1024 * 1024):
+    return SessionHistoryStore(memory_bytes=memory_bytes, directory=str(tmp_path), disk_bytes=disk_bytes)
+
+
+def test_resolves_the_stored_history_followed_by_the_new_turn(tmp_path):
+    sessions = store(tmp_path)
+    version = sessions.save("s1", [user("a"), assistant("b")])
+
+    messages = sessions.resolve("s1", version, [user("c")])
+
+    assert messages == [user("a"), assistant("b"), user("c")]
+    assert sessions.stats()["hits"] == 1
+
+
+def test_resolved_history_does_not_change_the_stored_one(tmp_path):
+    sessions = store(tmp_path)
+    version = sessions.save("s1", [user("a")])
+
+    sessions.resolve("s1", version, [user("b")]).append(assistant("c"))
+
+    assert sessions.resolve("s1", version, []) == [user("a")]
+
+
+def test_stored_history_is_a_snapshot(tmp_path):
+    sessions = store(tmp_path)
+    messages = [user("a")]
+    version = sessions.save("s1", messages)
+
+    messages[0]["content"].append({"text": "changed"})
+
+    assert sessions.resolve("s1", version, []) == [user("a")]
+
+
+def test_rejects_unknown_versions_and_sessions(tmp_path):
+    sessions = store(tmp_path)
+    version = sessions.save("s1", [user("a")])
+    sessions.save("s1", [user("a"), assistant("b")])
+
+    with pytest.raises(HistoryVersionMismatchError):
+        sessions.resolve("s1", version, [])
+    with pytest.raises(HistoryVersionMismatchError):
+        sessions.resolve("s2", version, [])
+    assert sessions.stats()["mismatches"] == 2
+
+
+def test_spills_least_recently_used_histories_and_loads_them_back(tmp_path):
+    sessions = store(tmp_path, memory_bytes=100)
+    first = sessions.save("s1", [user("x" * 60)])
+    sessions.save("s2", [user("y" * 60)])
+
+    assert sessions.stats()["sessions"] == 1
+    assert sessions.stats()["spills"] == 1
+    assert len(os.listdir(tmp_path)) == 1
+
+    assert sessions.resolve("s1", first, []) == [user("x" * 60)]
+    assert sessions.stats()["disk_loads"] == 1
+
+
+def test_drops_the_oldest_spilled_histories_over_the_disk_quota(tmp_path):
+    sessions = store(tmp_path, memory_bytes=100, disk_bytes=300)
+    first = sessions.save("s1", [user("x" * 60)])
+    sessions.save("s2", [user("y" * 60)])
+    sessions.save("s3", [user("z" * 60)])
+    sessions.save("s4", [user("w" * 60)])
+
+    assert sessions.stats()["spilled_sessions"] == 1
+    with pytest.raises(HistoryVersionMismatchError):
+        sessions.resolve("s1", first, [])
+
+
+def test_keeps_spilled_histories_across_restarts(tmp_path):
+    first = store(tmp_path, memory_bytes=100)
+    version = first.save("s1", [user("x" * 60)])
+    first.save("s2", [user("y" * 60)])
+
+    second = store(tmp_path, memory_bytes=100)
+
+    assert second.resolve("s1", version, []) == [user("x" * 60)]
+
+
+def test_is_disabled_without_memory(tmp_path):
+    sessions = store(tmp_path, memory_bytes=0)
+
+    assert not sessions.enabled
+    with pytest.raises(HistoryVersionMismatchError):
+        sessions.resolve("s1", "v", [])
@@ -0,0 +1,106 @@
+import boto3
+import pytest
+from moto import mock_aws
+from src.storage import S3Uploader
+
+BUCKET = "agent-files"
+REGION = "us-east-1"
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.delenv("AWS_SESSION_TOKEN", raising=False)
+    with mock_aws():
+        client = boto3.client("s3", region_name=REGION)
+        client.create_bucket(Bucket=BUCKET)
+        yield client
+
+
+@pytest.fixture
+def uploader(s3):
+    return S3Uploader()
+
+
+def write(path, content: bytes) -> str:
+    path.write_bytes(content)
+    return str(path)
+
+
+def test_upload_returns_url_and_tags_content_hash(s3, uploader, tmp_path):
+    filepath = write(tmp_path / "report.txt", b"hello")
+
+    url = uploader.upload(filepath, BUCKET, "agentcore/trace-1/report.txt", REGION)
+
+    assert url == f"https://{BUCKET}.s3.{REGION}.amazonaws.com/agentcore/trace-1/report.txt"
+    obj = s3.get_object(Bucket=BUCKET, Key="agentcore/trace-1/report.txt")
+    assert obj["Body"].read() == b"hello"
+    assert len(obj["Metadata"]["sha256"]) == 64
+    assert uploader.stats()["uploads"] == 1
+    assert uploader.stats()["uploaded_bytes"] == 5
+
+
+def test_unchanged_file_is_not_uploaded_again(s3, uploader, tmp_path):
+    filepath = write(tmp_path / "report.txt", b"hello")
+    uploader.upload(filepath, BUCKET, "agentcore/trace-1/report.txt", REGION)
+
+    uploader.upload(filepath, BUCKET, "agentcore/trace-1/report.txt", REGION)
+
+    assert uploader.stats()["uploads"] == 1
+    assert uploader.stats()["skipped"] == 1
+
+
+def test_deleted_object_is_uploaded_again(s3, uploader, tmp_path):
+    filepath = write(tmp_path / "report.txt", b"hello")
+    uploader.upload(filepath, BUCKET, "agentcore/trace-1/report.txt", REGION)
+    s3.delete_object(Bucket=BUCKET, Key="agentcore/trace-1/report.txt")
+
+    url = uploader.upload(filepath, BUCKET, "agentcore/trace-1/report.txt", REGION)
+
+    assert url.endswith("/agentcore/trace-1/report.txt")
+    obj = s3.get_object(Bucket=BUCKET, Key="agentcore/trace-1/report.txt")
+    assert obj["Body"].read() == b"hello"
+    assert uploader.stats()["uploads"] == 2
+    assert uploader.stats()["skipped"] == 0
+
+
+def test_changed_file_is_uploaded_again(s3, uploader, tmp_path):
+    filepath = write(tmp_path / "report.txt", b"hello")
+    uploader.upload(filepath, BUCKET, "agentcore/trace-1/report.txt", REGION)
+    write(tmp_path / "report.txt", b"hello again")
+
+    uploader.upload(filepath, BUCKET, "agentcore/trace-1/report.txt", REGION)
+
+    obj = s3.get_object(Bucket=BUCKET, Key="agentcore/trace-1/report.txt")
+    assert obj["Body"].read() == b"hello again"
+    assert uploader.stats()["uploads"] == 2
+    assert uploader.stats()["skipped"] == 0
+
+
+def test_same_file_under_another_key_is_uploaded(s3, uploader, tmp_path):
+    filepath = write(tmp_path / "report.txt", b"hello")
+
+    uploader.upload(filepath, BUCKET, "agentcore/trace-1/report.txt", REGION)
+    uploader.upload(filepath, BUCKET, "agentcore/trace-2/report.txt", REGION)
+
+    keys = [o["Key"] for o in s3.list_objects_v2(Bucket=BUCKET)["Contents"]]
+    assert sorted(keys) == ["agentcore/trace-1/report.txt", "agentcore/trace-2/report.txt"]
+
+
+def test_upload_many_returns_results_in_order(s3, uploader, tmp_path):
+    files = [
+        (write(tmp_path / f"file{i}.txt", f"content {i}".encode()), f"agentcore/trace-1/file{i}.txt")
+        for i in range(5)
+    ]
+    files.insert(2, (str(tmp_path / "missing.txt"), "agentcore/trace-1/missing.txt"))
+
+    results = uploader.upload_many(files, BUCKET, REGION)
+
+    assert isinstance(results[2], FileNotFoundError)
+    urls = results[:2] + results[3:]
+    assert urls == [f"https://{BUCKET}.s3.{REGION}.amazonaws.com/{key}" for _, key in files if "missing" not in key]
+    for i in range(5):
+        obj = s3.get_object(Bucket=BUCKET, Key=f"agentcore/trace-1/file{i}.txt")
+        assert obj["Body"].read() == f"content {i}".encode()
+    assert uploader.stats()["uploads"] == 5
@@ -0,0 +1,70 @@
+import time
+from src.streaming import DeltaCoalescer
+
+
+def text_delta(text: str, index: int = 0):
+    return {"event": {"contentBlockDelta": {"delta": {"text": text}, "contentBlockIndex": index}}}
+
+
+def tool_input_delta(text: str, index: int = 1):
+    return {"event": {"contentBlockDelta": {"delta": {"toolUse": {"input": text}}, "contentBlockIndex": index}}}
+
+
+def push_all(coalescer: DeltaCoalescer, events):
+    sent = []
+    for event in events:
+        sent += coalescer.push(event)
+    return sent + coalescer.flush()
+
+
+def test_merges_deltas_of_a_block():
+    coalescer = DeltaCoalescer(window_ms=60_000, max_bytes=1024)
+
+    assert push_all(coalescer, [text_delta("Hel"), text_delta("lo"), text_delta("!")]) == [text_delta("Hello!")]
+
+
+def test_other_events_flush_first_and_keep_their_order():
+    coalescer = DeltaCoalescer(window_ms=60_000, max_bytes=1024)
+    stop = {"event": {"contentBlockStop": {"contentBlockIndex": 0}}}
+    message = {"message": {"role": "assistant", "content": []}}
+
+    sent = push_all(coalescer, [text_delta("a"), text_delta("b"), stop, message])
+
+    assert sent == [text_delta("ab"), stop, message]
+
+
+def test_does_not_merge_across_blocks_or_delta_types():
+    coalescer = DeltaCoalescer(window_ms=60_000, max_bytes=1024)
+
+    sent = push_all(coalescer, [
+        text_delta("a", 0),
+        text_delta("b", 0),
+        tool_input_delta('{"q": ', 1),
+        tool_input_delta('"x"}', 1),
+        text_delta("c", 2),
+    ])
+
+    assert sent == [text_delta("ab", 0), tool_input_delta('{"q": "x"}', 1), text_delta("c", 2)]
+
+
+def test_flushes_once_max_bytes_are_buffered():
+    coalescer = DeltaCoalescer(window_ms=60_000, max_bytes=4)
+
+    assert coalescer.push(text_delta("ab")) == []
+    assert coalescer.push(text_delta("cd")) == [text_delta("abcd")]
+    assert coalescer.flush() == []
+
+
+def test_flushes_once_the_window_has_passed():
+    coalescer = DeltaCoalescer(window_ms=20, max_bytes=1024)
+
+    assert coalescer.push(text_delta("a")) == []
+    time.sleep(0.03)
+    assert coalescer.push(text_delta("b")) == [text_delta("ab")]
+
+
+def test_deltas_that_cannot_be_concatenated_pass_through():
+    coalescer = DeltaCoalescer(window_ms=60_000, max_bytes=1024)
+    signature = {"event": {"contentBlockDelta": {"delta": {"reasoningContent": {"signature": "sig"}}}}}
+
+    assert push_all(coalescer, [text_delta("a"), signature]) == [text_delta("a"), signature]
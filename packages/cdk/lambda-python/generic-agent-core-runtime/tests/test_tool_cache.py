@@ -0,0 +1,105 @@
+import asyncio
+import time
+from src.tool_cache import CachedTool, ResultCache, canonical_input
+
+
+def text(value: str):
+    return [{"text": value}]
+
+
+def test_returns_cached_content_until_it_expires():
+    cache = ResultCache(ttl=0.05, max_entries=10, max_bytes=1024)
+    cache.put(("search", "q"), text("result"))
+
+    assert cache.get(("search", "q")) == text("result")
+    time.sleep(0.06)
+    assert cache.get(("search", "q")) is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["expirations"] == 1
+    assert cache.stats()["entries"] == 0
+
+
+def test_evicts_least_recently_used_entries_over_max_entries():
+    cache = ResultCache(ttl=60, max_entries=2, max_bytes=1024)
+    cache.put(("t", "a"), text("a"))
+    cache.put(("t", "b"), text("b"))
+    cache.get(("t", "a"))
+    cache.put(("t", "c"), text("c"))
+
+    assert cache.get(("t", "b")) is None
+    assert cache.get(("t", "a")) == text("a")
+    assert cache.get(("t", "c")) == text("c")
+    assert cache.stats()["evictions"] == 1
+
+
+def test_evicts_entries_over_max_bytes():
+    cache = ResultCache(ttl=60, max_entries=10, max_bytes=10)
+    cache.put(("t", "a"), text("x" * 6))
+    cache.put(("t", "b"), text("y" * 6))
+
+    assert cache.get(("t", "a")) is None
+    assert cache.stats()["bytes"] == 6
+
+
+def test_does_not_cache_results_larger_than_max_bytes():
+    cache = ResultCache(ttl=60, max_entries=10, max_bytes=10)
+    cache.put(("t", "a"), text("x" * 11))
+
+    assert cache.get(("t", "a")) is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_replacing_an_entry_keeps_the_byte_count():
+    cache = ResultCache(ttl=60, max_entries=10, max_bytes=1024)
+    cache.put(("t", "a"), text("x" * 6))
+    cache.put(("t", "a"), text("x" * 4))
+
+    assert cache.stats()["bytes"] == 4
+    assert cache.stats()["entries"] == 1
+
+
+def test_canonical_input_ignores_key_order():
+    assert canonical_input({"b": 1, "a": [1, 2]}) == canonical_input({"a": [1, 2], "b": 1})
+
+
+class CountingTool:
+    tool_name = "search"
+    tool_spec = {"name": "search"}
+    tool_type = "python"
+
+    def __init__(self, status="success"):
+        self.status = status
+        self.calls = 0
+
+    async def stream(self, tool_use, invocation_state, **kwargs):
+        self.calls += 1
+        yield {"toolUseId": tool_use["toolUseId"], "status": self.status, "content": text(f"call {self.calls}")}
+
+
+def call(tool, tool_use_id, tool_input):
+    async def run():
+        return [e async for e in tool.stream({"toolUseId": tool_use_id, "input": tool_input}, {})]
+
+    return asyncio.run(run())
+
+
+def test_cached_tool_answers_repeated_calls_with_the_id_of_each_call():
+    inner = CountingTool()
+    tool = CachedTool(inner, ResultCache(ttl=60, max_entries=10, max_bytes=1024))
+
+    first = call(tool, "id-1", {"q": "x", "n": 1})
+    second = call(tool, "id-2", {"n": 1, "q": "x"})
+
+    assert inner.calls == 1
+    assert first[-1]["content"] == second[-1]["content"] == text("call 1")
+    assert second[-1]["toolUseId"] == "id-2"
+
+
+def test_cached_tool_does_not_cache_errors():
+    inner = CountingTool(status="error")
+    tool = CachedTool(inner, ResultCache(ttl=60, max_entries=10, max_bytes=1024))
+
+    call(tool, "id-1", {"q": "x"})
+    call(tool, "id-2", {"q": "x"})
+
+    assert inner.calls == 2
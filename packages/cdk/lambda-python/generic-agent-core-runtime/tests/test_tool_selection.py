@@ -0,0 +1,79 @@
+from src.tool_selection import BM25Index, ToolSelector, tokenize
+
+
+class Tool:
+    def __init__(self, name: str, description: str):
+        self.tool_name = name
+        self.tool_spec = {"name": name, "description": description, "inputSchema": {"json": {"properties": {}}}}
+
+
+TOOLS = [
+    Tool("search_documentation", "Search the AWS documentation for a query"),
+    Tool("read_documentation", "Read a page of the AWS documentation"),
+    Tool("get_weather", "Get the weather forecast of a city"),
+    Tool("create_chart", "Draw a chart from data"),
+    Tool("list_files", "List the files of a directory"),
+]
+
+
+def test_tokenize_splits_names_and_drops_stop_words():
+    assert tokenize("getWeatherForecast of the city_name") == ["weather", "forecast", "city", "name"]
+
+
+def test_bm25_ranks_documents_with_rarer_terms_higher():
+    index = BM25Index([["weather", "city"], ["weather", "chart"], ["files", "directory"]])
+
+    scores = index.scores(["weather", "city"])
+
+    assert scores[0] > scores[1] > 0
+    assert scores[2] == 0
+
+
+def test_bm25_penalizes_long_documents():
+    index = BM25Index([["weather"], ["weather"] + ["filler"] * 20])
+
+    scores = index.scores(["weather"])
+
+    assert scores[0] > scores[1]
+
+
+def test_bm25_ignores_unknown_terms_and_empty_indexes():
+    assert BM25Index([["weather"]]).scores(["unknown"]) == [0]
+    assert BM25Index([]).scores(["weather"]) == []
+
+
+def test_selects_the_top_k_tools_in_their_original_order():
+    selector = ToolSelector(top_k=2, always=[])
+
+    tools, selection = selector.select(TOOLS, "How do I search and read the documentation?", [])
+
+    assert [t.tool_name for t in tools] == ["search_documentation", "read_documentation"]
+    assert selection.fallback is False
+    assert selection.tokens_saved_per_call > 0
+
+
+def test_keeps_tools_matching_always_patterns_and_used_in_the_history():
+    selector = ToolSelector(top_k=1, always=["list_*"])
+    messages = [
+        {"role": "assistant", "content": [{"toolUse": {"toolUseId": "1", "name": "create_chart", "input": {}}}]},
+        {"role": "user", "content": [{"toolResult": {"toolUseId": "1", "content": []}}]},
+    ]
+
+    tools, _ = selector.select(TOOLS, "What is the weather in Paris?", messages)
+
+    assert [t.tool_name for t in tools] == ["get_weather", "create_chart", "list_files"]
+
+
+def test_gives_every_tool_when_nothing_matches():
+    selector = ToolSelector(top_k=2, always=[])
+
+    tools, selection = selector.select(TOOLS, "Hello!", [])
+
+    assert tools == TOOLS
+    assert selection.fallback is True
+    assert selection.tokens_saved_per_call == 0
+
+
+def test_does_not_select_when_disabled_or_with_few_tools():
+    assert ToolSelector(top_k=0, always=[]).select(TOOLS, "weather", []) == (TOOLS, None)
+    assert ToolSelector(top_k=5, always=[]).select(TOOLS, "weather", []) == (TOOLS, None)
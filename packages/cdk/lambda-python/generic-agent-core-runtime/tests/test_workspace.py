@@ -0,0 +1,76 @@
+import asyncio
+import os
+import pytest
+from src.workspace import WorkspaceReaper, WorkspaceQuotaExceededError
+
+
+def acquire(reaper: WorkspaceReaper, path: str):
+    return asyncio.run(reaper.acquire(path))
+
+
+def fill(path: str, size: int):
+    with open(os.path.join(path, "data.bin"), "wb") as f:
+        f.write(b"\0" * size)
+
+
+def test_workspace_is_deleted_once_every_invocation_released_it(tmp_path):
+    reaper = WorkspaceReaper(root=str(tmp_path), quota_mb=0)
+    path = str(tmp_path / "session-1")
+
+    first = acquire(reaper, path)
+    second = acquire(reaper, path)
+    assert os.path.isdir(path)
+
+    first.release()
+    assert os.path.isdir(path)
+    second.release()
+    assert not os.path.exists(path)
+    assert reaper.stats()["reaped"] == 1
+
+
+def test_lease_release_only_has_an_effect_once(tmp_path):
+    reaper = WorkspaceReaper(root=str(tmp_path), quota_mb=0)
+    path = str(tmp_path / "session-1")
+
+    first = acquire(reaper, path)
+    second = acquire(reaper, path)
+    first.release()
+    first.release()
+
+    assert os.path.isdir(path)
+    second.release()
+    assert not os.path.exists(path)
+
+
+def test_rejects_workspaces_over_the_quota(tmp_path):
+    reaper = WorkspaceReaper(root=str(tmp_path), quota_mb=1)
+    held = acquire(reaper, str(tmp_path / "session-1"))
+    fill(held.path, 2 * 1024 * 1024)
+
+    # The sweep measures the disk usage checked by acquire
+    reaper._sweep()
+    with pytest.raises(WorkspaceQuotaExceededError):
+        acquire(reaper, str(tmp_path / "session-2"))
+    assert reaper.stats()["rejected"] == 1
+    assert not os.path.exists(tmp_path / "session-2")
+
+    # Usage drops back under the quota once the workspace is reaped
+    held.release()
+    reaper._sweep()
+    acquire(reaper, str(tmp_path / "session-2"))
+
+
+def test_sweep_queues_workspaces_left_behind(tmp_path):
+    left_behind = tmp_path / "old-session"
+    left_behind.mkdir()
+    fill(str(left_behind), 1024)
+    (tmp_path / "session-x.deleting-abc").mkdir()
+    reaper = WorkspaceReaper(root=str(tmp_path), quota_mb=0)
+    held = acquire(reaper, str(tmp_path / "session-1"))
+
+    reaper._sweep()
+    reaper._drain()
+
+    assert sorted(os.listdir(tmp_path)) == ["session-1"]
+    assert reaper.stats()["reclaimed_bytes"] == 1024
+    held.release()
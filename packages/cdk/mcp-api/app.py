@@ -1,22 +1,37 @@
+import asyncio
 import boto3
+import copy
+import hashlib
 import json
+import math
 import uvicorn
 import os
 import logging
 import shutil
 import pathlib
+import queue
+import threading
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from boto3.s3.transfer import TransferConfig
+from botocore.exceptions import ClientError
 from strands.models import BedrockModel
 from strands import Agent, tool
 from strands.tools.mcp import MCPClient
 from mcp import stdio_client, StdioServerParameters
-from fastapi import FastAPI, Response, status
-from fastapi.responses import StreamingResponse
+from fastapi import FastAPI, Request, status
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
-from typing import List
+from typing import List, Optional
 from uuid import uuid4
 
+# The uv cache lives under /tmp for the life of the container, so MCP servers download their packages once
 UV_ENV = {
-    'UV_NO_CACHE': '1',
+    'UV_CACHE_DIR': '/tmp/.uv/cache',
     'UV_PYTHON': '/usr/local/bin/python',
     'UV_TOOL_DIR': '/tmp/.uv/tool',
     'UV_TOOL_BIN_DIR': '/tmp/.uv/tool/bin',
@@ -30,16 +45,65 @@ UV_ENV = {
 
 WORKSPACE_DIR = '/tmp/ws'
 
-FIXED_SYSTEM_PROMPT = f"""## About File Output
-- You are running on AWS Lambda. Therefore, when writing files, always write them under `{WORKSPACE_DIR}`.
-- Similarly, if you need a workspace, please use the `{WORKSPACE_DIR}` directory. Do not ask the user about their current workspace. It's always `{WORKSPACE_DIR}`.
-- Also, users cannot directly access files written under `{WORKSPACE_DIR}`. So when submitting these files to users, *always upload them to S3 using the `upload_file_to_s3_and_retrieve_s3_url` tool and provide the S3 URL*. The S3 URL must be included in the final output.
+MCP_SERVER_STARTUP_TIMEOUT = float(os.environ.get('MCP_SERVER_STARTUP_TIMEOUT', '60'))
+
+# MCP server liveness probes (interval 0 disables them) and restart backoff, in seconds
+MCP_HEALTH_CHECK_INTERVAL = float(os.environ.get('MCP_HEALTH_CHECK_INTERVAL', '30'))
+MCP_HEALTH_CHECK_TIMEOUT = float(os.environ.get('MCP_HEALTH_CHECK_TIMEOUT', '10'))
+MCP_RESTART_BACKOFF_BASE = float(os.environ.get('MCP_RESTART_BACKOFF_BASE', '1'))
+MCP_RESTART_BACKOFF_MAX = float(os.environ.get('MCP_RESTART_BACKOFF_MAX', '60'))
+
+# Load MCP tools in the background at process start instead of on the first request
+MCP_EAGER_WARMUP = os.environ.get('MCP_EAGER_WARMUP', 'false').lower() == 'true'
+
+# Send a chunk with the session id as soon as the stream starts, before MCP tools
+# are loaded, and another with the setup timings once they are
+STREAM_EARLY_METADATA = os.environ.get('STREAM_EARLY_METADATA', 'false').lower() == 'true'
+
+# Chunks buffered for a slow client before the agent is paused, and how often in
+# seconds the connection of the client is checked (0 only notices a disconnect on write)
+STREAM_BUFFER_CHUNKS = int(os.environ.get('STREAM_BUFFER_CHUNKS', '64'))
+STREAM_DISCONNECT_POLL_INTERVAL = float(os.environ.get('STREAM_DISCONNECT_POLL_INTERVAL', '1'))
+
+# Maximum number of agents running at once (0 is unlimited). Further requests wait in a
+# queue of at most ADMISSION_QUEUE_SIZE for up to ADMISSION_QUEUE_TIMEOUT seconds, and are
+# rejected with 429 when the queue is full or the wait times out.
+ADMISSION_MAX_CONCURRENT = int(os.environ.get('ADMISSION_MAX_CONCURRENT', '0'))
+ADMISSION_QUEUE_SIZE = int(os.environ.get('ADMISSION_QUEUE_SIZE', '32'))
+ADMISSION_QUEUE_TIMEOUT = float(os.environ.get('ADMISSION_QUEUE_TIMEOUT', '30'))
+
+# Maximum number of BedrockModel instances kept for reuse across requests
+MODEL_POOL_MAX_SIZE = int(os.environ.get('MODEL_POOL_MAX_SIZE', '16'))
+
+# Maximum disk usage of WORKSPACE_DIR before new requests are rejected (0 disables),
+# and how often in seconds the reaper measures it and removes abandoned workspaces
+WORKSPACE_QUOTA_MB = int(os.environ.get('WORKSPACE_QUOTA_MB', '0'))
+WORKSPACE_SWEEP_INTERVAL = float(os.environ.get('WORKSPACE_SWEEP_INTERVAL', '60'))
+
+# Estimated tokens of conversation history sent to the model (0 sends it as is).
+# The oldest turns are dropped, but the last HISTORY_KEEP_TURNS turns are always kept.
+HISTORY_TOKEN_BUDGET = int(os.environ.get('HISTORY_TOKEN_BUDGET', '0'))
+HISTORY_KEEP_TURNS = int(os.environ.get('HISTORY_KEEP_TURNS', '2'))
+
+# Memory for conversation histories kept after each turn (0 disables it), so that clients
+# send only the new prompt with the historyVersion of their previous response
+SESSION_STORE_MEMORY_MB = int(os.environ.get('SESSION_STORE_MEMORY_MB', '0'))
+
+FIXED_SYSTEM_PROMPT_TEMPLATE = """## About File Output
+- You are running on AWS Lambda. Therefore, when writing files, always write them under `{workspace_dir}`.
+- Similarly, if you need a workspace, please use the `{workspace_dir}` directory. Do not ask the user about their current workspace. It's always `{workspace_dir}`.
+- Also, users cannot directly access files written under `{workspace_dir}`. So when submitting these files to users, *always upload them to S3 using the `upload_file_to_s3_and_retrieve_s3_url` tool and provide the S3 URL*. The S3 URL must be included in the final output.
+- When submitting several files, upload them at once using the `upload_files_to_s3_and_retrieve_s3_urls` tool.
 - If the output file is an image file, the S3 URL output must be in Markdown format.
 """
 
 def stream_chunk(text, trace):
     return json.dumps({ 'text': text, 'trace': trace}, ensure_ascii=False) + '\n'
 
+def metadata_chunk(**fields):
+    # Empty text, so clients that only read text and trace ignore it
+    return json.dumps({'text': '', **fields}, ensure_ascii=False) + '\n'
+
 def is_message(event):
     return 'message' in event
 
@@ -83,13 +147,176 @@ def extract_tool_result(event):
 def create_session_id():
     return str(uuid4())
 
-def create_ws_directory():
-    logging.info('Create ws directory')
-    pathlib.Path(WORKSPACE_DIR).mkdir(exist_ok=True)
+def get_workspace_dir(session_id):
+    return os.path.join(WORKSPACE_DIR, session_id)
+
+def get_system_prompt(system_prompt, workspace_dir):
+    return f'{system_prompt}\n{FIXED_SYSTEM_PROMPT_TEMPLATE.format(workspace_dir=workspace_dir)}'
+
+def create_ws_directory(workspace_dir):
+    logging.info(f'Create ws directory {workspace_dir}')
+    pathlib.Path(workspace_dir).mkdir(parents=True, exist_ok=True)
+
+def clean_ws_directory(workspace_dir):
+    logging.info(f'Clean ws directory {workspace_dir}...')
+    shutil.rmtree(workspace_dir, ignore_errors=True)
+
+def directory_size(path):
+    size = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                size += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return size
+
+# Workspaces of finished streams are deleted by a background thread, so deleting
+# large files never blocks the event loop
+workspace_queue = queue.Queue()
+
+def release_ws_directory(workspace_dir):
+    app.active_workspaces.discard(workspace_dir)
+    workspace_queue.put((workspace_dir, time.monotonic()))
+
+def reap_ws_directory(workspace_dir, released_at):
+    started_at = time.perf_counter()
+    size = directory_size(workspace_dir)
+    clean_ws_directory(workspace_dir)
+    stats = app.workspace_stats
+    stats['reaped'] += 1
+    stats['reclaimedBytes'] += size
+    stats['cleanupSeconds'] = round(stats['cleanupSeconds'] + time.perf_counter() - started_at, 3)
+    stats['maxCleanupLatencySeconds'] = round(max(stats['maxCleanupLatencySeconds'], time.monotonic() - released_at), 3)
+
+def sweep_ws_directories():
+    # Queue workspaces left behind by streams that never finished
+    if os.path.isdir(WORKSPACE_DIR):
+        for entry in os.scandir(WORKSPACE_DIR):
+            if entry.is_dir(follow_symlinks=False) and entry.path not in app.active_workspaces:
+                workspace_queue.put((entry.path, time.monotonic()))
+    app.workspace_stats['usageBytes'] = directory_size(WORKSPACE_DIR)
+
+def workspace_reaper_loop():
+    next_sweep_at = 0
+    while True:
+        try:
+            workspace_dir, released_at = workspace_queue.get(timeout=max(0, next_sweep_at - time.monotonic()))
+            reap_ws_directory(workspace_dir, released_at)
+        except queue.Empty:
+            pass
+        except Exception as e:
+            logging.error(f'Error cleaning ws directory: {e}')
+
+        if time.monotonic() >= next_sweep_at:
+            try:
+                sweep_ws_directories()
+            except Exception as e:
+                logging.error(f'Error sweeping ws directories: {e}')
+            next_sweep_at = time.monotonic() + WORKSPACE_SWEEP_INTERVAL
+
+def run_timed(timings, name, func, *args):
+    started_at = time.perf_counter()
+    result = func(*args)
+    timings[name] = round(time.perf_counter() - started_at, 3)
+    return result
+
+def is_in_directory(path, directory):
+    real_directory = os.path.realpath(directory)
+    return os.path.commonpath([os.path.realpath(path), real_directory]) == real_directory
+
+# Session of the request being processed. Tools run in a copy of the request's context,
+# so concurrent streams never see each other's session.
+current_session_id = ContextVar('current_session_id', default=None)
+
+# Response stream of the model call in progress, keyed by session, so it can be
+# closed (and the model stops generating) when the client disconnects
+model_streams = {}
+
+def track_model_stream(parsed, **kwargs):
+    session_id = current_session_id.get()
+    if session_id is not None and 'stream' in parsed:
+        model_streams[session_id] = parsed['stream']
+
+def close_model_stream(session_id):
+    stream = model_streams.pop(session_id, None)
+    if stream is not None:
+        try:
+            stream.close()
+        except Exception as e:
+            logging.warning(f'Error closing model stream: {e}')
+
+# boto3 clients are thread-safe, so one client is shared by all uploads
+s3_client = boto3.client('s3')
+
+S3_TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=int(os.environ.get('S3_MULTIPART_THRESHOLD_MB', '8')) * 1024 * 1024,
+    multipart_chunksize=int(os.environ.get('S3_MULTIPART_CHUNKSIZE_MB', '16')) * 1024 * 1024,
+    max_concurrency=int(os.environ.get('S3_MAX_CONCURRENCY', '10')),
+)
+
+# Files the batch upload tool uploads at once
+s3_upload_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get('S3_UPLOAD_PARALLELISM', '4')),
+    thread_name_prefix='s3-upload',
+)
+
+# Uploads run on worker threads, so their statistics are updated under a lock
+upload_stats_lock = threading.Lock()
+upload_stats = {
+    'uploads': 0,
+    'skipped': 0,
+    'uploadedBytes': 0,
+    'uploadSeconds': 0.0,
+}
+
+def file_sha256(filepath):
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def is_uploaded(bucket, key, sha256):
+    # Objects are uploaded with the sha256 of their content, so a deleted or changed object is uploaded again
+    try:
+        head = s3_client.head_object(Bucket=bucket, Key=key)
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') not in ('404', 'NoSuchKey', 'NotFound'):
+            logging.warning(f'Error checking s3://{bucket}/{key}, uploading it: {e}')
+        return False
+    return head.get('Metadata', {}).get('sha256') == sha256
+
+def get_upload_key(filepath):
+    session_id = current_session_id.get()
+    workspace_dir = get_workspace_dir(session_id)
+
+    if not is_in_directory(filepath, workspace_dir):
+        raise ValueError(f'{filepath} does not appear to be a file under the {workspace_dir} directory. Files to be uploaded must exist under {workspace_dir}.')
+
+    filename = os.path.basename(filepath)
+    return f'mcp/{session_id}/{filename}'
+
+def upload_to_s3(filepath, key):
+    bucket = os.environ['FILE_BUCKET']
+    region = os.environ['AWS_REGION']
+    sha256 = file_sha256(filepath)
+
+    if is_uploaded(bucket, key, sha256):
+        with upload_stats_lock:
+            upload_stats['skipped'] += 1
+    else:
+        started_at = time.perf_counter()
+        s3_client.upload_file(filepath, bucket, key, ExtraArgs={'Metadata': {'sha256': sha256}}, Config=S3_TRANSFER_CONFIG)
+        elapsed = time.perf_counter() - started_at
+        size = os.path.getsize(filepath)
+        with upload_stats_lock:
+            upload_stats['uploads'] += 1
+            upload_stats['uploadedBytes'] += size
+            upload_stats['uploadSeconds'] = round(upload_stats['uploadSeconds'] + elapsed, 3)
+        logging.info(f'Uploaded {size} bytes to s3://{bucket}/{key} in {elapsed:.3f}s')
 
-def clean_ws_directory():
-    logging.info('Clean ws directory...')
-    shutil.rmtree(WORKSPACE_DIR)
+    return f'https://{bucket}.s3.{region}.amazonaws.com/{key}'
 
 @tool
 def upload_file_to_s3_and_retrieve_s3_url(filepath: str) -> str:
@@ -98,30 +325,119 @@ def upload_file_to_s3_and_retrieve_s3_url(filepath: str) -> str:
     Args:
         filepath: The path to the uploading file
     """
-    global session_id
-
-    bucket = os.environ['FILE_BUCKET']
-    region = os.environ['AWS_REGION']
+    return upload_to_s3(filepath, get_upload_key(filepath))
 
-    if not filepath.startswith(WORKSPACE_DIR):
-        raise ValueError(f'{filepath} does not appear to be a file under the {WORKSPACE_DIR} directory. Files to be uploaded must exist under {WORKSPACE_DIR}.')
+@tool
+def upload_files_to_s3_and_retrieve_s3_urls(filepaths: List[str]) -> str:
+    """Upload several files at /tmp/ws/* in parallel and retrieve their s3 paths
 
-    filename = os.path.basename(filepath)
-    key = f'mcp/{session_id}/{filename}'
+    Args:
+        filepaths: The paths to the uploading files
+    """
+    # Keys are resolved here, since the session of the request is not visible from the upload threads
+    futures = [s3_upload_executor.submit(upload_to_s3, filepath, get_upload_key(filepath)) for filepath in filepaths]
+    lines = []
+    for filepath, future in zip(filepaths, futures):
+        try:
+            lines.append(f'{filepath}: {future.result()}')
+        except Exception as e:
+            logging.error(f'Error uploading file to S3: {e}')
+            lines.append(f'{filepath}: Error uploading to S3: {e}')
+    return '\n'.join(lines)
+
+PROCESS_STARTED_AT = time.perf_counter()
+
+@asynccontextmanager
+async def lifespan(app):
+    app.startup_timings['app_started'] = round(time.perf_counter() - PROCESS_STARTED_AT, 3)
+    threading.Thread(target=workspace_reaper_loop, name='workspace-reaper', daemon=True).start()
+    warm_up_task = asyncio.create_task(warm_up()) if MCP_EAGER_WARMUP else None
+    yield
+    if warm_up_task is not None:
+        warm_up_task.cancel()
+
+app = FastAPI(lifespan=lifespan)
 
-    s3 = boto3.client('s3')
-    s3.upload_file(filepath, bucket, key)
+# Shared MCP clients
+app.mcp_tools = None
+app.mcp_servers = []
+app.mcp_tools_lock = threading.Lock()
+
+# Startup phase timings in seconds
+app.startup_timings = {}
+
+# Streams abandoned by their clients, and the output tokens not generated because of it
+app.stream_stats = {
+    'streams': 0,
+    'abandoned': 0,
+    'modelCalls': 0,
+    'outputTokens': 0,
+    'outputTokensSaved': 0,
+    'backpressureWaits': 0,
+}
 
-    return f'https://{bucket}.s3.{region}.amazonaws.com/{key}'
+# Running agents per caller, requests waiting for one (in arrival order), and queue statistics
+app.running_agents = {}
+app.waiting_agents = []
+app.admission_stats = {
+    'admitted': 0,
+    'queued': 0,
+    'rejectedQueueFull': 0,
+    'rejectedTimeout': 0,
+    'queueSeconds': 0.0,
+    'maxQueueSeconds': 0.0,
+    'completed': 0,
+    'runSeconds': 0.0,
+}
 
-app = FastAPI()
+# Histories by caller and version (least recently used first), and their statistics
+app.session_histories = OrderedDict()
+app.session_store_stats = {
+    'bytes': 0,
+    'hits': 0,
+    'mismatches': 0,
+    'evictions': 0,
+    'bytesNotResent': 0,
+}
 
-# Shared MCP clients
-app.mcp_tools = None
+# Workspaces of running streams and cleanup statistics
+app.active_workspaces = set()
+app.workspace_stats = {
+    'reaped': 0,
+    'reclaimedBytes': 0,
+    'cleanupSeconds': 0.0,
+    'maxCleanupLatencySeconds': 0.0,
+    'usageBytes': 0,
+    'rejected': 0,
+}
 
 @app.get('/')
 async def healthcheck():
-    return Response(status_code=status.HTTP_200_OK)
+    # The Lambda Web Adapter readiness check waits until this returns 200
+    if MCP_EAGER_WARMUP and app.mcp_tools is None:
+        return JSONResponse(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            content={'state': 'warming', 'startupTimings': app.startup_timings},
+        )
+    return JSONResponse(
+        status_code=status.HTTP_200_OK,
+        content={
+            'state': 'ready' if app.mcp_tools is not None else 'lazy',
+            'startupTimings': app.startup_timings,
+            'workspaces': app.workspace_stats,
+            'streams': app.stream_stats,
+            'admission': {
+                **app.admission_stats,
+                'running': sum(app.running_agents.values()),
+                'waiting': len(app.waiting_agents),
+            },
+            'sessionStore': {
+                **app.session_store_stats,
+                'histories': len(app.session_histories),
+            },
+            'uploads': dict(upload_stats),
+        },
+    )
 
 class UnrecordedMessage(BaseModel):
     role: str
@@ -136,10 +452,121 @@ class StreamingRequest(BaseModel):
     userPrompt: str
     messages: List[UnrecordedMessage]
     model: Model
+    historyVersion: Optional[str] = None
+
+class BedrockModelPool:
+    """Bounded LRU pool of BedrockModel instances shared across requests"""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.models = OrderedDict()
+        self.sessions = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_model(self, model_id, region):
+        key = (model_id, region)
+
+        # boto3 sessions are not thread-safe, so model creation also happens under the lock
+        with self.lock:
+            if key in self.models:
+                self.models.move_to_end(key)
+                self.hits += 1
+                return self.models[key]
+
+            self.misses += 1
+            if region not in self.sessions:
+                self.sessions[region] = boto3.Session(region_name=region)
+            model = BedrockModel(model_id=model_id, boto_session=self.sessions[region])
+            model.client.meta.events.register('after-call.bedrock-runtime.ConverseStream', track_model_stream)
+            self.models[key] = model
+
+            while len(self.models) > self.max_size:
+                self.models.popitem(last=False)
+                self.evictions += 1
+
+            return model
+
+    def stats(self):
+        with self.lock:
+            return {
+                'size': len(self.models),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+model_pool = BedrockModelPool(MODEL_POOL_MAX_SIZE)
+
+def get_bedrock_model(model_id, region):
+    return model_pool.get_model(model_id, region)
 
 def convert_unrecorded_message_to_strands_messages(messages: List[UnrecordedMessage]):
     return list(map(lambda m: { 'role': m.role, 'content': [{ 'text': m.content }] }, messages))
 
+def estimate_tokens(text):
+    # Roughly 4 characters per token
+    return len(text) // 4 + 1
+
+def compact_messages(messages):
+    if HISTORY_TOKEN_BUDGET <= 0:
+        return messages
+
+    tokens = [estimate_tokens(m['content'][0]['text']) for m in messages]
+    tokens_before = sum(tokens)
+    if tokens_before <= HISTORY_TOKEN_BUDGET:
+        return messages
+
+    # Drop whole turns from the start, so the history still starts with a user message
+    turn_starts = [i for i, m in enumerate(messages) if m['role'] == 'user']
+    if HISTORY_KEEP_TURNS <= 0:
+        protected_from = len(messages)
+    elif len(turn_starts) >= HISTORY_KEEP_TURNS:
+        protected_from = turn_starts[-HISTORY_KEEP_TURNS]
+    else:
+        protected_from = 0
+    candidates = [i for i in turn_starts if 0 < i < protected_from] + [protected_from]
+    drop_until = next((i for i in candidates if sum(tokens[i:]) <= HISTORY_TOKEN_BUDGET), protected_from)
+
+    logging.info(f'Compacted conversation history: dropped {drop_until} messages, {tokens_before} -> {sum(tokens[drop_until:])} estimated tokens')
+    return messages[drop_until:]
+
+def history_size(messages):
+    return sum(len(m['content'][0]['text']) for m in messages)
+
+def resolve_history(caller, request):
+    # The stored history of the version the client holds followed by the messages sent,
+    # or None when it is not stored (e.g. another Lambda instance served the last turn)
+    messages = convert_unrecorded_message_to_strands_messages(request.messages)
+    if request.historyVersion is None:
+        return messages
+    key = (caller, request.historyVersion)
+    stored = app.session_histories.get(key)
+    if stored is None:
+        app.session_store_stats['mismatches'] += 1
+        return None
+    app.session_histories.move_to_end(key)
+    app.session_store_stats['hits'] += 1
+    app.session_store_stats['bytesNotResent'] += history_size(stored)
+    return stored + messages
+
+def save_history(caller, previous_version, messages):
+    # The history under its previous version is replaced, so each conversation keeps one
+    stats = app.session_store_stats
+    previous = app.session_histories.pop((caller, previous_version), None)
+    if previous is not None:
+        stats['bytes'] -= history_size(previous)
+    version = create_session_id()
+    app.session_histories[(caller, version)] = messages
+    stats['bytes'] += history_size(messages)
+    while stats['bytes'] > SESSION_STORE_MEMORY_MB * 1024 * 1024 and app.session_histories:
+        _, evicted = app.session_histories.popitem(last=False)
+        stats['bytes'] -= history_size(evicted)
+        stats['evictions'] += 1
+    return version
+
 def safe_parse_mcp_json():
     res = []
 
@@ -155,6 +582,7 @@ def safe_parse_mcp_json():
         for server_name in mcp_server_names:
             server = mcp_servers[server_name]
             res.append({
+                'name': server_name,
                 'command': server['command'],
                 'args': server['args'] if 'args' in server else [],
                 'env': server['env'] if 'env' in server else {},
@@ -176,50 +604,155 @@ def make_mcp_client(server):
         )
     return MCPClient(spawn)
 
+def start_mcp_client(server):
+    started_at = time.perf_counter()
+    client = make_mcp_client(server)
+    try:
+        client.start()
+        tools = client.list_tools_sync()
+    except Exception:
+        # A client that failed to initialize keeps its subprocess until stopped
+        threading.Thread(target=client.stop, args=(None, None, None), daemon=True).start()
+        raise
+    app.startup_timings.setdefault('mcpServers', {})[server['name']] = round(time.perf_counter() - started_at, 3)
+    return client, tools
+
+def stop_late_mcp_client(future):
+    if future.cancelled() or future.exception() is not None:
+        return
+    client, _ = future.result()
+    client.stop(None, None, None)
+
+def ensure_mcp_tools():
+    # Background warm-up and the first request may race to load the tools
+    with app.mcp_tools_lock:
+        if app.mcp_tools is None:
+            started_at = time.perf_counter()
+            load_mcp_tools()
+            app.startup_timings['mcpToolsTotal'] = round(time.perf_counter() - started_at, 3)
+
+async def warm_up():
+    try:
+        await asyncio.to_thread(ensure_mcp_tools)
+    except Exception as e:
+        logging.error(f'Error warming up MCP tools: {e}')
+    app.startup_timings['ready'] = round(time.perf_counter() - PROCESS_STARTED_AT, 3)
+    logging.info(f'Warm-up finished: {app.startup_timings}')
+
 def load_mcp_tools():
     mcp_servers = safe_parse_mcp_json()
-    mcp_clients = [make_mcp_client(s) for s in mcp_servers]
-
-    for c in mcp_clients:
-        c.start()
-
-    # Flatten the tools
-    mcp_tools = sum([c.list_tools_sync() for c in mcp_clients], [])
-
-    app.mcp_tools = mcp_tools
-
-@app.post('/streaming')
-async def streaming(request: StreamingRequest):
-    if app.mcp_tools is None:
-        load_mcp_tools()
-
-    async def generate():
-        global session_id
-
-        session_id = create_session_id()
-
-        logging.info(f'New session {session_id}')
-
-        create_ws_directory()
-
-        session = boto3.Session(
-            region_name=request.model.region,
-        )
-
-        bedrock_model = BedrockModel(
-            model_id=request.model.modelId,
-            boto_session=session
+    app.mcp_servers = [{'server': s, 'client': None, 'tools': [], 'failures': 0, 'next_restart_at': 0} for s in mcp_servers]
+
+    # Start all servers concurrently so that the first request waits for the slowest server only
+    executor = ThreadPoolExecutor(max_workers=max(len(mcp_servers), 1))
+    futures = [executor.submit(start_mcp_client, s) for s in mcp_servers]
+    deadline = time.monotonic() + MCP_SERVER_STARTUP_TIMEOUT
+
+    for entry, future in zip(app.mcp_servers, futures):
+        try:
+            entry['client'], entry['tools'] = future.result(timeout=max(0, deadline - time.monotonic()))
+        except FutureTimeoutError:
+            logging.error(f'MCP server {entry["server"]["name"]} did not start within {MCP_SERVER_STARTUP_TIMEOUT}s')
+            future.add_done_callback(stop_late_mcp_client)
+        except Exception as e:
+            logging.error(f'Error starting MCP server {entry["server"]["name"]}: {e}')
+
+    executor.shutdown(wait=False)
+
+    app.mcp_tools = sum([e['tools'] for e in app.mcp_servers], [])
+
+    if MCP_HEALTH_CHECK_INTERVAL > 0:
+        threading.Thread(target=mcp_health_check_loop, daemon=True).start()
+
+def run_with_timeout(func, timeout, on_late=None):
+    # MCP calls on a dead server can block forever, so they run in a daemon thread.
+    # on_late is called with the future of a call that timed out, once it finishes.
+    future = Future()
+
+    def target():
+        try:
+            future.set_result(func())
+        except Exception as e:
+            future.set_exception(e)
+
+    threading.Thread(target=target, daemon=True).start()
+    try:
+        return future.result(timeout=timeout)
+    except FutureTimeoutError:
+        if on_late is not None:
+            future.add_done_callback(on_late)
+        raise TimeoutError(f'did not finish within {timeout}s')
+
+def check_mcp_server(entry):
+    name = entry['server']['name']
+
+    if entry['client'] is not None:
+        try:
+            run_with_timeout(entry['client'].list_tools_sync, MCP_HEALTH_CHECK_TIMEOUT)
+            return False
+        except Exception as e:
+            logging.warning(f'MCP server {name} failed liveness probe: {e!r}')
+            client = entry['client']
+            entry['client'] = None
+            threading.Thread(target=client.stop, args=(None, None, None), daemon=True).start()
+
+    if time.monotonic() < entry['next_restart_at']:
+        return False
+
+    try:
+        logging.info(f'Restarting MCP server {name}')
+        # A start that times out stops its client when it comes up, instead of leaking it next to the next start
+        entry['client'], entry['tools'] = run_with_timeout(
+            lambda: start_mcp_client(entry['server']), MCP_SERVER_STARTUP_TIMEOUT, on_late=stop_late_mcp_client
         )
+        entry['failures'] = 0
+    except Exception as e:
+        entry['tools'] = []
+        entry['failures'] += 1
+        backoff = min(MCP_RESTART_BACKOFF_BASE * 2 ** (entry['failures'] - 1), MCP_RESTART_BACKOFF_MAX)
+        entry['next_restart_at'] = time.monotonic() + backoff
+        logging.error(f'Error restarting MCP server {name}, retrying in {backoff}s: {e}')
+
+    return True
+
+def mcp_health_check_loop():
+    # Restarted servers get new tool objects, so the shared tool list is rebuilt.
+    # Agents that are already running keep the list they were created with.
+    while True:
+        time.sleep(MCP_HEALTH_CHECK_INTERVAL)
+        changed = False
+        for entry in app.mcp_servers:
+            changed = check_mcp_server(entry) or changed
+        if changed:
+            app.mcp_tools = sum([e['tools'] for e in app.mcp_servers], [])
+
+async def stream_agent(request, messages, workspace_dir, caller):
+    bedrock_model = get_bedrock_model(request.model.modelId, request.model.region)
+
+    agent = Agent(
+        system_prompt=get_system_prompt(request.systemPrompt, workspace_dir),
+        # Strands appends to and changes the messages of the agent in place, so it gets a copy
+        # and the history stored after the turn (and the stored one it continues) stays as sent
+        messages=compact_messages(copy.deepcopy(messages)),
+        model=bedrock_model,
+        tools=app.mcp_tools + [upload_file_to_s3_and_retrieve_s3_url, upload_files_to_s3_and_retrieve_s3_urls],
+        callback_handler=None,
+    )
 
-        agent = Agent(
-            system_prompt=f'{request.systemPrompt}\n{FIXED_SYSTEM_PROMPT}',
-            messages=convert_unrecorded_message_to_strands_messages(request.messages),
-            model=bedrock_model,
-            tools=app.mcp_tools + [upload_file_to_s3_and_retrieve_s3_url],
-            callback_handler=None,
-        )
+    # Characters of output of the model call in progress
+    partial_chars = 0
+    # Text of the answer, as the client records it
+    answer = []
 
+    try:
         async for event in agent.stream_async(request.userPrompt):
+            if 'data' in event:
+                partial_chars += len(event['data'])
+            elif 'metadata' in event.get('event', {}):
+                app.stream_stats['modelCalls'] += 1
+                app.stream_stats['outputTokens'] += event['event']['metadata'].get('usage', {}).get('outputTokens', 0)
+                partial_chars = 0
+
             if is_message(event):
                 if is_assistant(event):
                     text = extract_text(event)
@@ -229,6 +762,7 @@ async def streaming(request: StreamingRequest):
                         yield stream_chunk('', f'{text}\n')
                         yield stream_chunk('', f'```\n{tool_use["name"]}: {tool_use["input"]}\n```\n')
                     elif text is not None:
+                        answer.append(text)
                         yield stream_chunk(text, None)
                     else:
                         yield stream_chunk('', f'```\n{tool_use["name"]}: {tool_use["input"]}\n```\n')
@@ -237,12 +771,239 @@ async def streaming(request: StreamingRequest):
                     if len(tool_result) > 200:
                         tool_result = tool_result[:200] + '...'
                     yield stream_chunk('', f'```\n{tool_result}\n```\n')
+    except asyncio.CancelledError:
+        # The client disconnected: estimate the output tokens the model no longer generates
+        stats = app.stream_stats
+        if stats['modelCalls']:
+            stats['outputTokensSaved'] += max(stats['outputTokens'] // stats['modelCalls'] - partial_chars // 4, 0)
+        raise
+
+    # Stored uncompacted, like the history the client would send
+    if SESSION_STORE_MEMORY_MB > 0:
+        history = messages + [
+            {'role': 'user', 'content': [{'text': request.userPrompt}]},
+            {'role': 'assistant', 'content': [{'text': ''.join(answer)}]},
+        ]
+        yield metadata_chunk(historyVersion=save_history(caller, request.historyVersion, history))
+
+async def stream_with_backpressure(chunks, http_request, session_id):
+    # The agent runs in its own task and is paused while STREAM_BUFFER_CHUNKS wait for the client
+    buffer = asyncio.Queue(maxsize=max(STREAM_BUFFER_CHUNKS, 1))
+    end = object()
+
+    async def produce():
+        try:
+            async for chunk in chunks:
+                if buffer.full():
+                    app.stream_stats['backpressureWaits'] += 1
+                await buffer.put(chunk)
+        except Exception as e:
+            await buffer.put(e)
+            return
+        await buffer.put(end)
+
+    producer = asyncio.create_task(produce())
+    abandoned = False
+
+    def abandon():
+        nonlocal abandoned
+        abandoned = True
+        producer.cancel()
+        close_model_stream(session_id)
+        while not buffer.empty():
+            buffer.get_nowait()
+        buffer.put_nowait(end)
+
+    async def watch():
+        while not producer.done():
+            await asyncio.sleep(STREAM_DISCONNECT_POLL_INTERVAL)
+            if await http_request.is_disconnected():
+                logging.info(f'Client of session {session_id} disconnected')
+                abandon()
+                return
+
+    watcher = asyncio.create_task(watch()) if STREAM_DISCONNECT_POLL_INTERVAL > 0 else None
+    finished = False
+    try:
+        while True:
+            chunk = await buffer.get()
+            if chunk is end:
+                finished = True
+                return
+            if isinstance(chunk, Exception):
+                finished = True
+                raise chunk
+            yield chunk
+    finally:
+        if watcher is not None:
+            watcher.cancel()
+        if not finished:
+            logging.info(f'Stream of session {session_id} was abandoned')
+            abandon()
+        model_streams.pop(session_id, None)
+        app.stream_stats['streams'] += 1
+        if abandoned:
+            app.stream_stats['abandoned'] += 1
+
+def get_caller(http_request):
+    # Requests through the Lambda Function URL carry the IAM identity of the caller
+    try:
+        request_context = json.loads(http_request.headers.get('x-amzn-request-context', '{}'))
+        return request_context['authorizer']['iam']['userId']
+    except (ValueError, KeyError, TypeError):
+        return http_request.client.host if http_request.client else 'unknown'
+
+def start_agent(caller):
+    app.running_agents[caller] = app.running_agents.get(caller, 0) + 1
+
+def dispatch_waiting_agents():
+    while app.waiting_agents and sum(app.running_agents.values()) < ADMISSION_MAX_CONCURRENT:
+        # Fair share: the caller with the fewest running agents goes first (the earliest among equals)
+        waiter = min(app.waiting_agents, key=lambda w: app.running_agents.get(w['caller'], 0))
+        app.waiting_agents.remove(waiter)
+        start_agent(waiter['caller'])
+        waiter['future'].set_result(None)
+
+def release_agent(caller, run_seconds):
+    count = app.running_agents.get(caller, 0) - 1
+    if count > 0:
+        app.running_agents[caller] = count
+    else:
+        app.running_agents.pop(caller, None)
+    app.admission_stats['completed'] += 1
+    app.admission_stats['runSeconds'] += run_seconds
+    dispatch_waiting_agents()
+
+def record_admitted(waited):
+    stats = app.admission_stats
+    stats['admitted'] += 1
+    stats['queueSeconds'] += waited
+    stats['maxQueueSeconds'] = max(stats['maxQueueSeconds'], waited)
+
+def estimate_retry_after():
+    stats = app.admission_stats
+    if not stats['completed']:
+        return 1
+    average_run_seconds = stats['runSeconds'] / stats['completed']
+    return max(1, math.ceil(average_run_seconds * (len(app.waiting_agents) + 1) / ADMISSION_MAX_CONCURRENT))
+
+async def admit_agent(caller):
+    # Returns why the request was rejected, or None once it holds a running agent slot
+    running = sum(app.running_agents.values())
+    if ADMISSION_MAX_CONCURRENT <= 0 or (running < ADMISSION_MAX_CONCURRENT and not app.waiting_agents):
+        start_agent(caller)
+        record_admitted(0.0)
+        return None
+
+    if len(app.waiting_agents) >= ADMISSION_QUEUE_SIZE:
+        app.admission_stats['rejectedQueueFull'] += 1
+        return f'The server is overloaded: {running} agents are running and {len(app.waiting_agents)} requests are waiting'
+
+    waiter = {'caller': caller, 'future': asyncio.get_running_loop().create_future()}
+    app.waiting_agents.append(waiter)
+    app.admission_stats['queued'] += 1
+    queued_at = time.perf_counter()
+    try:
+        await asyncio.wait((waiter['future'],), timeout=ADMISSION_QUEUE_TIMEOUT)
+    except asyncio.CancelledError:
+        if waiter['future'].done():
+            release_agent(caller, 0.0)
+        else:
+            app.waiting_agents.remove(waiter)
+        raise
+
+    if not waiter['future'].done():
+        app.waiting_agents.remove(waiter)
+        app.admission_stats['rejectedTimeout'] += 1
+        return f'The server is overloaded: no agent slot became free within {ADMISSION_QUEUE_TIMEOUT:g}s'
+    record_admitted(time.perf_counter() - queued_at)
+    return None
+
+@app.post('/streaming')
+async def streaming(request: StreamingRequest, http_request: Request):
+    usage_bytes = app.workspace_stats['usageBytes']
+    if WORKSPACE_QUOTA_MB > 0 and usage_bytes > WORKSPACE_QUOTA_MB * 1024 * 1024:
+        app.workspace_stats['rejected'] += 1
+        return JSONResponse(
+            status_code=status.HTTP_507_INSUFFICIENT_STORAGE,
+            content={'message': f'Workspace disk usage of {usage_bytes} bytes exceeds the quota of {WORKSPACE_QUOTA_MB} MB'},
+        )
+
+    # Continue the stored history, or have the client send its full history again
+    caller = get_caller(http_request)
+    messages = resolve_history(caller, request)
+    if messages is None:
+        return JSONResponse(
+            status_code=status.HTTP_409_CONFLICT,
+            content={'message': f'History version {request.historyVersion} is not stored, send the full history without a version'},
+        )
+
+    # Wait for a running agent slot, or fail fast when the server is overloaded
+    rejection = await admit_agent(caller)
+    if rejection is not None:
+        logging.warning(f'Rejected request: {rejection}')
+        return JSONResponse(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            content={'message': rejection},
+            headers={'Retry-After': str(estimate_retry_after())},
+        )
+    admitted_at = time.perf_counter()
+    released = False
+
+    # Async, so the background task runs it on the event loop like the admission queue it changes
+    async def release():
+        nonlocal released
+        if not released:
+            released = True
+            release_agent(caller, time.perf_counter() - admitted_at)
+
+    state = 'warm' if app.mcp_tools is not None else 'cold'
+    # With STREAM_EARLY_METADATA, MCP tools are loaded after the first chunk is sent
+    if app.mcp_tools is None and not STREAM_EARLY_METADATA:
+        try:
+            await asyncio.to_thread(ensure_mcp_tools)
+        except BaseException:
+            await release()
+            raise
+
+    async def generate():
+        session_id = create_session_id()
+        current_session_id.set(session_id)
+        workspace_dir = get_workspace_dir(session_id)
 
-        clean_ws_directory()
+        logging.info(f'New session {session_id}')
 
+        app.active_workspaces.add(workspace_dir)
+        setup = None
+        try:
+            setup_started_at = time.perf_counter()
+            setup_timings = {}
+            setup = asyncio.gather(
+                asyncio.to_thread(run_timed, setup_timings, 'mcpTools', ensure_mcp_tools),
+                asyncio.to_thread(run_timed, setup_timings, 'workspace', create_ws_directory, workspace_dir),
+            )
+            if STREAM_EARLY_METADATA:
+                yield metadata_chunk(sessionId=session_id, modelId=request.model.modelId, state=state)
+            await setup
+            setup_timings['total'] = round(time.perf_counter() - setup_started_at, 3)
+            if STREAM_EARLY_METADATA:
+                yield metadata_chunk(setupTimings=setup_timings)
+
+            # The agent is cancelled when the client disconnects
+            async for chunk in stream_with_backpressure(stream_agent(request, messages, workspace_dir, caller), http_request, session_id):
+                yield chunk
+        finally:
+            # The client may disconnect after the first chunk, while MCP tools are loading
+            if setup is not None and not setup.done():
+                setup.cancel()
+            release_ws_directory(workspace_dir)
+            await release()
+
+    # The background task also frees the agent slot when the stream never started
     return StreamingResponse(
         generate(),
         media_type='text/event-stream',
+        background=BackgroundTask(release),
     )
 
 if __name__ == '__main__':
@@ -21,6 +21,11 @@ export type StrandsRequest = {
   prompt: StrandsContentBlock[];
   messages: StrandsMessage[];
   model: Model;
+  // historyVersion of the previous response of the session. The runtime continues
+  // its stored history, so messages only holds what came after it. Rejected with
+  // 409 when that history is not stored, and then sent again without it.
+  // Server-side and opt-in (SESSION_STORE_MEMORY_MB): the web client does not send it.
+  historyVersion?: string;
 };
 
 // Strands format response
@@ -246,6 +251,23 @@ export type StrandsMetadataEvent = {
   usage: StrandsUsage;
 };
 
+// Runtime metadata event (sent by the AgentCore Runtime with STREAM_EARLY_METADATA)
+// The first one is sent before the agent is built, the second one once it is built
+export type AgentCoreRuntimeMetadataEvent = {
+  sessionId?: string;
+  modelId?: string;
+  state?: 'warm' | 'cold';
+  setupTimings?: Record<string, number>;
+  toolSelection?: {
+    total: number;
+    selected: number;
+    fallback: boolean;
+    specTokens: number;
+    specTokensSavedPerCall: number;
+  };
+  historyVersion?: string;
+};
+
 // Exception event base
 export type StrandsExceptionEvent = {
   message: string;
@@ -274,6 +296,7 @@ export type StrandsStreamEvent = {
   metadata?: StrandsMetadataEvent;
   modelStreamErrorException?: StrandsModelStreamErrorEvent;
   redactContent?: StrandsRedactContentEvent;
+  runtimeMetadata?: AgentCoreRuntimeMetadataEvent;
   serviceUnavailableException?: StrandsExceptionEvent;
   throttlingException?: StrandsExceptionEvent;
   validationException?: StrandsExceptionEvent;
@@ -290,6 +313,7 @@ export type StrandsStreamEventType =
   | 'metadata'
   | 'modelStreamErrorException'
   | 'redactContent'
+  | 'runtimeMetadata'
   | 'serviceUnavailableException'
   | 'throttlingException'
   | 'validationException';
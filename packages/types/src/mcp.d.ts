@@ -5,4 +5,9 @@ export type McpRequest = {
   userPrompt: string;
   messages: UnrecordedMessage[];
   model: Model;
+  // historyVersion of the previous response. The server continues its stored history,
+  // so messages only holds what came after it. Rejected with 409 when that history is
+  // not stored, and then sent again without it.
+  // Server-side and opt-in (SESSION_STORE_MEMORY_MB): the web client does not send it.
+  historyVersion?: string;
 };